@@ -25,6 +25,51 @@ class WebApiService implements IDatabaseService {
   // For production: 'https://your-backend.com/api'
   // For network access: 'http://192.168.0.110:5000/api'
 
+  // Tokens from login/signup. The access token is short-lived; the refresh
+  // token gets a new pair when the server answers 401.
+  String? _accessToken;
+  String? _refreshToken;
+
+  Map<String, String> _headers({bool json = false}) => {
+        if (json) 'Content-Type': 'application/json',
+        if (_accessToken != null) 'Authorization': 'Bearer $_accessToken',
+      };
+
+  void _storeTokens(Map<String, dynamic> data) {
+    _accessToken = data['access_token'] as String?;
+    _refreshToken = data['refresh_token'] as String?;
+  }
+
+  Future<bool> _refreshTokens() async {
+    final refreshToken = _refreshToken;
+    if (refreshToken == null) return false;
+    final response = await http.post(
+      Uri.parse('$_baseUrl/auth/refresh'),
+      headers: {'Content-Type': 'application/json'},
+      body: jsonEncode({'refresh_token': refreshToken}),
+    ).timeout(const Duration(seconds: 10));
+    if (response.statusCode == 200) {
+      _storeTokens(jsonDecode(response.body) as Map<String, dynamic>);
+      return true;
+    }
+    // Expired, or the password changed: the user has to sign in again
+    _accessToken = null;
+    _refreshToken = null;
+    return false;
+  }
+
+  /// Sends an authenticated request, refreshing the tokens once on 401
+  Future<http.Response> _authorized(
+    Future<http.Response> Function(Map<String, String> headers) send, {
+    bool json = false,
+  }) async {
+    var response = await send(_headers(json: json)).timeout(const Duration(seconds: 10));
+    if (response.statusCode == 401 && await _refreshTokens()) {
+      response = await send(_headers(json: json)).timeout(const Duration(seconds: 10));
+    }
+    return response;
+  }
+
   // ============================================
   // USER AUTHENTICATION
   // ============================================
@@ -42,6 +87,7 @@ class WebApiService implements IDatabaseService {
 
       if (response.statusCode == 200) {
         final data = jsonDecode(response.body);
+        _storeTokens(data as Map<String, dynamic>);
         return User.fromMap(data['user'] as Map<String, dynamic>);
       } else {
         final errorData = jsonDecode(response.body);
@@ -78,6 +124,7 @@ class WebApiService implements IDatabaseService {
 
       if (response.statusCode == 201 || response.statusCode == 200) {
         final data = jsonDecode(response.body);
+        _storeTokens(data as Map<String, dynamic>);
         return User.fromMap(data['user'] as Map<String, dynamic>);
       } else {
         throw Exception('Failed to create user: ${response.body}');
@@ -90,9 +137,10 @@ class WebApiService implements IDatabaseService {
 
   Future<User?> getUserById(String userId) async {
     try {
-      final response = await http.get(
-        Uri.parse('$_baseUrl/users/$userId'),
-      ).timeout(const Duration(seconds: 10));
+      final response = await _authorized((headers) => http.get(
+            Uri.parse('$_baseUrl/users/$userId'),
+            headers: headers,
+          ));
 
       if (response.statusCode == 200) {
         final data = jsonDecode(response.body);
@@ -148,7 +196,7 @@ class WebApiService implements IDatabaseService {
       if (vendorName != null) queryParams['vendor_name'] = vendorName;
 
       final uri = Uri.parse('$_baseUrl/bills/$userId').replace(queryParameters: queryParams);
-      final response = await http.get(uri).timeout(const Duration(seconds: 10));
+      final response = await _authorized((headers) => http.get(uri, headers: headers));
 
       if (response.statusCode == 200) {
         final data = jsonDecode(response.body);
@@ -176,20 +224,23 @@ class WebApiService implements IDatabaseService {
     String currency = 'USD',
   }) async {
     try {
-      final response = await http.post(
-        Uri.parse('$_baseUrl/bills'),
-        headers: {'Content-Type': 'application/json'},
-        body: jsonEncode({
-          'user_id': userId,
-          'vendor_name': vendorName,
-          'amount': amount,
-          'bill_date': billDate.toIso8601String(),
-          'category_id': categoryId,
-          'description': description,
-          'image_path': imagePath,
-          'currency': currency,
-        }),
-      ).timeout(const Duration(seconds: 10));
+      final response = await _authorized(
+        (headers) => http.post(
+          Uri.parse('$_baseUrl/bills'),
+          headers: headers,
+          body: jsonEncode({
+            'user_id': userId,
+            'vendor_name': vendorName,
+            'amount': amount,
+            'bill_date': billDate.toIso8601String(),
+            'category_id': categoryId,
+            'description': description,
+            'image_path': imagePath,
+            'currency': currency,
+          }),
+        ),
+        json: true,
+      );
 
       if (response.statusCode == 201 || response.statusCode == 200) {
         final data = jsonDecode(response.body);
@@ -212,7 +263,7 @@ class WebApiService implements IDatabaseService {
       final uri = userId != null
           ? Uri.parse('$_baseUrl/categories?user_id=$userId')
           : Uri.parse('$_baseUrl/categories');
-      final response = await http.get(uri).timeout(const Duration(seconds: 10));
+      final response = await _authorized((headers) => http.get(uri, headers: headers));
 
       if (response.statusCode == 200) {
         final data = jsonDecode(response.body);
@@ -234,9 +285,10 @@ class WebApiService implements IDatabaseService {
 
   Future<Map<String, dynamic>?> getUserSettings(String userId) async {
     try {
-      final response = await http.get(
-        Uri.parse('$_baseUrl/settings/$userId'),
-      ).timeout(const Duration(seconds: 10));
+      final response = await _authorized((headers) => http.get(
+            Uri.parse('$_baseUrl/settings/$userId'),
+            headers: headers,
+          ));
 
       if (response.statusCode == 200) {
         final data = jsonDecode(response.body);
@@ -260,18 +312,21 @@ class WebApiService implements IDatabaseService {
     bool? billRemindersEnabled,
   }) async {
     try {
-      final response = await http.put(
-        Uri.parse('$_baseUrl/settings/$userId'),
-        headers: {'Content-Type': 'application/json'},
-        body: jsonEncode({
-          if (currency != null) 'currency': currency,
-          if (appearanceMode != null) 'appearance_mode': appearanceMode,
-          if (defaultCategory != null) 'default_category': defaultCategory,
-          if (pushNotificationsEnabled != null) 'push_notifications_enabled': pushNotificationsEnabled,
-          if (emailNotificationsEnabled != null) 'email_notifications_enabled': emailNotificationsEnabled,
-          if (billRemindersEnabled != null) 'bill_reminders_enabled': billRemindersEnabled,
-        }),
-      ).timeout(const Duration(seconds: 10));
+      final response = await _authorized(
+        (headers) => http.put(
+          Uri.parse('$_baseUrl/settings/$userId'),
+          headers: headers,
+          body: jsonEncode({
+            if (currency != null) 'currency': currency,
+            if (appearanceMode != null) 'appearance_mode': appearanceMode,
+            if (defaultCategory != null) 'default_category': defaultCategory,
+            if (pushNotificationsEnabled != null) 'push_notifications_enabled': pushNotificationsEnabled,
+            if (emailNotificationsEnabled != null) 'email_notifications_enabled': emailNotificationsEnabled,
+            if (billRemindersEnabled != null) 'bill_reminders_enabled': billRemindersEnabled,
+          }),
+        ),
+        json: true,
+      );
 
       return response.statusCode == 200;
     } catch (e) {
@@ -4,25 +4,54 @@ Python Flask REST API for PostgreSQL database access
 Supports web clients (Flutter web) with CORS
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import parse_form_data
 import psycopg2
-from psycopg2.extras import RealDictCursor
-import bcrypt
+from psycopg2.extras import Json, RealDictCursor, execute_values
 import os
+import csv
+import io
+import json
+import math
 from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
 from dotenv import load_dotenv
 import uuid
-import jwt
-from functools import wraps
+import hashlib
 import traceback
 
+import auth
+import cache
+from db_pool import ConnectionPool, POOL_CONFIG
+import events
+import fx
+import images
+import metrics
+import ocr
+from pagination import InvalidCursor, decode_cursor, encode_cursor, page_size
+from passwords import PasswordPoolBusy, hash_password, needs_rehash, password_pool, verify_password
+from ratelimit import RateLimited, client_ip, login_limiter
+import receipt_extraction
+import reminders
+import rollups
+import scheduler
+import serialization
+from serialization import (
+    BILL_FIELDS, CATEGORY_FIELDS, IMAGE_FIELDS, OCR_JOB_FIELDS, SETTINGS_FIELDS, USER_FIELDS, project,
+)
+import sync
+
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# jsonify() encodes UUID/date/Decimal columns itself (orjson when installed)
+app.json = serialization.JSONProvider(app)
+
 # Database configuration
 DB_CONFIG = {
     'host': os.getenv('DB_HOST', '192.168.0.110'),
@@ -32,32 +61,81 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'postgres'),
 }
 
-# JWT Secret (in production, use a secure random key)
-JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key-change-in-production')
+# Maximum number of bills accepted by POST /api/bills/batch
+BATCH_MAX_BILLS = int(os.getenv('BATCH_MAX_BILLS', 500))
 
 
-def get_db_connection():
-    """Get PostgreSQL database connection"""
+
+def _connect():
+    """Open a new PostgreSQL connection (used by the pool)"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
+        return metrics.instrument_connection(psycopg2.connect(**DB_CONFIG))
     except Exception as e:
         print(f"Database connection error: {e}")
         raise
 
 
-def hash_password(password: str) -> str:
-    """Hash password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+db_pool = ConnectionPool(_connect, **POOL_CONFIG)
 
+# Change notifications for GET /api/stream; LISTENs on its own connection
+# (a pooled one would be lost to requests for good)
+event_hub = events.EventHub(lambda: psycopg2.connect(**DB_CONFIG),
+                            max_streams=events.STREAM_CONFIG['max_threads'])
 
-def verify_password(password: str, hashed: str) -> bool:
-    """Verify password against hash"""
-    try:
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
-    except Exception as e:
-        print(f"Password verification error: {e}")
-        return False
+# Request timing and GET /api/metrics
+metrics.init_app(app, db_pool, password_pool)
+
+
+def get_db_connection():
+    """
+    Borrow a pooled PostgreSQL connection.
+
+    Use as a context manager; the connection is returned to the pool (and any
+    uncommitted transaction rolled back) when the block exits:
+
+        with get_db_connection() as conn:
+            ...
+    """
+    return db_pool.connection()
+
+
+# ============================================
+# CONDITIONAL GET HELPERS
+# ============================================
+
+def make_etag(*parts):
+    """Weak ETag value derived from cheap version markers (not from the body)"""
+    digest = hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return digest[:20]
+
+
+def not_modified(etag):
+    """304 response if the client's If-None-Match already has this ETag, else None"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = app.response_class(status=304)
+    return tag_response(response, etag)
+
+
+def tag_response(response, etag):
+    """Attach a weak ETag; clients must revalidate before reusing the body"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def password_busy_response(e):
+    """503 response for when the password worker pool is saturated"""
+    response = jsonify({'error': 'Server is busy, please retry shortly'})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+
+def rate_limited_response(e):
+    """429 response for a login refused by the rate limiter"""
+    response = jsonify({'error': 'Too many login attempts, please retry later'})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
 
 
 # ============================================
@@ -76,65 +154,68 @@ def login():
         if not email_or_username or not password:
             return jsonify({'error': 'Email/username and password are required'}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        # Refuse floods before they cost a query and a bcrypt verification. The
+        # attempt is reserved now and counts as a failure unless it succeeds.
+        login_limiter.check(client_ip(request.remote_addr, request.headers.get('X-Forwarded-For')), email_or_username)
 
-        # Get user by email or username
-        cursor.execute(
-            '''
-            SELECT user_id, email, username, password_hash, full_name, created_at, 
-                   last_login, is_active, email_verified
-            FROM users 
-            WHERE (email = %s OR username = %s) AND is_active = TRUE
-            ''',
-            (email_or_username, email_or_username)
-        )
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Get user by email or username
+            cursor.execute(
+                '''
+                SELECT user_id, email, username, password_hash, full_name, created_at, 
+                       last_login, is_active, email_verified
+                FROM users 
+                WHERE (email = %s OR username = %s) AND is_active = TRUE
+                ''',
+                (email_or_username, email_or_username)
+            )
 
-        user = cursor.fetchone()
+            user = cursor.fetchone()
 
         if not user:
-            cursor.close()
-            conn.close()
             return jsonify({'error': 'Invalid email/username or password'}), 401
 
-        # Verify password
+        # Verify password (on the password pool, without holding a DB connection)
         password_valid = verify_password(password, user['password_hash'])
-        
+
         # Debug logging (remove in production)
         if not password_valid:
             print(f"Password verification failed for: {email_or_username}")
             print(f"Stored hash: {user['password_hash'][:20]}...")
             print(f"Password length: {len(password)}")
-        
+
         if not password_valid:
-            cursor.close()
-            conn.close()
             return jsonify({'error': 'Invalid email/username or password'}), 401
 
-        # Update last login
-        cursor.execute(
-            'UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE user_id = %s',
-            (user['user_id'],)
-        )
-        conn.commit()
-
-        # Return user data (without password hash)
-        user_data = {
-            'user_id': str(user['user_id']),
-            'email': user['email'],
-            'username': user['username'],
-            'full_name': user['full_name'],
-            'created_at': user['created_at'].isoformat() if user['created_at'] else None,
-            'last_login': datetime.now(timezone.utc).isoformat(),
-            'is_active': user['is_active'],
-            'email_verified': user['email_verified'],
-        }
-
-        cursor.close()
-        conn.close()
+        login_limiter.record_success(email_or_username)
+
+        # Upgrade hashes made with a different bcrypt cost while we know the password
+        new_hash = hash_password(password) if needs_rehash(user['password_hash']) else None
+
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            # Update last login
+            if new_hash:
+                cursor.execute(
+                    'UPDATE users SET last_login = CURRENT_TIMESTAMP, password_hash = %s WHERE user_id = %s',
+                    (new_hash, user['user_id'])
+                )
+            else:
+                cursor.execute(
+                    'UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE user_id = %s',
+                    (user['user_id'],)
+                )
+            conn.commit()
 
-        return jsonify({'user': user_data}), 200
+        # Return user data (without password hash) and a token pair
+        user['last_login'] = datetime.now(timezone.utc)
+        tokens = auth.issue_tokens(user['user_id'], new_hash or user['password_hash'])
+        return jsonify({'user': project(user, USER_FIELDS), **tokens}), 200
 
+    except RateLimited as e:
+        return rate_limited_response(e)
+    except PasswordPoolBusy as e:
+        login_limiter.release(email_or_username)
+        return password_busy_response(e)
     except Exception as e:
         print(f"Login error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -143,8 +224,6 @@ def login():
 @app.route('/api/auth/signup', methods=['POST'])
 def signup():
     """User registration endpoint"""
-    conn = None
-    cursor = None
     try:
         data = request.get_json()
         if not data:
@@ -170,135 +249,127 @@ def signup():
         if len(password) < 6:
             return jsonify({'error': 'Password must be at least 6 characters'}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Check if email already exists
-        cursor.execute('SELECT user_id FROM users WHERE email = %s', (email,))
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Email already exists'}), 409
-
         # Validate username (required)
         if len(username) < 3:
-            cursor.close()
-            conn.close()
             return jsonify({'error': 'Username must be at least 3 characters'}), 400
-        
+
         if not username.replace('_', '').isalnum():
-            cursor.close()
-            conn.close()
             return jsonify({'error': 'Username can only contain letters, numbers, and underscores'}), 400
-        
-        # Check if username already exists
-        cursor.execute('SELECT user_id FROM users WHERE username = %s', (username,))
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Username already exists'}), 409
-
-        # Hash password
-        password_hash = hash_password(password)
 
-        # Create user
-        user_id = str(uuid.uuid4())
-        cursor.execute(
-            '''
-            INSERT INTO users (user_id, email, username, password_hash, full_name, email_verified, is_active)
-            VALUES (%s, %s, %s, %s, %s, TRUE, TRUE)
-            RETURNING user_id, email, username, full_name, created_at, is_active, email_verified
-            ''',
-            (user_id, email, username, password_hash, full_name)
-        )
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Check if email already exists
+            cursor.execute('SELECT user_id FROM users WHERE email = %s', (email,))
+            if cursor.fetchone():
+                return jsonify({'error': 'Email already exists'}), 409
 
-        user = cursor.fetchone()
-        
-        if not user:
-            conn.rollback()
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Failed to create user'}), 500
+            # Check if username already exists
+            cursor.execute('SELECT user_id FROM users WHERE username = %s', (username,))
+            if cursor.fetchone():
+                return jsonify({'error': 'Username already exists'}), 409
 
-        # Create default user settings
-        try:
+        # Hash password (on the password pool, without holding a DB connection)
+        password_hash = hash_password(password)
+
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Create user
+            user_id = str(uuid.uuid4())
             cursor.execute(
                 '''
-                INSERT INTO user_settings (user_id, currency, appearance_mode, default_category, push_notifications_enabled)
-                VALUES (%s, 'USD', 'system', 'Uncategorized', TRUE)
-                ON CONFLICT (user_id) DO NOTHING
+                INSERT INTO users (user_id, email, username, password_hash, full_name, email_verified, is_active)
+                VALUES (%s, %s, %s, %s, %s, TRUE, TRUE)
+                RETURNING user_id, email, username, full_name, created_at, is_active, email_verified
                 ''',
-                (user_id,)
+                (user_id, email, username, password_hash, full_name)
             )
-        except Exception as settings_error:
-            print(f"Warning: Failed to create user settings: {settings_error}")
-            traceback.print_exc()
-            # Settings creation failed, but user was created, so commit the user
-            conn.commit()
-            cursor.close()
-            conn.close()
-            # Return user without settings
-            user_data = {
-                'user_id': str(user['user_id']),
-                'email': user['email'],
-                'full_name': user['full_name'],
-                'created_at': user['created_at'].isoformat() if user['created_at'] else None,
-                'is_active': user['is_active'],
-                'email_verified': user['email_verified'],
-            }
-            return jsonify({'user': user_data, 'warning': 'User created but settings could not be initialized'}), 201
 
-        conn.commit()
+            user = cursor.fetchone()
+
+            if not user:
+                return jsonify({'error': 'Failed to create user'}), 500
+
+            # Create default user settings (in a savepoint so a failure keeps the user row)
+            try:
+                cursor.execute('SAVEPOINT user_settings_insert')
+                cursor.execute(
+                    '''
+                    INSERT INTO user_settings (user_id, currency, appearance_mode, default_category, push_notifications_enabled)
+                    VALUES (%s, 'USD', 'system', 'Uncategorized', TRUE)
+                    ON CONFLICT (user_id) DO NOTHING
+                    ''',
+                    (user_id,)
+                )
+            except Exception as settings_error:
+                print(f"Warning: Failed to create user settings: {settings_error}")
+                traceback.print_exc()
+                # Settings creation failed, but user was created, so commit the user
+                cursor.execute('ROLLBACK TO SAVEPOINT user_settings_insert')
+                conn.commit()
+                # Return user without settings
+                return jsonify({
+                    'user': user,
+                    'warning': 'User created but settings could not be initialized',
+                    **auth.issue_tokens(user['user_id'], password_hash),
+                }), 201
 
-        user_data = {
-            'user_id': str(user['user_id']),
-            'email': user['email'],
-            'username': user['username'],
-            'full_name': user['full_name'],
-            'created_at': user['created_at'].isoformat() if user['created_at'] else None,
-            'is_active': user['is_active'],
-            'email_verified': user['email_verified'],
-        }
-
-        cursor.close()
-        conn.close()
+            conn.commit()
 
-        return jsonify({'user': user_data}), 201
+        # RETURNING lists exactly the response fields
+        return jsonify({'user': user, **auth.issue_tokens(user['user_id'], password_hash)}), 201
 
+    except PasswordPoolBusy as e:
+        return password_busy_response(e)
     except psycopg2.IntegrityError as e:
-        if conn:
-            conn.rollback()
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
         print(f"Signup integrity error: {e}")
         error_msg = str(e)
         if 'email' in error_msg.lower() or 'unique' in error_msg.lower():
             return jsonify({'error': 'Email already exists'}), 409
         return jsonify({'error': f'Database constraint error: {error_msg}'}), 400
     except psycopg2.Error as e:
-        if conn:
-            conn.rollback()
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
         print(f"Signup database error: {e}")
         traceback.print_exc()
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
-        if conn:
-            conn.rollback()
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
         print(f"Signup error: {e}")
         traceback.print_exc()
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
 
+def _active_password_hash(user_id):
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            'SELECT password_hash FROM users WHERE user_id = %s AND is_active = TRUE',
+            (user_id,)
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+@app.route('/api/auth/refresh', methods=['POST'])
+def refresh_tokens():
+    """
+    Exchange a refresh token for a new access + refresh token pair
+
+    Body: {"refresh_token": "..."}. Refused (401) once the user is
+    deactivated or has changed their password since the token was issued.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        token = data.get('refresh_token')
+        if not token:
+            return jsonify({'error': 'refresh_token is required'}), 400
+
+        try:
+            user_id, password_hash = auth.authenticator.verify_refresh(token, _active_password_hash)
+        except auth.InvalidToken as e:
+            return auth.unauthorized(str(e), e.reason)
+
+        return jsonify(auth.issue_tokens(user_id, password_hash)), 200
+
+    except Exception as e:
+        print(f"Refresh token error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
 @app.route('/api/auth/forgot-password', methods=['POST'])
 def forgot_password():
     """Create password reset token"""
@@ -309,41 +380,35 @@ def forgot_password():
         if not email:
             return jsonify({'error': 'Email is required'}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Get user
-        cursor.execute(
-            'SELECT user_id, is_active FROM users WHERE email = %s',
-            (email,)
-        )
-        user = cursor.fetchone()
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Get user
+            cursor.execute(
+                'SELECT user_id, is_active FROM users WHERE email = %s',
+                (email,)
+            )
+            user = cursor.fetchone()
 
-        if not user or not user['is_active']:
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Email not found or account is inactive'}), 404
+            if not user or not user['is_active']:
+                return jsonify({'error': 'Email not found or account is inactive'}), 404
 
-        # Generate reset token
-        reset_token = str(uuid.uuid4())
-        expires_at = datetime.now(timezone.utc).replace(hour=23, minute=59, second=59)
+            # Generate reset token
+            reset_token = str(uuid.uuid4())
+            expires_at = datetime.now(timezone.utc).replace(hour=23, minute=59, second=59)
 
-        # Store token
-        cursor.execute(
-            '''
-            INSERT INTO password_reset_tokens (user_id, token, expires_at)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (user_id) DO UPDATE SET
-                token = EXCLUDED.token,
-                expires_at = EXCLUDED.expires_at,
-                created_at = CURRENT_TIMESTAMP
-            ''',
-            (user['user_id'], reset_token, expires_at)
-        )
+            # Store token
+            cursor.execute(
+                '''
+                INSERT INTO password_reset_tokens (user_id, token, expires_at)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    token = EXCLUDED.token,
+                    expires_at = EXCLUDED.expires_at,
+                    created_at = CURRENT_TIMESTAMP
+                ''',
+                (user['user_id'], reset_token, expires_at)
+            )
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+            conn.commit()
 
         # In production, send email with reset link
         # For now, return token (remove in production!)
@@ -372,44 +437,51 @@ def reset_password():
         if len(new_password) < 6:
             return jsonify({'error': 'Password must be at least 6 characters'}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Get token
-        cursor.execute(
-            '''
-            SELECT user_id, expires_at 
-            FROM password_reset_tokens 
-            WHERE token = %s AND expires_at > CURRENT_TIMESTAMP
-            ''',
-            (token,)
-        )
-        token_data = cursor.fetchone()
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Get token
+            cursor.execute(
+                '''
+                SELECT user_id, expires_at 
+                FROM password_reset_tokens 
+                WHERE token = %s AND expires_at > CURRENT_TIMESTAMP
+                ''',
+                (token,)
+            )
+            token_data = cursor.fetchone()
 
         if not token_data:
-            cursor.close()
-            conn.close()
             return jsonify({'error': 'Invalid or expired token'}), 400
 
-        # Update password
+        # Hash password (on the password pool, without holding a DB connection)
         password_hash = hash_password(new_password)
-        cursor.execute(
-            'UPDATE users SET password_hash = %s WHERE user_id = %s',
-            (password_hash, token_data['user_id'])
-        )
 
-        # Delete token
-        cursor.execute(
-            'DELETE FROM password_reset_tokens WHERE token = %s',
-            (token,)
-        )
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Consume the token; if it was used meanwhile, nothing is deleted
+            cursor.execute(
+                '''
+                DELETE FROM password_reset_tokens
+                WHERE token = %s AND expires_at > CURRENT_TIMESTAMP
+                RETURNING user_id
+                ''',
+                (token,)
+            )
+            token_data = cursor.fetchone()
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+            if not token_data:
+                return jsonify({'error': 'Invalid or expired token'}), 400
+
+            # Update password
+            cursor.execute(
+                'UPDATE users SET password_hash = %s WHERE user_id = %s',
+                (password_hash, token_data['user_id'])
+            )
+
+            conn.commit()
 
         return jsonify({'message': 'Password reset successfully'}), 200
 
+    except PasswordPoolBusy as e:
+        return password_busy_response(e)
     except Exception as e:
         print(f"Reset password error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -420,39 +492,34 @@ def reset_password():
 # ============================================
 
 @app.route('/api/users/<user_id>', methods=['GET'])
+@auth.auth_required
 def get_user(user_id):
     """Get user by ID"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-        cursor.execute(
-            '''
-            SELECT user_id, email, full_name, created_at, last_login, is_active, email_verified
-            FROM users 
-            WHERE user_id = %s
-            ''',
-            (user_id,)
-        )
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                '''
+                SELECT user_id, email, full_name, created_at, last_login, is_active, email_verified,
+                       updated_at
+                FROM users 
+                WHERE user_id = %s
+                ''',
+                (user_id,)
+            )
 
-        user = cursor.fetchone()
-        cursor.close()
-        conn.close()
+            user = cursor.fetchone()
 
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
-        user_data = {
-            'user_id': str(user['user_id']),
-            'email': user['email'],
-            'full_name': user['full_name'],
-            'created_at': user['created_at'].isoformat() if user['created_at'] else None,
-            'last_login': user['last_login'].isoformat() if user['last_login'] else None,
-            'is_active': user['is_active'],
-            'email_verified': user['email_verified'],
-        }
+        # updated_at is bumped by trigger on every change to the row
+        etag = make_etag('user', user_id, user['updated_at'], user['last_login'])
+        cached = not_modified(etag)
+        if cached:
+            return cached
 
-        return jsonify({'user': user_data}), 200
+        del user['updated_at']
+        return tag_response(jsonify({'user': user}), etag), 200
 
     except Exception as e:
         print(f"Get user error: {e}")
@@ -463,88 +530,402 @@ def get_user(user_id):
 # BILLS ENDPOINTS
 # ============================================
 
+def bill_filters(args):
+    """SQL conditions (on alias `b`) for the common bill list filters"""
+    query = ''
+    params = []
+
+    if args.get('start_date'):
+        query += ' AND b.bill_date >= %s'
+        params.append(args['start_date'])
+    if args.get('end_date'):
+        query += ' AND b.bill_date <= %s'
+        params.append(args['end_date'])
+    if args.get('category_id'):
+        query += ' AND b.category_id = %s'
+        params.append(args['category_id'])
+    if args.get('vendor_name'):
+        query += ' AND b.vendor_name ILIKE %s'
+        params.append(f"%{args['vendor_name']}%")
+
+    return query, params
+
+
+def display_currency(user_id):
+    """
+    Currency to convert amounts to: ?currency=, else the user's settings
+    (None without either). Raises ValueError for a bad ?currency=. Call
+    before borrowing a connection: settings may need one.
+    """
+    if request.args.get('currency'):
+        return fx.parse_currency(request.args['currency'])
+    entry = cache.get_or_load(cache.settings_key(user_id), lambda: _load_user_settings(user_id))
+    try:
+        return fx.parse_currency(entry['data']['currency']) if entry else None
+    except ValueError:
+        return None
+
+
+def caller_owns_bill(cursor, bill_id):
+    """Whether the bill exists and belongs to the authenticated user"""
+    cursor.execute(
+        'SELECT 1 FROM bills WHERE bill_id = %s AND (%s::uuid IS NULL OR user_id = %s::uuid)',
+        (bill_id, g.user_id, g.user_id)
+    )
+    return cursor.fetchone() is not None
+
+
 @app.route('/api/bills/<user_id>', methods=['GET'])
+@auth.auth_required
 def get_user_bills(user_id):
-    """Get bills for a user"""
+    """
+    Get bills for a user
+
+    Two paging modes are supported:
+    - keyset: pass `cursor` (empty for the first page) and follow `next_cursor`;
+      cost is flat regardless of page depth
+    - offset: legacy `limit`/`offset` paging, kept for backward compatibility
+
+    When exchange rates are loaded, each bill also carries amount_converted:
+    its amount in the user's currency (or ?currency=) at the rate of its
+    bill_date, null if there is no rate.
+    """
     try:
         # Query parameters
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        category_id = request.args.get('category_id')
-        vendor_name = request.args.get('vendor_name')
-        limit = int(request.args.get('limit', 50))
+        limit = page_size(request.args.get('limit'))
         offset = int(request.args.get('offset', 0))
+        page_cursor = request.args.get('cursor')
+
+        try:
+            target = display_currency(user_id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        seek = None
+        if page_cursor:
+            try:
+                seek = decode_cursor(page_cursor, 2)
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
+
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            rates = fx.rate_cache.get(conn) if target else None
+            converting = bool(rates)
+
+            # Version of the user's bills, O(months): the rollup triggers touch
+            # these rows on every insert, update and delete of a bill. Summing
+            # the timestamps (not just MAX) catches a late-committing writer
+            # whose transaction started before the newest one. Read it before
+            # the list so a concurrent write can only make the ETag older
+            # than the body, never newer. The rows carry category names and
+            # colors, so the version of the categories the user can see
+            # (their own and the defaults) is part of it too.
+            cursor.execute(
+                '''
+                SELECT COUNT(*) AS row_count,
+                       COALESCE(SUM(bill_count), 0) AS bill_count,
+                       SUM(EXTRACT(EPOCH FROM updated_at)) AS version,
+                       (SELECT COUNT(*) || ':' || COALESCE(SUM(EXTRACT(EPOCH FROM updated_at)), 0)
+                        FROM categories
+                        WHERE user_id = %s OR user_id IS NULL) AS categories_version
+                FROM bill_monthly_rollups
+                WHERE user_id = %s
+                ''',
+                (user_id, user_id)
+            )
+            version = cursor.fetchone()
+            etag = make_etag(
+                'bills', user_id, version['row_count'], version['bill_count'], version['version'],
+                version['categories_version'],
+                request.query_string.decode('utf-8', 'replace'),
+                target if converting else None, rates.version if converting else None,
+            )
+            cached = not_modified(etag)
+            if cached:
+                return cached
+
+            # Build query
+            query = '''
+                SELECT 
+                    b.bill_id, b.user_id, b.vendor_name, b.amount, b.bill_date,
+                    b.description, b.image_path, b.currency, b.is_paid,
+                    b.created_at, b.updated_at,
+                    c.category_id, c.name as category_name, c.color as category_color,
+                    (SELECT i.image_path FROM bill_images i
+                     WHERE i.bill_id = b.bill_id AND i.image_type = 'thumbnail'
+                     ORDER BY i.created_at DESC LIMIT 1) AS thumbnail_path
+                FROM bills b
+                LEFT JOIN categories c ON b.category_id = c.category_id
+                WHERE b.user_id = %s
+            '''
+            params = [user_id]
+
+            filters, filter_params = bill_filters(request.args)
+            query += filters
+            params.extend(filter_params)
+
+            if seek:
+                # Seek past the last (bill_date, bill_id) seen. The bill_date <= %s
+                # term is an index condition on idx_bills_user_date; bill_id only
+                # breaks ties between bills on the same day.
+                query += ' AND b.bill_date <= %s AND (b.bill_date < %s OR b.bill_id < %s)'
+                params.extend([seek[0], seek[0], seek[1]])
+
+            # bill_id makes the order total, so pages never skip or repeat rows
+            # Fetch one extra row to know whether another page exists
+            query += ' ORDER BY b.bill_date DESC, b.bill_id DESC LIMIT %s'
+            params.append(limit + 1)
+            if page_cursor is None and offset:
+                query += ' OFFSET %s'
+                params.append(offset)
+
+            cursor.execute(query, params)
+            bills = cursor.fetchall()
+
+        next_cursor = None
+        if len(bills) > limit:
+            bills = bills[:limit]
+            last = bills[-1]
+            next_cursor = encode_cursor(last['bill_date'], last['bill_id'])
+
+        result = {'bills': bills, 'next_cursor': next_cursor}
+        if converting:
+            # The whole page in one pass: a rate search per currency, not per bill
+            converted = rates.convert(
+                [bill['amount'] for bill in bills],
+                [bill['currency'] for bill in bills],
+                [bill['bill_date'] for bill in bills],
+                target,
+            )
+            for bill, amount in zip(bills, converted):
+                bill['amount_converted'] = amount
+            result['converted_currency'] = target
 
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        # The SELECT lists exactly the response fields: rows are encoded as they are
+        return tag_response(jsonify(result), etag), 200
 
-        # Build query
-        query = '''
-            SELECT 
+    except Exception as e:
+        print(f"Get bills error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+# Columns written by the bill export, in output order
+EXPORT_COLUMNS = [
+    'bill_id', 'bill_date', 'vendor_name', 'amount', 'currency', 'category_name',
+    'description', 'is_paid', 'due_date', 'payment_date', 'created_at', 'updated_at',
+]
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', 2000))
+
+# Buffered output is flushed to the client once it grows past this many characters
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def _export_value(value):
+    """Plain JSON/CSV value for a database column"""
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def _stream_bill_export(export_format, query, params):
+    """Yield CSV/NDJSON chunks from a server-side cursor (constant memory)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == 'csv' else None
+
+    def flush():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    if writer:
+        writer.writerow(EXPORT_COLUMNS)
+        # Send the header right away so the download starts immediately
+        yield flush()
+
+    with get_db_connection() as conn:
+        # A named cursor is a server-side cursor: rows arrive EXPORT_FETCH_SIZE at a time
+        with conn.cursor(name=f'bill_export_{uuid.uuid4().hex}') as cursor:
+            cursor.itersize = EXPORT_FETCH_SIZE
+            cursor.execute(query, params)
+            for row in cursor:
+                values = [_export_value(v) for v in row]
+                if writer:
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values))))
+                    buffer.write('\n')
+                if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                    yield flush()
+
+    tail = flush()
+    if tail:
+        yield tail
+
+
+@app.route('/api/bills/<user_id>/export', methods=['GET'])
+@auth.auth_required
+def export_user_bills(user_id):
+    """
+    Stream a user's bills as CSV or NDJSON (?format=csv|ndjson).
+
+    Accepts the same filters as GET /api/bills/<user_id>. Rows are read
+    through a server-side cursor and written as they arrive, so memory use
+    does not grow with the number of bills. Each export is recorded in
+    export_history.
+    """
+    try:
+        export_format = request.args.get('format', 'csv').lower()
+        if export_format not in ('csv', 'ndjson'):
+            return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+        filters, filter_params = bill_filters(request.args)
+        query = f'''
+            SELECT b.bill_id, b.bill_date, b.vendor_name, b.amount, b.currency,
+                   c.name AS category_name, b.description, b.is_paid,
+                   b.due_date, b.payment_date, b.created_at, b.updated_at
+            FROM bills b
+            LEFT JOIN categories c ON b.category_id = c.category_id
+            WHERE b.user_id = %s {filters}
+            ORDER BY b.bill_date DESC, b.bill_id DESC
+        '''
+        params = [user_id] + filter_params
+
+        applied = {
+            key: request.args[key]
+            for key in ('start_date', 'end_date', 'category_id', 'vendor_name')
+            if request.args.get(key)
+        }
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                '''
+                INSERT INTO export_history (user_id, export_type, date_range_start, date_range_end, filters_applied)
+                VALUES (%s, %s, %s, %s, %s)
+                ''',
+                (user_id, export_format, applied.get('start_date'), applied.get('end_date'), Json(applied))
+            )
+            conn.commit()
+
+        if export_format == 'csv':
+            mimetype, extension = 'text/csv', 'csv'
+        else:
+            mimetype, extension = 'application/x-ndjson', 'ndjson'
+
+        response = Response(
+            stream_with_context(_stream_bill_export(export_format, query, params)),
+            mimetype=mimetype,
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename="bills.{extension}"'
+        response.headers['X-Accel-Buffering'] = 'no'  # let reverse proxies pass chunks through
+        return response
+
+    except Exception as e:
+        print(f"Export bills error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+# tsquery parser per search mode: web = quotes/OR/-negation syntax, plain = all words
+SEARCH_PARSERS = {
+    'web': 'websearch_to_tsquery',
+    'plain': 'plainto_tsquery',
+}
+
+# ts_headline options for result snippets
+SEARCH_HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxWords=25, MinWords=10, MaxFragments=2'
+
+
+@app.route('/api/bills/<user_id>/search', methods=['GET'])
+@auth.auth_required
+def search_user_bills(user_id):
+    """
+    Full-text search over the OCR text of a user's bills.
+
+    Matches through the GIN index idx_bills_ocr_text_search (the WHERE clause
+    repeats its expression and partial predicate so the planner can use it),
+    ranks with ts_rank and pages by keyset on (rank, bill_id). Snippets with
+    <mark>-highlighted terms are only built for the rows on the page.
+    """
+    try:
+        q = (request.args.get('q') or '').strip()
+        if not q:
+            return jsonify({'error': 'q is required'}), 400
+
+        parser = SEARCH_PARSERS.get(request.args.get('mode', 'web'))
+        if not parser:
+            return jsonify({'error': 'mode must be web or plain'}), 400
+
+        limit = page_size(request.args.get('limit'), default=20)
+        seek = None
+        if request.args.get('cursor'):
+            try:
+                seek = decode_cursor(request.args['cursor'], 2)
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
+
+        tsquery = f"{parser}('english', %s)"
+        query = f'''
+            WITH matches AS (
+                SELECT b.bill_id,
+                       ts_rank(to_tsvector('english', b.ocr_text), {tsquery}) AS rank
+                FROM bills b
+                WHERE b.user_id = %s
+                  AND b.ocr_text IS NOT NULL AND b.ocr_text != ''
+                  AND to_tsvector('english', b.ocr_text) @@ {tsquery}
+            ),
+            page AS (
+                SELECT bill_id, rank
+                FROM matches
+                {'WHERE rank < %s::real OR (rank = %s::real AND bill_id < %s::uuid)' if seek else ''}
+                ORDER BY rank DESC, bill_id DESC
+                LIMIT %s
+            )
+            SELECT
                 b.bill_id, b.user_id, b.vendor_name, b.amount, b.bill_date,
                 b.description, b.image_path, b.currency, b.is_paid,
                 b.created_at, b.updated_at,
-                c.category_id, c.name as category_name, c.color as category_color
-            FROM bills b
+                c.category_id, c.name AS category_name, c.color AS category_color,
+                p.rank,
+                ts_headline('english', b.ocr_text, {tsquery}, %s) AS snippet
+            FROM page p
+            JOIN bills b ON b.bill_id = p.bill_id
             LEFT JOIN categories c ON b.category_id = c.category_id
-            WHERE b.user_id = %s
+            ORDER BY p.rank DESC, p.bill_id DESC
         '''
-        params = [user_id]
+        params = [q, user_id, q]
+        if seek:
+            params.extend([seek[0], seek[0], seek[1]])
+        params.extend([limit + 1, q, SEARCH_HEADLINE_OPTIONS])
 
-        if start_date:
-            query += ' AND b.bill_date >= %s'
-            params.append(start_date)
-        if end_date:
-            query += ' AND b.bill_date <= %s'
-            params.append(end_date)
-        if category_id:
-            query += ' AND b.category_id = %s'
-            params.append(category_id)
-        if vendor_name:
-            query += ' AND b.vendor_name ILIKE %s'
-            params.append(f'%{vendor_name}%')
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
 
-        query += ' ORDER BY b.bill_date DESC LIMIT %s OFFSET %s'
-        params.extend([limit, offset])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(repr(rows[-1]['rank']), rows[-1]['bill_id'])
 
-        cursor.execute(query, params)
-        bills = cursor.fetchall()
-
-        bills_list = []
-        for bill in bills:
-            bills_list.append({
-                'bill_id': str(bill['bill_id']),
-                'user_id': str(bill['user_id']),
-                'vendor_name': bill['vendor_name'],
-                'amount': float(bill['amount']),
-                'bill_date': bill['bill_date'].isoformat() if bill['bill_date'] else None,
-                'category_id': str(bill['category_id']) if bill['category_id'] else None,
-                'category_name': bill['category_name'],
-                'category_color': bill['category_color'],
-                'description': bill['description'],
-                'image_path': bill['image_path'],
-                'currency': bill['currency'],
-                'is_paid': bill['is_paid'],
-                'created_at': bill['created_at'].isoformat() if bill['created_at'] else None,
-                'updated_at': bill['updated_at'].isoformat() if bill['updated_at'] else None,
-            })
-
-        cursor.close()
-        conn.close()
-
-        return jsonify({'bills': bills_list}), 200
+        # Rows are the bill fields plus rank and snippet
+        return jsonify({'results': rows, 'next_cursor': next_cursor}), 200
 
     except Exception as e:
-        print(f"Get bills error: {e}")
+        print(f"Search bills error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
 
 @app.route('/api/bills', methods=['POST'])
+@auth.auth_required
 def create_bill():
     """Create a new bill"""
     try:
         data = request.get_json()
-        user_id = data.get('user_id')
+        user_id = data.get('user_id') or g.user_id
         vendor_name = data.get('vendor_name')
         amount = data.get('amount')
         bill_date = data.get('bill_date')
@@ -555,122 +936,856 @@ def create_bill():
 
         if not user_id or not vendor_name or not amount or not bill_date:
             return jsonify({'error': 'Missing required fields'}), 400
+        if not auth.is_caller(user_id):
+            return auth.forbidden()
+
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            bill_id = str(uuid.uuid4())
+            bill_date_obj = datetime.fromisoformat(bill_date.replace('Z', '+00:00'))
+
+            # Category name/color come back with the new row, already in response shape
+            cursor.execute(
+                '''
+                WITH inserted AS (
+                    INSERT INTO bills (bill_id, user_id, vendor_name, amount, bill_date,
+                                       category_id, description, image_path, currency, is_paid)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, FALSE)
+                    RETURNING bill_id, user_id, vendor_name, amount, bill_date,
+                              category_id, description, image_path, currency, is_paid,
+                              created_at, updated_at
+                )
+                SELECT i.bill_id, i.user_id, i.vendor_name, i.amount, i.bill_date,
+                       i.category_id, c.name AS category_name, c.color AS category_color,
+                       i.description, i.image_path, i.currency, i.is_paid,
+                       i.created_at, i.updated_at
+                FROM inserted i
+                LEFT JOIN categories c ON c.category_id = i.category_id
+                ''',
+                (bill_id, user_id, vendor_name, amount, bill_date_obj, category_id,
+                 description, image_path, currency)
+            )
+
+            bill = cursor.fetchone()
+            conn.commit()
+
+        return jsonify({'bill': bill}), 201
+
+    except Exception as e:
+        print(f"Create bill error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+def _validate_batch_item(item):
+    """Normalize one bill from a batch upload; returns (values, error)"""
+    if not isinstance(item, dict):
+        return None, 'Bill must be an object'
+
+    vendor_name = item.get('vendor_name')
+    amount = item.get('amount')
+    bill_date = item.get('bill_date')
+    if not vendor_name or amount in (None, '') or not bill_date:
+        return None, 'Missing required fields'
+
+    try:
+        amount = Decimal(str(amount))
+    except InvalidOperation:
+        return None, 'Invalid amount'
+    if not amount.is_finite() or abs(amount) >= Decimal('1e8'):
+        return None, 'Invalid amount'
+
+    try:
+        bill_date = datetime.fromisoformat(str(bill_date).replace('Z', '+00:00')).date()
+    except ValueError:
+        return None, 'Invalid bill_date'
+
+    category_id = item.get('category_id')
+    if category_id:
+        try:
+            category_id = str(uuid.UUID(str(category_id)))
+        except ValueError:
+            return None, 'Invalid category_id'
+
+    client_id = item.get('client_id')
+    if client_id is not None:
+        client_id = str(client_id)
+        if not client_id or len(client_id) > 64:
+            return None, 'client_id must be 1-64 characters'
+
+    return {
+        'client_id': client_id,
+        'vendor_name': vendor_name,
+        'amount': amount,
+        'bill_date': bill_date,
+        'category_id': category_id or None,
+        'description': item.get('description'),
+        'image_path': item.get('image_path'),
+        'currency': item.get('currency') or 'USD',
+    }, None
+
+
+@app.route('/api/bills/batch', methods=['POST'])
+@auth.auth_required
+def create_bills_batch():
+    """
+    Create many bills in one transaction (offline sync).
+
+    Body: {"user_id": ..., "bills": [{"client_id": ..., "vendor_name": ..., ...}]}
+
+    Bills carrying a `client_id` that was already stored for this user are
+    reported as duplicates instead of being inserted again, so clients can
+    safely retry a whole batch. Results are returned per item, in input order.
+    """
+    try:
+        data = request.get_json()
+        user_id = (data.get('user_id') if data else None) or g.user_id
+        items = data.get('bills') if data else None
+
+        if not user_id or not isinstance(items, list) or not items:
+            return jsonify({'error': 'user_id and a non-empty bills array are required'}), 400
+        if len(items) > BATCH_MAX_BILLS:
+            return jsonify({'error': f'At most {BATCH_MAX_BILLS} bills per batch'}), 413
+        if not auth.is_caller(user_id):
+            return auth.forbidden()
+
+        results = [None] * len(items)
+        pending = []  # (index, values)
+        first_by_client_id = {}
+
+        for index, item in enumerate(items):
+            values, error = _validate_batch_item(item)
+            if error:
+                results[index] = {'index': index, 'status': 'error', 'error': error}
+                continue
+            client_id = values['client_id']
+            if client_id is not None and client_id in first_by_client_id:
+                # Repeated within this batch: resolved to the first occurrence below
+                results[index] = {'index': index, 'client_id': client_id, 'status': 'duplicate'}
+                continue
+            if client_id is not None:
+                first_by_client_id[client_id] = index
+            pending.append((index, values))
+
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Resolve category metadata for the whole batch in one query
+            category_ids = list({v['category_id'] for _, v in pending if v['category_id']})
+            categories = {}
+            if category_ids:
+                cursor.execute(
+                    '''
+                    SELECT category_id, name, color
+                    FROM categories
+                    WHERE category_id = ANY(%s::uuid[]) AND (user_id = %s OR is_default = TRUE)
+                    ''',
+                    (category_ids, user_id)
+                )
+                categories = {str(c['category_id']): c for c in cursor.fetchall()}
+
+            rows = []
+            for index, values in pending:
+                if values['category_id'] and values['category_id'] not in categories:
+                    results[index] = {
+                        'index': index, 'client_id': values['client_id'],
+                        'status': 'error', 'error': 'Unknown category_id',
+                    }
+                    continue
+                values['bill_id'] = str(uuid.uuid4())
+                values['index'] = index
+                rows.append(values)
+
+            # Multi-row insert; bills whose client_id already exists are skipped
+            inserted = []
+            if rows:
+                inserted = execute_values(
+                    cursor,
+                    '''
+                    INSERT INTO bills (bill_id, user_id, vendor_name, amount, bill_date,
+                                       category_id, description, image_path, currency,
+                                       client_bill_id, is_paid)
+                    VALUES %s
+                    ON CONFLICT (user_id, client_bill_id) WHERE client_bill_id IS NOT NULL
+                    DO NOTHING
+                    RETURNING bill_id, user_id, vendor_name, amount, bill_date,
+                              category_id, description, image_path, currency, is_paid,
+                              client_bill_id, created_at, updated_at
+                    ''',
+                    [
+                        (r['bill_id'], user_id, r['vendor_name'], r['amount'], r['bill_date'],
+                         r['category_id'], r['description'], r['image_path'], r['currency'],
+                         r['client_id'])
+                        for r in rows
+                    ],
+                    template='(%s::uuid, %s::uuid, %s, %s, %s, %s::uuid, %s, %s, %s, %s, FALSE)',
+                    page_size=len(rows),
+                    fetch=True,
+                )
+            inserted_ids = {str(bill['bill_id']): bill for bill in inserted}
+
+            # Bills skipped by ON CONFLICT: return what is already stored
+            existing = {}
+            skipped_client_ids = [
+                r['client_id'] for r in rows
+                if r['bill_id'] not in inserted_ids and r['client_id'] is not None
+            ]
+            if skipped_client_ids:
+                cursor.execute(
+                    '''
+                    SELECT b.bill_id, b.user_id, b.vendor_name, b.amount, b.bill_date,
+                           b.category_id, b.description, b.image_path, b.currency, b.is_paid,
+                           b.client_bill_id, b.created_at, b.updated_at,
+                           c.name AS category_name, c.color AS category_color
+                    FROM bills b
+                    LEFT JOIN categories c ON b.category_id = c.category_id
+                    WHERE b.user_id = %s AND b.client_bill_id = ANY(%s)
+                    ''',
+                    (user_id, skipped_client_ids)
+                )
+                existing = {bill['client_bill_id']: bill for bill in cursor.fetchall()}
 
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+            conn.commit()
 
-        bill_id = str(uuid.uuid4())
-        bill_date_obj = datetime.fromisoformat(bill_date.replace('Z', '+00:00'))
+        for r in rows:
+            bill = inserted_ids.get(r['bill_id'])
+            status = 'created'
+            if bill is not None:
+                category = categories.get(r['category_id']) or {}
+                bill['category_name'] = category.get('name')
+                bill['category_color'] = category.get('color')
+            else:
+                bill = existing.get(r['client_id'])
+                status = 'duplicate'
+            result = {'index': r['index'], 'client_id': r['client_id'], 'status': status}
+            if bill is not None:
+                result['bill'] = project(bill, BILL_FIELDS)
+            results[r['index']] = result
+
+        # Repeats inside the batch share the outcome of their first occurrence
+        for index, result in enumerate(results):
+            if result['status'] == 'duplicate' and 'bill' not in result and result.get('client_id'):
+                first = results[first_by_client_id[result['client_id']]]
+                if 'bill' in first:
+                    result['bill'] = first['bill']
+
+        summary = {status: 0 for status in ('created', 'duplicate', 'error')}
+        for result in results:
+            summary[result['status']] += 1
+
+        return jsonify({'results': results, 'summary': summary}), 200
+
+    except Exception as e:
+        print(f"Create bills batch error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
 
+
+# ============================================
+# BILL IMAGE ENDPOINTS
+# ============================================
+
+def _generate_derived_images(image_id, bill_id, image_path):
+    """Background job: build the processed image and thumbnail for an upload"""
+    derived = images.derive(
+        images.image_store, image_path,
+        images.image_workers.processed_size, images.image_workers.thumbnail_size,
+    )
+
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        width, height = derived['original']
         cursor.execute(
+            'UPDATE bill_images SET width = %s, height = %s WHERE image_id = %s',
+            (width, height, image_id)
+        )
+        execute_values(
+            cursor,
             '''
-            INSERT INTO bills (bill_id, user_id, vendor_name, amount, bill_date, 
-                             category_id, description, image_path, currency, is_paid)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, FALSE)
-            RETURNING bill_id, user_id, vendor_name, amount, bill_date, 
-                     category_id, description, image_path, currency, is_paid,
-                     created_at, updated_at
+            INSERT INTO bill_images (bill_id, image_path, image_type, file_size, width, height)
+            VALUES %s
             ''',
-            (bill_id, user_id, vendor_name, amount, bill_date_obj, category_id, 
-             description, image_path, currency)
+            [
+                (bill_id, derived[t]['image_path'], t, derived[t]['file_size'],
+                 derived[t]['width'], derived[t]['height'])
+                for t in ('processed', 'thumbnail')
+            ]
         )
+        # Touch the bill so ETags and delta sync pick up the new thumbnail
+        cursor.execute('UPDATE bills SET updated_at = CURRENT_TIMESTAMP WHERE bill_id = %s', (bill_id,))
+        conn.commit()
+
+
+@app.route('/api/bills/<bill_id>/images', methods=['POST'])
+@auth.auth_required
+def upload_bill_image(bill_id):
+    """
+    Upload a scan for a bill (multipart/form-data, file field `image`)
+
+    The file is streamed to content-addressed storage as it arrives and
+    becomes the bill's image_path. The normalized image and thumbnail are
+    generated in the background: the response is 202 and they appear in
+    GET /api/bills/<bill_id>/images (and as thumbnail_path in bill lists)
+    once ready. OCR is queued in the same transaction as the image row
+    (see GET /api/bills/<bill_id>/ocr).
+    """
+    try:
+        if request.mimetype != 'multipart/form-data':
+            return jsonify({'error': 'Expected multipart/form-data with an image field'}), 400
+
+        # Check the bill before accepting any bytes
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            if not caller_owns_bill(cursor, bill_id):
+                return jsonify({'error': 'Bill not found'}), 404
+
+        uploads = []
+        upload = None
 
-        bill = cursor.fetchone()
+        def stream_factory(total_content_length, content_type, filename, content_length=None):
+            upload = images.image_store.upload_file()
+            uploads.append(upload)
+            return upload
 
-        # Get category info if exists
-        category_name = None
-        category_color = None
-        if category_id:
+        try:
+            _, _, files = parse_form_data(
+                request.environ,
+                stream_factory=stream_factory,
+                max_content_length=images.image_store.max_bytes + 64 * 1024,
+            )
+            upload = files['image'].stream if 'image' in files else None
+            if upload is None:
+                return jsonify({'error': 'Missing image field'}), 400
+            stored = images.image_store.commit(upload)
+        except (images.ImageTooLarge, RequestEntityTooLarge):
+            return jsonify({'error': 'Image too large'}), 413
+        except images.UnsupportedImage as e:
+            return jsonify({'error': str(e)}), 415
+        finally:
+            # Anything not moved into storage (extra fields, failed uploads)
+            for other in uploads:
+                if other is not upload:
+                    other.discard()
+
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                '''
+                INSERT INTO bill_images (bill_id, image_path, image_type, file_size)
+                VALUES (%s, %s, 'original', %s)
+                RETURNING image_id, bill_id, image_path, image_type, file_size, width, height, created_at
+                ''',
+                (bill_id, stored['image_path'], stored['file_size'])
+            )
+            image = cursor.fetchone()
             cursor.execute(
-                'SELECT name, color FROM categories WHERE category_id = %s',
-                (category_id,)
+                'UPDATE bills SET image_path = %s WHERE bill_id = %s',
+                (stored['image_path'], bill_id)
             )
-            cat = cursor.fetchone()
-            if cat:
-                category_name = cat['name']
-                category_color = cat['color']
+            # Durable: the OCR job commits with the image row or not at all
+            job_id = ocr.enqueue(cursor, bill_id, image['image_id'], stored['image_path'])
+            conn.commit()
 
-        conn.commit()
+        images.image_workers.submit(_generate_derived_images, image['image_id'], bill_id, stored['image_path'])
 
-        bill_data = {
-            'bill_id': str(bill['bill_id']),
-            'user_id': str(bill['user_id']),
-            'vendor_name': bill['vendor_name'],
-            'amount': float(bill['amount']),
-            'bill_date': bill['bill_date'].isoformat() if bill['bill_date'] else None,
-            'category_id': str(bill['category_id']) if bill['category_id'] else None,
-            'category_name': category_name,
-            'category_color': category_color,
-            'description': bill['description'],
-            'image_path': bill['image_path'],
-            'currency': bill['currency'],
-            'is_paid': bill['is_paid'],
-            'created_at': bill['created_at'].isoformat() if bill['created_at'] else None,
-            'updated_at': bill['updated_at'].isoformat() if bill['updated_at'] else None,
-        }
+        return jsonify({
+            'image': project(image, IMAGE_FIELDS),
+            'sha256': stored['sha256'],
+            'ocr_job_id': job_id,
+            'status': 'processing',
+        }), 202
+
+    except Exception as e:
+        print(f"Upload image error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
 
-        cursor.close()
-        conn.close()
 
-        return jsonify({'bill': bill_data}), 201
+@app.route('/api/bills/<bill_id>/images', methods=['GET'])
+@auth.auth_required
+def get_bill_images(bill_id):
+    """List a bill's stored images (original, processed, thumbnail), newest first"""
+    try:
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            if not caller_owns_bill(cursor, bill_id):
+                return jsonify({'error': 'Bill not found'}), 404
+            cursor.execute(
+                '''
+                SELECT image_id, bill_id, image_path, image_type, file_size, width, height, created_at
+                FROM bill_images
+                WHERE bill_id = %s
+                ORDER BY created_at DESC
+                ''',
+                (bill_id,)
+            )
+            rows = cursor.fetchall()
+
+        return jsonify({'images': rows}), 200
 
     except Exception as e:
-        print(f"Create bill error: {e}")
+        print(f"Get images error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
 
+@app.route('/api/images/<path:image_path>', methods=['GET'])
+def get_image(image_path):
+    """Serve a stored image; paths are content hashes, so they never change"""
+    try:
+        path = images.image_store.absolute(image_path)
+    except ValueError:
+        return jsonify({'error': 'Image not found'}), 404
+    if not os.path.exists(path):
+        return jsonify({'error': 'Image not found'}), 404
+
+    response = send_file(path, max_age=31536000, conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 # ============================================
-# CATEGORIES ENDPOINTS
+# OCR ENDPOINTS
 # ============================================
 
-@app.route('/api/categories', methods=['GET'])
-def get_categories():
-    """Get categories"""
+@app.route('/api/bills/<bill_id>/ocr', methods=['GET'])
+@auth.auth_required
+def get_bill_ocr(bill_id):
+    """Status and timings of the latest OCR job for a bill"""
     try:
-        user_id = request.args.get('user_id')
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            if not caller_owns_bill(cursor, bill_id):
+                return jsonify({'error': 'Bill not found'}), 404
+            job = ocr.latest_job(cursor, bill_id)
 
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        if not job:
+            return jsonify({'error': 'No OCR job for this bill'}), 404
 
-        if user_id:
-            # Get user-specific and default categories
+        return jsonify({'job': project(job, OCR_JOB_FIELDS)}), 200
+
+    except Exception as e:
+        print(f"Get OCR job error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@app.route('/api/bills/<bill_id>/ocr', methods=['POST'])
+@auth.auth_required
+def requeue_bill_ocr(bill_id):
+    """Queue OCR again for the bill's most recent original image"""
+    try:
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            if not caller_owns_bill(cursor, bill_id):
+                return jsonify({'error': 'Bill not found'}), 404
             cursor.execute(
                 '''
-                SELECT category_id, name, color, icon, is_default, created_at
-                FROM categories
-                WHERE user_id = %s OR is_default = TRUE
-                ORDER BY is_default DESC, name ASC
+                SELECT image_id, image_path FROM bill_images
+                WHERE bill_id = %s AND image_type = 'original'
+                ORDER BY created_at DESC
+                LIMIT 1
                 ''',
-                (user_id,)
+                (bill_id,)
             )
+            image = cursor.fetchone()
+            if not image:
+                return jsonify({'error': 'Bill has no uploaded image'}), 404
+
+            job_id = ocr.enqueue(cursor, bill_id, image['image_id'], image['image_path'])
+            conn.commit()
+
+        return jsonify({'ocr_job_id': job_id, 'status': 'queued'}), 202
+
+    except Exception as e:
+        print(f"Requeue OCR error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@app.route('/api/ocr/extract', methods=['POST'])
+@auth.auth_required
+def extract_receipt_fields():
+    """
+    Suggest vendor_name, amount, bill_date and currency from receipt text
+    (e.g. on-device OCR output), each with a confidence from 0 to 1
+
+    Body: {"text": "...", "date_order": "auto|dmy|mdy", "currency": "USD"}
+    """
+    data = request.get_json(silent=True) or {}
+    text = data.get('text')
+    date_order = data.get('date_order', 'auto')
+
+    if not isinstance(text, str) or not text.strip():
+        return jsonify({'error': 'text is required'}), 400
+    if date_order not in ('auto', 'dmy', 'mdy'):
+        return jsonify({'error': 'date_order must be auto, dmy or mdy'}), 400
+
+    fields = receipt_extraction.extract(text, date_order=date_order, default_currency=data.get('currency'))
+    return jsonify({'fields': fields}), 200
+
+
+@app.route('/api/ocr/status', methods=['GET'])
+def get_ocr_status():
+    """
+    OCR queue status
+
+    Query params:
+    - window: minutes of finished jobs to summarize (default 60)
+    """
+    try:
+        window = max(1, min(int(request.args.get('window', 60)), 7 * 24 * 60))
+    except ValueError:
+        return jsonify({'error': 'window must be a number of minutes'}), 400
+
+    try:
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            status = ocr.queue_status(cursor, window)
+
+        return jsonify({'ocr': status}), 200
+
+    except Exception as e:
+        print(f"OCR status error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+# ============================================
+# ANALYTICS ENDPOINTS
+# ============================================
+
+# GROUPING(category_id, vendor_name, month) bitmask -> result section
+# (a set bit means that column is rolled up in the row)
+ANALYTICS_SECTIONS = {
+    0b111: 'totals',
+    0b011: 'by_category',
+    0b101: 'by_vendor',
+    0b110: 'by_month',
+}
+
+# Grouping sets that are also split by month, for currency conversion
+MONTH_CELL_SECTIONS = {
+    0b010: 'by_category',
+    0b100: 'by_vendor',
+    0b110: 'by_month',
+}
+
+
+def _analytics_entry(currency, total, count):
+    return {
+        'currency': currency,
+        'total': float(total),
+        'count': count,
+        'average': round(float(total) / count, 2) if count else 0.0,
+    }
+
+
+def _month_cell(section, row, currency, total, count):
+    """
+    (section, key, fields, currency, month, total, count): one month's
+    spend in one currency, the unit that _convert_analytics converts
+    """
+    if section == 'by_category':
+        key = row['category_id']
+        fields = {
+            'category_id': str(key) if key else None,
+            'category_name': row['category_name'] or 'Uncategorized',
+            'category_color': row['category_color'],
+        }
+    elif section == 'by_vendor':
+        key = row['vendor_name']
+        fields = {'vendor_name': key}
+    else:
+        key = row['month']
+        fields = {'month': key.strftime('%Y-%m')}
+    return section, key, fields, currency, row['month'], total, count
+
+
+def _convert_analytics(cells, rates, target):
+    """
+    Breakdowns in `target` from month cells: each month's total in a
+    currency is converted at that month's average rate, then summed across
+    currencies. Cells in currencies without rates are left out and listed.
+    """
+    factors = rates.monthly_factors(
+        [cell[3] for cell in cells], [cell[4] for cell in cells], target
+    )
+
+    sums = {}
+    unconverted = set()
+    for (section, key, fields, currency, _, total, count), factor in zip(cells, factors):
+        if math.isnan(factor):
+            unconverted.add(fx.bill_currency(currency))
+            continue
+        keys = [(section, key)]
+        if section == 'by_month':
+            keys.append(('totals', None))
+        for bucket in keys:
+            acc = sums.setdefault(bucket, [0.0, 0, fields])
+            acc[0] += float(total) * factor
+            acc[1] += count
+
+    converted = {'currency': target, 'totals': [], 'by_category': [], 'by_vendor': [], 'by_month': []}
+    for (section, _), (total, count, fields) in sums.items():
+        entry = _analytics_entry(target, round(total, 2), count)
+        if section != 'totals':
+            entry.update(fields)
+        converted[section].append(entry)
+    converted['unconverted_currencies'] = sorted(unconverted)
+    return converted
+
+
+def _sort_analytics(analytics, top_vendors):
+    analytics['totals'].sort(key=lambda e: e['total'], reverse=True)
+    analytics['by_category'].sort(key=lambda e: e['total'], reverse=True)
+    analytics['by_vendor'].sort(key=lambda e: e['total'], reverse=True)
+    analytics['by_vendor'] = analytics['by_vendor'][:max(top_vendors, 0)]
+    analytics['by_month'].sort(key=lambda e: (e['month'], e['currency']))
+
+
+def _analytics_from_bills(cursor, user_id, start_date, end_date, month_cells=False):
+    """
+    All four breakdowns in one grouped pass over the user's bills, and with
+    month_cells, the month cells for conversion. Returns (analytics, cells).
+    """
+    query = '''
+        SELECT
+            GROUPING(b.category_id, b.vendor_name, date_trunc('month', b.bill_date)) AS grouping_id,
+            COALESCE(b.currency, 'USD') AS currency,
+            b.category_id, c.name AS category_name, c.color AS category_color,
+            b.vendor_name,
+            date_trunc('month', b.bill_date)::date AS month,
+            SUM(b.amount) AS total,
+            COUNT(*) AS count
+        FROM bills b
+        LEFT JOIN categories c ON b.category_id = c.category_id
+        WHERE b.user_id = %s
+    '''
+    params = [user_id]
+
+    if start_date:
+        query += ' AND b.bill_date >= %s'
+        params.append(start_date)
+    if end_date:
+        query += ' AND b.bill_date <= %s'
+        params.append(end_date)
+
+    query += '''
+        GROUP BY GROUPING SETS (
+            (COALESCE(b.currency, 'USD')),
+            (COALESCE(b.currency, 'USD'), b.category_id, c.name, c.color),
+            (COALESCE(b.currency, 'USD'), b.vendor_name),
+            (COALESCE(b.currency, 'USD'), date_trunc('month', b.bill_date))
+    '''
+    if month_cells:
+        query += ''',
+            (COALESCE(b.currency, 'USD'), b.category_id, c.name, c.color, date_trunc('month', b.bill_date)),
+            (COALESCE(b.currency, 'USD'), b.vendor_name, date_trunc('month', b.bill_date))
+        '''
+    query += ')'
+
+    cursor.execute(query, params)
+
+    analytics = {section: [] for section in ANALYTICS_SECTIONS.values()}
+    cells = []
+    for row in cursor.fetchall():
+        if month_cells and row['grouping_id'] in MONTH_CELL_SECTIONS:
+            cells.append(_month_cell(
+                MONTH_CELL_SECTIONS[row['grouping_id']], row, row['currency'], row['total'], row['count']
+            ))
+        if row['grouping_id'] not in ANALYTICS_SECTIONS:
+            continue
+        section = ANALYTICS_SECTIONS[row['grouping_id']]
+        entry = _analytics_entry(row['currency'], row['total'], row['count'])
+        if section == 'by_category':
+            entry['category_id'] = str(row['category_id']) if row['category_id'] else None
+            entry['category_name'] = row['category_name'] or 'Uncategorized'
+            entry['category_color'] = row['category_color']
+        elif section == 'by_vendor':
+            entry['vendor_name'] = row['vendor_name']
+        elif section == 'by_month':
+            entry['month'] = row['month'].strftime('%Y-%m')
+        analytics[section].append(entry)
+    return analytics, cells
+
+
+def _analytics_from_rollups(cursor, user_id, first_month, last_month, start_date, end_date, top_vendors,
+                            month_cells=False):
+    """
+    Totals, categories and months from bill_monthly_rollups (O(months)),
+    and with month_cells, the month cells for conversion. Returns (analytics, cells).
+    """
+    totals = {}
+    by_category = {}
+    by_month = {}
+    cells = []
+    for row in rollups.fetch(cursor, user_id, first_month, last_month):
+        currency = row['currency']
+        if month_cells:
+            for section in ('by_category', 'by_month'):
+                cells.append(_month_cell(section, row, currency, row['total_amount'], row['bill_count']))
+        category_key = (row['category_id'], currency)
+        month_key = (row['month'], currency)
+
+        for bucket, key in ((totals, currency), (by_category, category_key), (by_month, month_key)):
+            acc = bucket.setdefault(key, [0, 0, row])
+            acc[0] += row['total_amount']
+            acc[1] += row['bill_count']
+
+    analytics = {'totals': [], 'by_category': [], 'by_vendor': [], 'by_month': []}
+    for currency, (total, count, _) in totals.items():
+        analytics['totals'].append(_analytics_entry(currency, total, count))
+    for (category_id, currency), (total, count, row) in by_category.items():
+        entry = _analytics_entry(currency, total, count)
+        entry['category_id'] = str(category_id) if category_id else None
+        entry['category_name'] = row['category_name'] or 'Uncategorized'
+        entry['category_color'] = row['category_color']
+        analytics['by_category'].append(entry)
+    for (month, currency), (total, count, _) in by_month.items():
+        entry = _analytics_entry(currency, total, count)
+        entry['month'] = month.strftime('%Y-%m')
+        analytics['by_month'].append(entry)
+
+    # Vendors are not rolled up, so only scan bills when they are asked for
+    if top_vendors > 0:
+        query = f'''
+            SELECT COALESCE(currency, 'USD') AS currency, vendor_name,
+                   {"date_trunc('month', bill_date)::date" if month_cells else 'NULL'} AS month,
+                   SUM(amount) AS total, COUNT(*) AS count
+            FROM bills
+            WHERE user_id = %s
+        '''
+        params = [user_id]
+        if start_date:
+            query += ' AND bill_date >= %s'
+            params.append(start_date)
+        if end_date:
+            query += ' AND bill_date <= %s'
+            params.append(end_date)
+        if month_cells:
+            # Every vendor-month is needed for conversion; the top list is cut afterwards
+            query += ' GROUP BY 1, 2, 3'
         else:
-            # Get all default categories
-            cursor.execute(
-                '''
-                SELECT category_id, name, color, icon, is_default, created_at
-                FROM categories
-                WHERE is_default = TRUE
-                ORDER BY name ASC
-                '''
-            )
+            query += ' GROUP BY 1, 2, 3 ORDER BY total DESC LIMIT %s'
+            params.append(top_vendors)
+        cursor.execute(query, params)
 
+        by_vendor = {}
+        for row in cursor.fetchall():
+            if month_cells:
+                cells.append(_month_cell('by_vendor', row, row['currency'], row['total'], row['count']))
+            acc = by_vendor.setdefault((row['currency'], row['vendor_name']), [0, 0])
+            acc[0] += row['total']
+            acc[1] += row['count']
+        for (currency, vendor_name), (total, count) in by_vendor.items():
+            entry = _analytics_entry(currency, total, count)
+            entry['vendor_name'] = vendor_name
+            analytics['by_vendor'].append(entry)
+
+    return analytics, cells
+
+
+@app.route('/api/analytics/<user_id>', methods=['GET'])
+@auth.auth_required
+def get_spending_analytics(user_id):
+    """
+    Spending summary for a user: totals, counts and averages per category,
+    vendor and month over an optional date range.
+
+    Ranges made of whole months (or no range) are answered from the
+    bill_monthly_rollups table; pass top_vendors=0 to skip the vendor
+    breakdown, which is the only part that still reads bills. Other ranges
+    fall back to a single grouped pass over bills.
+    Amounts are never summed across currencies; every row carries its
+    currency. When exchange rates are loaded, `converted` repeats the
+    breakdowns in the user's currency (or ?currency=), converting each
+    month at its average rate.
+    """
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        top_vendors = int(request.args.get('top_vendors', 10))
+
+        try:
+            months = rollups.month_range(start_date, end_date)
+        except ValueError:
+            return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+        try:
+            target = display_currency(user_id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            rates = fx.rate_cache.get(conn) if target else None
+            if months is not None:
+                analytics, cells = _analytics_from_rollups(
+                    cursor, user_id, months[0], months[1], start_date, end_date, top_vendors,
+                    month_cells=bool(rates),
+                )
+            else:
+                analytics, cells = _analytics_from_bills(
+                    cursor, user_id, start_date, end_date, month_cells=bool(rates)
+                )
+
+        _sort_analytics(analytics, top_vendors)
+        if rates:
+            # All cells in one batch: a rate search per currency, not per cell
+            converted = _convert_analytics(cells, rates, target)
+            _sort_analytics(converted, top_vendors)
+            analytics['converted'] = converted
+
+        analytics['start_date'] = start_date
+        analytics['end_date'] = end_date
+
+        return jsonify({'analytics': analytics}), 200
+
+    except Exception as e:
+        print(f"Get analytics error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+# ============================================
+# CATEGORIES ENDPOINTS
+# ============================================
+
+def _load_categories(where, params=()):
+    """Fetch categories matching a WHERE clause, sorted by name"""
+    with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute(
+            f'''
+            SELECT {', '.join(CATEGORY_FIELDS)}
+            FROM categories
+            WHERE {where}
+            ORDER BY name ASC
+            ''',
+            params
+        )
         categories = cursor.fetchall()
 
-        categories_list = []
-        for cat in categories:
-            categories_list.append({
-                'category_id': str(cat['category_id']),
-                'name': cat['name'],
-                'color': cat['color'],
-                'icon': cat['icon'],
-                'is_default': cat['is_default'],
-                'created_at': cat['created_at'].isoformat() if cat['created_at'] else None,
-            })
+    return cache.versioned(categories)
+
+
+@app.route('/api/categories', methods=['GET'])
+@auth.auth_required
+def get_categories():
+    """
+    Get categories
+
+    Default and per-user categories are cached separately, so a change to
+    one user's categories never evicts the shared defaults. Any code that
+    writes categories must call cache.invalidate_categories().
+    """
+    try:
+        user_id = request.args.get('user_id')
+        if user_id and not auth.is_caller(user_id):
+            return auth.forbidden()
+
+        # Get all default categories
+        defaults = cache.get_or_load(
+            cache.default_categories_key(),
+            lambda: _load_categories('is_default = TRUE'),
+        )
+        categories_list = defaults['data']
+        etag = make_etag('categories', defaults['etag'])
+
+        if user_id:
+            # Defaults first, then the user's own categories (both by name)
+            own = cache.get_or_load(
+                cache.user_categories_key(user_id),
+                lambda: _load_categories('user_id = %s AND is_default IS NOT TRUE', (user_id,)),
+            )
+            categories_list = categories_list + own['data']
+            etag = make_etag('categories', defaults['etag'], own['etag'])
 
-        cursor.close()
-        conn.close()
+        cached = not_modified(etag)
+        if cached:
+            return cached
 
-        return jsonify({'categories': categories_list}), 200
+        return tag_response(jsonify({'categories': categories_list}), etag), 200
 
     except Exception as e:
         print(f"Get categories error: {e}")
@@ -681,41 +1796,41 @@ def get_categories():
 # USER SETTINGS ENDPOINTS
 # ============================================
 
-@app.route('/api/settings/<user_id>', methods=['GET'])
-def get_user_settings(user_id):
-    """Get user settings"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
+def _load_user_settings(user_id):
+    """Fetch a user's settings, or None if they have none"""
+    with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
         cursor.execute(
-            '''
-            SELECT currency, appearance_mode, default_category,
-                   push_notifications_enabled, email_notifications_enabled,
-                   bill_reminders_enabled
-            FROM user_settings
-            WHERE user_id = %s
-            ''',
+            f"SELECT {', '.join(SETTINGS_FIELDS)} FROM user_settings WHERE user_id = %s",
             (user_id,)
         )
 
         settings = cursor.fetchone()
-        cursor.close()
-        conn.close()
 
-        if not settings:
+    if not settings:
+        return None
+
+    return cache.versioned(settings)
+
+
+@app.route('/api/settings/<user_id>', methods=['GET'])
+@auth.auth_required
+def get_user_settings(user_id):
+    """Get user settings (cached; invalidated by update_user_settings)"""
+    try:
+        entry = cache.get_or_load(
+            cache.settings_key(user_id),
+            lambda: _load_user_settings(user_id),
+        )
+
+        if not entry:
             return jsonify({'error': 'Settings not found'}), 404
 
-        settings_data = {
-            'currency': settings['currency'],
-            'appearance_mode': settings['appearance_mode'],
-            'default_category': settings['default_category'],
-            'push_notifications_enabled': settings['push_notifications_enabled'],
-            'email_notifications_enabled': settings['email_notifications_enabled'],
-            'bill_reminders_enabled': settings['bill_reminders_enabled'],
-        }
+        etag = make_etag('settings', user_id, entry['etag'])
+        cached = not_modified(etag)
+        if cached:
+            return cached
 
-        return jsonify({'settings': settings_data}), 200
+        return tag_response(jsonify({'settings': entry['data']}), etag), 200
 
     except Exception as e:
         print(f"Get settings error: {e}")
@@ -723,55 +1838,51 @@ def get_user_settings(user_id):
 
 
 @app.route('/api/settings/<user_id>', methods=['PUT'])
+@auth.auth_required
 def update_user_settings(user_id):
     """Update user settings"""
     try:
         data = request.get_json()
 
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Build update query dynamically
-        updates = []
-        params = []
-
-        if 'currency' in data:
-            updates.append('currency = %s')
-            params.append(data['currency'])
-        if 'appearance_mode' in data:
-            updates.append('appearance_mode = %s')
-            params.append(data['appearance_mode'])
-        if 'default_category' in data:
-            updates.append('default_category = %s')
-            params.append(data['default_category'])
-        if 'push_notifications_enabled' in data:
-            updates.append('push_notifications_enabled = %s')
-            params.append(data['push_notifications_enabled'])
-        if 'email_notifications_enabled' in data:
-            updates.append('email_notifications_enabled = %s')
-            params.append(data['email_notifications_enabled'])
-        if 'bill_reminders_enabled' in data:
-            updates.append('bill_reminders_enabled = %s')
-            params.append(data['bill_reminders_enabled'])
-
-        if not updates:
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'No fields to update'}), 400
-
-        params.append(user_id)
-
-        query = f'''
-            UPDATE user_settings
-            SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP
-            WHERE user_id = %s
-        '''
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Build update query dynamically
+            updates = []
+            params = []
+
+            if 'currency' in data:
+                updates.append('currency = %s')
+                params.append(data['currency'])
+            if 'appearance_mode' in data:
+                updates.append('appearance_mode = %s')
+                params.append(data['appearance_mode'])
+            if 'default_category' in data:
+                updates.append('default_category = %s')
+                params.append(data['default_category'])
+            if 'push_notifications_enabled' in data:
+                updates.append('push_notifications_enabled = %s')
+                params.append(data['push_notifications_enabled'])
+            if 'email_notifications_enabled' in data:
+                updates.append('email_notifications_enabled = %s')
+                params.append(data['email_notifications_enabled'])
+            if 'bill_reminders_enabled' in data:
+                updates.append('bill_reminders_enabled = %s')
+                params.append(data['bill_reminders_enabled'])
+
+            if not updates:
+                return jsonify({'error': 'No fields to update'}), 400
+
+            params.append(user_id)
+
+            query = f'''
+                UPDATE user_settings
+                SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = %s
+            '''
 
-        cursor.execute(query, params)
-        conn.commit()
+            cursor.execute(query, params)
+            conn.commit()
 
-        cursor.close()
-        conn.close()
+        cache.invalidate_settings(user_id)
 
         return jsonify({'message': 'Settings updated successfully'}), 200
 
@@ -780,6 +1891,215 @@ def update_user_settings(user_id):
         return jsonify({'error': 'Internal server error'}), 500
 
 
+# ============================================
+# NOTIFICATION ENDPOINTS
+# ============================================
+
+@app.route('/api/notifications/<user_id>', methods=['GET'])
+@auth.auth_required
+def get_notifications(user_id):
+    """
+    Notifications for a user, newest first, with the unread count
+
+    Keyset paging: pass `cursor` from the previous page's `next_cursor`.
+    `unread=1` lists only unread notifications.
+    """
+    try:
+        limit = page_size(request.args.get('limit'))
+        unread_only = request.args.get('unread') in ('1', 'true')
+
+        seek = None
+        if request.args.get('cursor'):
+            try:
+                seek = decode_cursor(request.args['cursor'], 2)
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
+
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            query = '''
+                SELECT notification_id, title, message, type, is_read, related_bill_id, created_at
+                FROM notifications
+                WHERE user_id = %s
+            '''
+            params = [user_id]
+            if unread_only:
+                query += ' AND is_read = FALSE'
+            if seek:
+                # Same seek as bills: created_at is the index condition on
+                # idx_notifications_user_created, notification_id breaks ties
+                query += ' AND created_at <= %s AND (created_at < %s OR notification_id < %s)'
+                params.extend([seek[0], seek[0], seek[1]])
+            query += ' ORDER BY created_at DESC, notification_id DESC LIMIT %s'
+            params.append(limit + 1)
+            cursor.execute(query, params)
+            notifications = cursor.fetchall()
+
+            # Index-only count on idx_notifications_is_read (user_id, is_read)
+            cursor.execute(
+                'SELECT COUNT(*) AS unread FROM notifications WHERE user_id = %s AND is_read = FALSE',
+                (user_id,)
+            )
+            unread = cursor.fetchone()['unread']
+
+        next_cursor = None
+        if len(notifications) > limit:
+            notifications = notifications[:limit]
+            last = notifications[-1]
+            next_cursor = encode_cursor(last['created_at'], last['notification_id'])
+
+        return jsonify({
+            'notifications': notifications,
+            'unread_count': unread,
+            'next_cursor': next_cursor,
+        }), 200
+
+    except Exception as e:
+        print(f"Get notifications error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@app.route('/api/notifications/<user_id>/read', methods=['POST'])
+@auth.auth_required
+def mark_notifications_read(user_id):
+    """Mark notifications read: the given `notification_ids`, or all of them"""
+    try:
+        data = request.get_json(silent=True) or {}
+        notification_ids = data.get('notification_ids')
+        if notification_ids is not None and not isinstance(notification_ids, list):
+            return jsonify({'error': 'notification_ids must be a list'}), 400
+
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            query = 'UPDATE notifications SET is_read = TRUE WHERE user_id = %s AND is_read = FALSE'
+            params = [user_id]
+            if notification_ids is not None:
+                query += ' AND notification_id = ANY(%s::uuid[])'
+                params.append([str(n) for n in notification_ids])
+            cursor.execute(query, params)
+            updated = cursor.rowcount
+            conn.commit()
+
+        return jsonify({'updated': updated}), 200
+
+    except psycopg2.DataError:
+        return jsonify({'error': 'Invalid notification id'}), 400
+    except Exception as e:
+        print(f"Mark notifications read error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+# ============================================
+# SYNC ENDPOINTS
+# ============================================
+
+@app.route('/api/sync/<user_id>', methods=['GET'])
+@auth.auth_required
+def sync_changes(user_id):
+    """
+    Changes since the last sync
+
+    Query params:
+    - since: next_since from the previous response (omit for a full sync)
+    - limit: maximum bills per response (default 500)
+
+    Returns bills, categories and settings written since the token, plus
+    ids deleted since then. When has_more is true, call again with
+    next_since straight away. A full sync (no token, or one older than the
+    tombstone retention) sets full_sync: the client should replace its
+    local copy rather than merge. Apply everything as upserts: a row may
+    be sent twice.
+    """
+    try:
+        try:
+            since, resume = sync.decode_token(request.args.get('since'))
+            limit = page_size(request.args.get('limit'), default=500)
+        except (InvalidCursor, ValueError):
+            return jsonify({'error': 'Invalid since token or limit'}), 400
+
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            if resume:
+                # Continuing a delta that did not fit in one response
+                mark, after = resume[0], resume[1:]
+            else:
+                mark, horizon = sync.watermark(cursor)
+                if since and since < horizon:
+                    # Tombstones this old are purged: deletions may be lost
+                    since = None
+                after = None
+
+            rows = sync.changed_bills(cursor, user_id, since, after, limit)
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+
+            result = {
+                'bills': [project(row, BILL_FIELDS) for row in rows],
+                'full_sync': since is None and resume is None,
+                'has_more': has_more,
+            }
+
+            # Categories, settings and deletions are small: first page only
+            if resume is None:
+                result['categories'] = sync.changed_categories(cursor, user_id, since)
+                settings = sync.changed_settings(cursor, user_id, since)
+                result['settings'] = settings
+                result['deleted'] = (
+                    sync.tombstones(cursor, user_id, since) if since
+                    else {'bills': [], 'categories': []}
+                )
+
+        if has_more:
+            last = rows[-1]
+            result['next_since'] = sync.encode_token(since, (mark, last['updated_at'], last['bill_id']))
+        else:
+            # Resume from the watermark taken before the first page was read
+            result['next_since'] = sync.encode_token(mark)
+
+        return jsonify(result), 200
+
+    except Exception as e:
+        print(f"Sync error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+# ============================================
+# STREAM ENDPOINTS
+# ============================================
+
+@app.route('/api/stream/<user_id>', methods=['GET'])
+@auth.auth_required
+def stream_changes(user_id):
+    """
+    Server-Sent Events for changes to the user's bills, notifications and
+    settings
+
+    Each event is named after its table; data is
+    {"table", "op", "user_id", "count", "ids"} (ids is null for more than
+    20 rows). A `resync` event means events were lost: call GET /api/sync.
+    Call it too after (re)connecting, for changes made while disconnected.
+    The token is only checked when the stream opens.
+    """
+    if not events.STREAM_CONFIG['enabled']:
+        return jsonify({'error': 'Streaming is disabled'}), 404
+    try:
+        subscription = event_hub.subscribe(user_id)
+    except events.StreamLimit as e:
+        # Each stream holds a request thread here; the rest are for requests
+        response = jsonify({'error': 'Too many open streams, please retry later'})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+
+    def generate():
+        try:
+            yield from event_hub.stream(subscription)
+        finally:
+            # Runs when the client goes away (the next write fails)
+            event_hub.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx: pass events through unbuffered
+    })
+
+
 # ============================================
 # HEALTH CHECK
 # ============================================
@@ -788,12 +2108,21 @@ def update_user_settings(user_id):
 def health_check():
     """Health check endpoint"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT 1')
-        cursor.close()
-        conn.close()
-        return jsonify({'status': 'healthy', 'database': 'connected'}), 200
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return jsonify({
+            'status': 'healthy',
+            'database': 'connected',
+            'pool': db_pool.stats(),
+            'passwords': password_pool.stats(),
+            'cache': cache.stats(),
+            'images': images.image_workers.stats(),
+            'auth': auth.authenticator.stats(),
+            'ratelimit': login_limiter.stats(),
+            'jobs': scheduler.stats(),
+            'events': event_hub.stats(),
+            'fx': fx.rate_cache.stats(),
+        }), 200
     except Exception as e:
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
 
@@ -806,6 +2135,12 @@ if __name__ == '__main__':
     print("Starting server on http://localhost:5000")
     print("API Base URL: http://localhost:5000/api")
     print("=" * 50)
-    
-    app.run(host='0.0.0.0', port=5000, debug=True)
+
+    debug = True
+    # Recurring bills and reminders; under Gunicorn, gunicorn.conf.py starts them.
+    # The debug reloader runs this module twice, in a watcher process and in
+    # the serving child (WERKZEUG_RUN_MAIN=true): start them in the child only.
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        scheduler.start_all(db_pool)
+    app.run(host='0.0.0.0', port=5000, debug=debug)
 
@@ -0,0 +1,933 @@
+"""
+Bill Scanner App - Backend API Server (async version)
+ASGI variant of app.py on Starlette + asyncpg, for high client concurrency:
+a request waiting on PostgreSQL holds a coroutine, not a thread.
+
+Serves the routes the mobile app uses (auth, users, bills list/create,
+categories, settings, change stream, health) with the same request and
+response shapes as app.py; check with `python contract_check.py --base-url ...`. Exports,
+search, batch upload, images, OCR, analytics and sync are only in app.py.
+
+Run with:
+    uvicorn app_async:app --host 0.0.0.0 --port 5000 --workers 4
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
+from decimal import Decimal, InvalidOperation
+from functools import wraps
+
+import asyncpg
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse as _JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import auth
+import cache
+from db_pool import POOL_CONFIG
+import events
+import fx
+from pagination import InvalidCursor, decode_cursor, encode_cursor, page_size
+from passwords import PasswordPoolBusy, hash_password, needs_rehash, password_pool, verify_password
+from ratelimit import RateLimited, client_ip, login_limiter
+import serialization
+from serialization import BILL_FIELDS, CATEGORY_FIELDS, SETTINGS_FIELDS, project
+
+# Load environment variables
+load_dotenv()
+
+# Database configuration
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', '192.168.0.110'),
+    'port': int(os.getenv('DB_PORT', 5432)),
+    'database': os.getenv('DB_NAME', 'bill_scanner_db'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', 'postgres'),
+}
+
+db_pool = None
+
+# Change notifications for GET /api/stream, fed by _listen_for_changes()
+event_hub = events.EventHub(subscription=events.AsyncSubscription)
+
+
+async def _init_connection(conn):
+    # Match psycopg2, which hands json/jsonb columns back already decoded
+    for name in ('json', 'jsonb'):
+        await conn.set_type_codec(name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+async def _listen_for_changes():
+    """LISTEN on a connection of its own, reconnecting (with a resync) when it drops"""
+    backoff = 1
+    lost = False
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(**DB_CONFIG)
+            closed = asyncio.Event()
+            conn.add_termination_listener(lambda _conn: closed.set())
+            await conn.add_listener(events.CHANNEL, lambda _conn, _pid, _channel, payload: event_hub.dispatch(payload))
+            event_hub.set_listening(True)
+            if lost:
+                event_hub.resync_all()
+            backoff = 1
+            while not closed.is_set():
+                try:
+                    await asyncio.wait_for(closed.wait(), event_hub.heartbeat)
+                except asyncio.TimeoutError:
+                    # A dead TCP connection can stay silent for ever; make it fail
+                    await conn.fetchval('SELECT 1')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Change events listener error: {e}")
+        finally:
+            event_hub.set_listening(False)
+            lost = True
+            if conn is not None and not conn.is_closed():
+                conn.terminate()
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, 30)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Open the connection pool and change listener in the serving process, close them on shutdown"""
+    global db_pool
+    # uvicorn --workers defaults to WEB_CONCURRENCY
+    cache.require_shared(int(os.getenv('WEB_CONCURRENCY', 1)))
+    db_pool = await asyncpg.create_pool(
+        **DB_CONFIG,
+        min_size=POOL_CONFIG['min_size'],
+        max_size=POOL_CONFIG['max_size'],
+        max_inactive_connection_lifetime=POOL_CONFIG['max_idle'],
+        init=_init_connection,
+    )
+    listener = asyncio.create_task(_listen_for_changes()) if events.STREAM_CONFIG['enabled'] else None
+    try:
+        yield
+    finally:
+        if listener is not None:
+            listener.cancel()
+            try:
+                await listener
+            except asyncio.CancelledError:
+                pass
+        await db_pool.close()
+
+
+def acquire():
+    """Borrow a pooled connection: `async with acquire() as conn:`"""
+    return db_pool.acquire(timeout=POOL_CONFIG['timeout'])
+
+
+class JSONResponse(_JSONResponse):
+    """JSONResponse encoded by serialization.dumps (orjson when installed), like app.py"""
+
+    def render(self, content):
+        return serialization.dumps(content)
+
+
+def error(message, status):
+    return JSONResponse({'error': message}, status_code=status)
+
+
+def password_busy_response(e):
+    """503 response for when the password worker pool is saturated"""
+    return JSONResponse({'error': 'Server is busy, please retry shortly'}, status_code=503,
+                        headers={'Retry-After': str(e.retry_after)})
+
+
+def rate_limited_response(e):
+    """429 response for a login refused by the rate limiter"""
+    return JSONResponse({'error': 'Too many login attempts, please retry later'}, status_code=429,
+                        headers={'Retry-After': str(e.retry_after)})
+
+
+async def json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def iso(value):
+    return value.isoformat() if value else None
+
+
+def auth_required(handler):
+    """auth.auth_required for Starlette handlers; sets request.state.user_id"""
+    @wraps(handler)
+    async def wrapper(request):
+        try:
+            request.state.user_id = auth.authenticate(request.headers.get('Authorization'))
+        except auth.InvalidToken as e:
+            return JSONResponse({'error': str(e)}, status_code=401,
+                                headers={'WWW-Authenticate': 'Bearer error="invalid_token"'})
+        owner = request.path_params.get('user_id')
+        if owner is not None and not auth.same_user(request.state.user_id, owner):
+            return error('Not allowed for this user', 403)
+        return await handler(request)
+
+    return wrapper
+
+
+# ============================================
+# CONDITIONAL GET HELPERS
+# ============================================
+
+def make_etag(*parts):
+    """Weak ETag value derived from cheap version markers (same as app.py)"""
+    digest = hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return digest[:20]
+
+
+def not_modified(request, etag):
+    """304 response if the client's If-None-Match already has this ETag, else None"""
+    header = request.headers.get('if-none-match', '')
+    tags = {tag.strip().removeprefix('W/').strip('"') for tag in header.split(',')}
+    if etag not in tags and '*' not in tags:
+        return None
+    return tag_response(Response(status_code=304), etag)
+
+
+def tag_response(response, etag):
+    response.headers['ETag'] = f'W/"{etag}"'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# ============================================
+# AUTHENTICATION ENDPOINTS
+# ============================================
+
+async def login(request):
+    """User login endpoint (accepts email or username)"""
+    try:
+        data = await json_body(request)
+        if not data:
+            return error('Request body is required', 400)
+
+        email_or_username = (data.get('email_or_username') or data.get('email') or '').strip()
+        password = data.get('password') or ''
+
+        if not email_or_username or not password:
+            return error('Email/username and password are required', 400)
+
+        # Refuse floods before they cost a query and a bcrypt verification. The
+        # attempt is reserved now and counts as a failure unless it succeeds.
+        remote_addr = request.client.host if request.client else None
+        login_limiter.check(client_ip(remote_addr, request.headers.get('x-forwarded-for')), email_or_username)
+
+        async with acquire() as conn:
+            user = await conn.fetchrow(
+                '''
+                SELECT user_id, email, username, password_hash, full_name, created_at,
+                       last_login, is_active, email_verified
+                FROM users
+                WHERE (email = $1 OR username = $1) AND is_active = TRUE
+                ''',
+                email_or_username
+            )
+
+        if not user:
+            return error('Invalid email/username or password', 401)
+
+        # bcrypt runs on the password process pool; wait for it off the event loop
+        if not await asyncio.to_thread(verify_password, password, user['password_hash']):
+            return error('Invalid email/username or password', 401)
+
+        login_limiter.record_success(email_or_username)
+
+        new_hash = None
+        if needs_rehash(user['password_hash']):
+            new_hash = await asyncio.to_thread(hash_password, password)
+
+        async with acquire() as conn:
+            if new_hash:
+                await conn.execute(
+                    'UPDATE users SET last_login = CURRENT_TIMESTAMP, password_hash = $1 WHERE user_id = $2',
+                    new_hash, user['user_id']
+                )
+            else:
+                await conn.execute(
+                    'UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE user_id = $1',
+                    user['user_id']
+                )
+
+        return JSONResponse({'user': {
+            'user_id': str(user['user_id']),
+            'email': user['email'],
+            'username': user['username'],
+            'full_name': user['full_name'],
+            'created_at': iso(user['created_at']),
+            'last_login': datetime.now(timezone.utc).isoformat(),
+            'is_active': user['is_active'],
+            'email_verified': user['email_verified'],
+        }, **auth.issue_tokens(user['user_id'], new_hash or user['password_hash'])})
+
+    except RateLimited as e:
+        return rate_limited_response(e)
+    except PasswordPoolBusy as e:
+        login_limiter.release(email_or_username)
+        return password_busy_response(e)
+    except Exception as e:
+        print(f"Login error: {e}")
+        return error('Internal server error', 500)
+
+
+async def signup(request):
+    """User registration endpoint"""
+    try:
+        data = await json_body(request)
+        if not data:
+            return error('Request body is required', 400)
+
+        email = (data.get('email') or '').strip()
+        password = data.get('password') or ''
+        username = (data.get('username') or '').strip() or None
+        full_name = (data.get('full_name') or '').strip() or None
+
+        if not email or not password:
+            return error('Email and password are required', 400)
+        if not username:
+            return error('Username is required', 400)
+        if not full_name:
+            return error('Full name is required', 400)
+        if len(password) < 6:
+            return error('Password must be at least 6 characters', 400)
+        if len(username) < 3:
+            return error('Username must be at least 3 characters', 400)
+        if not username.replace('_', '').isalnum():
+            return error('Username can only contain letters, numbers, and underscores', 400)
+
+        async with acquire() as conn:
+            if await conn.fetchval('SELECT 1 FROM users WHERE email = $1', email):
+                return error('Email already exists', 409)
+            if await conn.fetchval('SELECT 1 FROM users WHERE username = $1', username):
+                return error('Username already exists', 409)
+
+        password_hash = await asyncio.to_thread(hash_password, password)
+
+        async with acquire() as conn:
+            async with conn.transaction():
+                user = await conn.fetchrow(
+                    '''
+                    INSERT INTO users (user_id, email, username, password_hash, full_name, email_verified, is_active)
+                    VALUES ($1, $2, $3, $4, $5, TRUE, TRUE)
+                    RETURNING user_id, email, username, full_name, created_at, is_active, email_verified
+                    ''',
+                    uuid.uuid4(), email, username, password_hash, full_name
+                )
+                await conn.execute(
+                    '''
+                    INSERT INTO user_settings (user_id, currency, appearance_mode, default_category, push_notifications_enabled)
+                    VALUES ($1, 'USD', 'system', 'Uncategorized', TRUE)
+                    ON CONFLICT (user_id) DO NOTHING
+                    ''',
+                    user['user_id']
+                )
+
+        return JSONResponse({'user': {
+            'user_id': str(user['user_id']),
+            'email': user['email'],
+            'username': user['username'],
+            'full_name': user['full_name'],
+            'created_at': iso(user['created_at']),
+            'is_active': user['is_active'],
+            'email_verified': user['email_verified'],
+        }, **auth.issue_tokens(user['user_id'], password_hash)}, status_code=201)
+
+    except PasswordPoolBusy as e:
+        return password_busy_response(e)
+    except asyncpg.UniqueViolationError:
+        return error('Email already exists', 409)
+    except Exception as e:
+        print(f"Signup error: {e}")
+        return error(f'Internal server error: {str(e)}', 500)
+
+
+async def refresh_tokens(request):
+    """Exchange a refresh token for a new access + refresh token pair"""
+    try:
+        data = await json_body(request) or {}
+        token = data.get('refresh_token')
+        if not token:
+            return error('refresh_token is required', 400)
+
+        try:
+            claims = auth.authenticator.decode(token, 'refresh')
+            async with acquire() as conn:
+                password_hash = await conn.fetchval(
+                    'SELECT password_hash FROM users WHERE user_id = $1 AND is_active = TRUE',
+                    uuid.UUID(claims['sub'])
+                )
+            user_id, password_hash = auth.authenticator.verify_refresh(token, lambda _: password_hash)
+        except auth.InvalidToken as e:
+            return JSONResponse({'error': str(e)}, status_code=401,
+                                headers={'WWW-Authenticate': 'Bearer error="invalid_token"'})
+
+        return JSONResponse(auth.issue_tokens(user_id, password_hash))
+
+    except Exception as e:
+        print(f"Refresh token error: {e}")
+        return error('Internal server error', 500)
+
+
+async def forgot_password(request):
+    """Create password reset token"""
+    try:
+        data = await json_body(request) or {}
+        email = (data.get('email') or '').strip()
+
+        if not email:
+            return error('Email is required', 400)
+
+        async with acquire() as conn:
+            user = await conn.fetchrow('SELECT user_id, is_active FROM users WHERE email = $1', email)
+            if not user or not user['is_active']:
+                return error('Email not found or account is inactive', 404)
+
+            reset_token = str(uuid.uuid4())
+            expires_at = datetime.now(timezone.utc).replace(hour=23, minute=59, second=59)
+            await conn.execute(
+                '''
+                INSERT INTO password_reset_tokens (user_id, token, expires_at)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    token = EXCLUDED.token,
+                    expires_at = EXCLUDED.expires_at,
+                    created_at = CURRENT_TIMESTAMP
+                ''',
+                user['user_id'], reset_token, expires_at
+            )
+
+        # In production, send email with reset link instead of returning it
+        return JSONResponse({
+            'message': 'Password reset token created',
+            'token': reset_token,  # Remove this in production!
+            'note': 'In production, this token would be sent via email'
+        })
+
+    except Exception as e:
+        print(f"Forgot password error: {e}")
+        return error('Internal server error', 500)
+
+
+async def reset_password(request):
+    """Reset password using token"""
+    try:
+        data = await json_body(request) or {}
+        token = data.get('token', '')
+        new_password = data.get('new_password', '')
+
+        if not token or not new_password:
+            return error('Token and new password are required', 400)
+        if len(new_password) < 6:
+            return error('Password must be at least 6 characters', 400)
+
+        async with acquire() as conn:
+            valid = await conn.fetchval(
+                'SELECT 1 FROM password_reset_tokens WHERE token = $1 AND expires_at > CURRENT_TIMESTAMP',
+                token
+            )
+        if not valid:
+            return error('Invalid or expired token', 400)
+
+        password_hash = await asyncio.to_thread(hash_password, new_password)
+
+        async with acquire() as conn:
+            async with conn.transaction():
+                # Consume the token; if it was used meanwhile, nothing is deleted
+                user_id = await conn.fetchval(
+                    '''
+                    DELETE FROM password_reset_tokens
+                    WHERE token = $1 AND expires_at > CURRENT_TIMESTAMP
+                    RETURNING user_id
+                    ''',
+                    token
+                )
+                if not user_id:
+                    return error('Invalid or expired token', 400)
+                await conn.execute('UPDATE users SET password_hash = $1 WHERE user_id = $2',
+                                   password_hash, user_id)
+
+        return JSONResponse({'message': 'Password reset successfully'})
+
+    except PasswordPoolBusy as e:
+        return password_busy_response(e)
+    except Exception as e:
+        print(f"Reset password error: {e}")
+        return error('Internal server error', 500)
+
+
+# ============================================
+# USER ENDPOINTS
+# ============================================
+
+@auth_required
+async def get_user(request):
+    """Get user by ID"""
+    user_id = request.path_params['user_id']
+    try:
+        async with acquire() as conn:
+            user = await conn.fetchrow(
+                '''
+                SELECT user_id, email, full_name, created_at, last_login, is_active, email_verified,
+                       updated_at
+                FROM users
+                WHERE user_id = $1
+                ''',
+                user_id
+            )
+
+        if not user:
+            return error('User not found', 404)
+
+        etag = make_etag('user', user_id, user['updated_at'], user['last_login'])
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+
+        return tag_response(JSONResponse({'user': {
+            'user_id': str(user['user_id']),
+            'email': user['email'],
+            'full_name': user['full_name'],
+            'created_at': iso(user['created_at']),
+            'last_login': iso(user['last_login']),
+            'is_active': user['is_active'],
+            'email_verified': user['email_verified'],
+        }}), etag)
+
+    except Exception as e:
+        print(f"Get user error: {e}")
+        return error('Internal server error', 500)
+
+
+# ============================================
+# BILLS ENDPOINTS
+# ============================================
+
+def bill_filters(args, params):
+    """SQL conditions (on alias `b`) for the common bill list filters; appends to params"""
+    query = ''
+    if args.get('start_date'):
+        params.append(date.fromisoformat(args['start_date']))
+        query += f' AND b.bill_date >= ${len(params)}'
+    if args.get('end_date'):
+        params.append(date.fromisoformat(args['end_date']))
+        query += f' AND b.bill_date <= ${len(params)}'
+    if args.get('category_id'):
+        params.append(args['category_id'])
+        query += f' AND b.category_id = ${len(params)}'
+    if args.get('vendor_name'):
+        params.append(f"%{args['vendor_name']}%")
+        query += f' AND b.vendor_name ILIKE ${len(params)}'
+    return query
+
+
+async def display_currency(request, user_id):
+    """Currency to convert amounts to (see app.py); raises ValueError for a bad ?currency="""
+    if request.query_params.get('currency'):
+        return fx.parse_currency(request.query_params['currency'])
+    entry = await cache.get_or_load_async(cache.settings_key(user_id), lambda: _load_user_settings(user_id))
+    try:
+        return fx.parse_currency(entry['data']['currency']) if entry else None
+    except ValueError:
+        return None
+
+
+async def rate_index(conn):
+    """fx.rate_cache.get() on an asyncpg connection"""
+    if fx.rate_cache.due() and await conn.fetchval(fx.PRESENT_SQL):
+        version = await conn.fetchrow(fx.VERSION_SQL)
+        if tuple(version) != fx.rate_cache.index.version:
+            rows = await conn.fetch(fx.RATES_SQL)
+            fx.rate_cache.update(version, lambda: rows)
+    return fx.rate_cache.index
+
+
+@auth_required
+async def get_user_bills(request):
+    """Get bills for a user (same paging modes, ETag and conversion as app.py)"""
+    user_id = request.path_params['user_id']
+    args = request.query_params
+    try:
+        limit = page_size(args.get('limit'))
+        offset = int(args.get('offset', 0))
+        page_cursor = args.get('cursor')
+
+        seek = None
+        if page_cursor:
+            try:
+                seek = decode_cursor(page_cursor, 2)
+                seek = (date.fromisoformat(seek[0]), seek[1])
+            except InvalidCursor as e:
+                return error(str(e), 400)
+            except ValueError:
+                return error('Malformed cursor', 400)
+
+        params = [user_id]
+        try:
+            filters = bill_filters(args, params)
+        except ValueError:
+            return error('Dates must be YYYY-MM-DD', 400)
+        try:
+            target = await display_currency(request, user_id)
+        except ValueError as e:
+            return error(str(e), 400)
+
+        async with acquire() as conn:
+            rates = await rate_index(conn) if target else None
+            converting = bool(rates)
+
+            version = await conn.fetchrow(
+                '''
+                SELECT COUNT(*) AS row_count,
+                       COALESCE(SUM(bill_count), 0) AS bill_count,
+                       SUM(EXTRACT(EPOCH FROM updated_at)) AS version,
+                       (SELECT COUNT(*) || ':' || COALESCE(SUM(EXTRACT(EPOCH FROM updated_at)), 0)
+                        FROM categories
+                        WHERE user_id = $1 OR user_id IS NULL) AS categories_version
+                FROM bill_monthly_rollups
+                WHERE user_id = $1
+                ''',
+                user_id
+            )
+            etag = make_etag(
+                'bills', user_id, version['row_count'], version['bill_count'], version['version'],
+                version['categories_version'],
+                request.url.query,
+                target if converting else None, rates.version if converting else None,
+            )
+            cached = not_modified(request, etag)
+            if cached:
+                return cached
+
+            query = '''
+                SELECT
+                    b.bill_id, b.user_id, b.vendor_name, b.amount, b.bill_date,
+                    b.description, b.image_path, b.currency, b.is_paid,
+                    b.created_at, b.updated_at,
+                    c.category_id, c.name as category_name, c.color as category_color,
+                    (SELECT i.image_path FROM bill_images i
+                     WHERE i.bill_id = b.bill_id AND i.image_type = 'thumbnail'
+                     ORDER BY i.created_at DESC LIMIT 1) AS thumbnail_path
+                FROM bills b
+                LEFT JOIN categories c ON b.category_id = c.category_id
+                WHERE b.user_id = $1
+            ''' + filters
+
+            if seek:
+                params.extend(seek)
+                n = len(params)
+                query += f' AND b.bill_date <= ${n - 1} AND (b.bill_date < ${n - 1} OR b.bill_id < ${n})'
+
+            params.append(limit + 1)
+            query += f' ORDER BY b.bill_date DESC, b.bill_id DESC LIMIT ${len(params)}'
+            if page_cursor is None and offset:
+                params.append(offset)
+                query += f' OFFSET ${len(params)}'
+
+            bills = await conn.fetch(query, *params)
+
+        next_cursor = None
+        if len(bills) > limit:
+            bills = bills[:limit]
+            last = bills[-1]
+            next_cursor = encode_cursor(last['bill_date'], last['bill_id'])
+
+        # The SELECT lists exactly the response fields: rows are encoded as they are
+        bills_list = [dict(bill) for bill in bills]
+
+        result = {'bills': bills_list, 'next_cursor': next_cursor}
+        if converting:
+            converted = rates.convert(
+                [bill['amount'] for bill in bills],
+                [bill['currency'] for bill in bills],
+                [bill['bill_date'] for bill in bills],
+                target,
+            )
+            for data, amount in zip(bills_list, converted):
+                data['amount_converted'] = amount
+            result['converted_currency'] = target
+
+        return tag_response(JSONResponse(result), etag)
+
+    except Exception as e:
+        print(f"Get bills error: {e}")
+        return error('Internal server error', 500)
+
+
+@auth_required
+async def create_bill(request):
+    """Create a new bill"""
+    try:
+        data = await json_body(request) or {}
+        user_id = data.get('user_id') or request.state.user_id
+        vendor_name = data.get('vendor_name')
+        amount = data.get('amount')
+        bill_date = data.get('bill_date')
+
+        if not user_id or not vendor_name or not amount or not bill_date:
+            return error('Missing required fields', 400)
+        if not auth.same_user(request.state.user_id, user_id):
+            return error('Not allowed for this user', 403)
+
+        try:
+            amount = Decimal(str(amount))
+            bill_date = datetime.fromisoformat(bill_date.replace('Z', '+00:00')).date()
+        except (InvalidOperation, ValueError, AttributeError):
+            return error('Invalid amount or bill_date', 400)
+
+        async with acquire() as conn:
+            bill = await conn.fetchrow(
+                '''
+                WITH inserted AS (
+                    INSERT INTO bills (bill_id, user_id, vendor_name, amount, bill_date,
+                                       category_id, description, image_path, currency, is_paid)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, FALSE)
+                    RETURNING *
+                )
+                SELECT i.bill_id, i.user_id, i.vendor_name, i.amount, i.bill_date,
+                       i.category_id, i.description, i.image_path, i.currency, i.is_paid,
+                       i.created_at, i.updated_at,
+                       c.name AS category_name, c.color AS category_color
+                FROM inserted i
+                LEFT JOIN categories c ON i.category_id = c.category_id
+                ''',
+                uuid.uuid4(), user_id, vendor_name, amount, bill_date,
+                data.get('category_id'), data.get('description'), data.get('image_path'),
+                data.get('currency', 'USD')
+            )
+
+        return JSONResponse({'bill': project(bill, BILL_FIELDS)}, status_code=201)
+
+    except Exception as e:
+        print(f"Create bill error: {e}")
+        return error('Internal server error', 500)
+
+
+# ============================================
+# CATEGORIES ENDPOINTS
+# ============================================
+
+async def _load_categories(where, *params):
+    """Fetch categories matching a WHERE clause, sorted by name"""
+    async with acquire() as conn:
+        rows = await conn.fetch(
+            f'''
+            SELECT {', '.join(CATEGORY_FIELDS)}
+            FROM categories
+            WHERE {where}
+            ORDER BY name ASC
+            ''',
+            *params
+        )
+    return cache.versioned([dict(row) for row in rows])
+
+
+@auth_required
+async def get_categories(request):
+    """Get categories (shares the read-through cache entries' format with app.py)"""
+    try:
+        user_id = request.query_params.get('user_id')
+        if user_id and not auth.same_user(request.state.user_id, user_id):
+            return error('Not allowed for this user', 403)
+
+        defaults = await cache.get_or_load_async(
+            cache.default_categories_key(),
+            lambda: _load_categories('is_default = TRUE'),
+        )
+        categories_list = defaults['data']
+        etag = make_etag('categories', defaults['etag'])
+
+        if user_id:
+            own = await cache.get_or_load_async(
+                cache.user_categories_key(user_id),
+                lambda: _load_categories('user_id = $1 AND is_default IS NOT TRUE', user_id),
+            )
+            categories_list = categories_list + own['data']
+            etag = make_etag('categories', defaults['etag'], own['etag'])
+
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+
+        return tag_response(JSONResponse({'categories': categories_list}), etag)
+
+    except Exception as e:
+        print(f"Get categories error: {e}")
+        return error('Internal server error', 500)
+
+
+# ============================================
+# USER SETTINGS ENDPOINTS
+# ============================================
+
+async def _load_user_settings(user_id):
+    async with acquire() as conn:
+        settings = await conn.fetchrow(
+            f"SELECT {', '.join(SETTINGS_FIELDS)} FROM user_settings WHERE user_id = $1",
+            user_id
+        )
+    if not settings:
+        return None
+    return cache.versioned(project(settings, SETTINGS_FIELDS))
+
+
+@auth_required
+async def user_settings(request):
+    """GET / PUT user settings"""
+    user_id = request.path_params['user_id']
+    if request.method == 'PUT':
+        return await update_user_settings(request, user_id)
+    try:
+        entry = await cache.get_or_load_async(
+            cache.settings_key(user_id),
+            lambda: _load_user_settings(user_id),
+        )
+        if not entry:
+            return error('Settings not found', 404)
+
+        etag = make_etag('settings', user_id, entry['etag'])
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+
+        return tag_response(JSONResponse({'settings': entry['data']}), etag)
+
+    except Exception as e:
+        print(f"Get settings error: {e}")
+        return error('Internal server error', 500)
+
+
+async def update_user_settings(request, user_id):
+    try:
+        data = await json_body(request) or {}
+        fields = [field for field in SETTINGS_FIELDS if field in data]
+        if not fields:
+            return error('No fields to update', 400)
+
+        assignments = ', '.join(f'{field} = ${i}' for i, field in enumerate(fields, start=1))
+        async with acquire() as conn:
+            await conn.execute(
+                f'''
+                UPDATE user_settings
+                SET {assignments}, updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = ${len(fields) + 1}
+                ''',
+                *[data[field] for field in fields], user_id
+            )
+
+        await asyncio.to_thread(cache.invalidate_settings, user_id)
+
+        return JSONResponse({'message': 'Settings updated successfully'})
+
+    except Exception as e:
+        print(f"Update settings error: {e}")
+        return error('Internal server error', 500)
+
+
+# ============================================
+# STREAM ENDPOINTS
+# ============================================
+
+@auth_required
+async def stream_changes(request):
+    """Server-Sent Events for changes to the user's bills, notifications and settings (see app.py)"""
+    if not events.STREAM_CONFIG['enabled']:
+        return error('Streaming is disabled', 404)
+    try:
+        subscription = event_hub.subscribe(request.path_params['user_id'])
+    except events.StreamLimit as e:
+        return JSONResponse({'error': 'Too many open streams, please retry later'}, status_code=503,
+                            headers={'Retry-After': str(e.retry_after)})
+
+    async def generate():
+        try:
+            yield events.PREAMBLE
+            while True:
+                event = await subscription.get(event_hub.heartbeat)
+                yield events.format_event(event) if event else events.HEARTBEAT
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx: pass events through unbuffered
+    })
+
+
+# ============================================
+# HEALTH CHECK
+# ============================================
+
+async def health_check(request):
+    """Health check endpoint"""
+    try:
+        async with acquire() as conn:
+            await conn.fetchval('SELECT 1')
+        return JSONResponse({
+            'status': 'healthy',
+            'database': 'connected',
+            'pool': {
+                'size': db_pool.get_size(),
+                'idle': db_pool.get_idle_size(),
+                'in_use': db_pool.get_size() - db_pool.get_idle_size(),
+                'min_size': db_pool.get_min_size(),
+                'max_size': db_pool.get_max_size(),
+            },
+            'passwords': password_pool.stats(),
+            'cache': cache.stats(),
+            'auth': auth.authenticator.stats(),
+            'ratelimit': login_limiter.stats(),
+            'events': event_hub.stats(),
+            'fx': fx.rate_cache.stats(),
+        })
+    except Exception as e:
+        return JSONResponse({'status': 'unhealthy', 'error': str(e)}, status_code=500)
+
+
+routes = [
+    Route('/api/auth/login', login, methods=['POST']),
+    Route('/api/auth/signup', signup, methods=['POST']),
+    Route('/api/auth/refresh', refresh_tokens, methods=['POST']),
+    Route('/api/auth/forgot-password', forgot_password, methods=['POST']),
+    Route('/api/auth/reset-password', reset_password, methods=['POST']),
+    Route('/api/users/{user_id}', get_user, methods=['GET']),
+    Route('/api/bills', create_bill, methods=['POST']),
+    Route('/api/bills/{user_id}', get_user_bills, methods=['GET']),
+    Route('/api/categories', get_categories, methods=['GET']),
+    Route('/api/settings/{user_id}', user_settings, methods=['GET', 'PUT']),
+    Route('/api/stream/{user_id}', stream_changes, methods=['GET']),
+    Route('/api/health', health_check, methods=['GET']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("=" * 50)
+    print("Bill Scanner Backend API Server (async)")
+    print("=" * 50)
+    print(f"Database: {DB_CONFIG['database']} @ {DB_CONFIG['host']}:{DB_CONFIG['port']}")
+    print("Starting server on http://localhost:5000")
+    print("=" * 50)
+
+    uvicorn.run(app, host='0.0.0.0', port=5000)
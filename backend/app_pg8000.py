@@ -8,13 +8,18 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import pg8000
 from pg8000 import Connection
-import bcrypt
 import os
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 import uuid
-import jwt
-from functools import wraps
+
+import auth
+from db_pool import ConnectionPool, POOL_CONFIG
+import metrics
+from passwords import PasswordPoolBusy, hash_password, needs_rehash, password_pool, verify_password
+from ratelimit import RateLimited, client_ip, login_limiter
+import serialization
+from serialization import USER_FIELDS, project
 
 # Load environment variables
 load_dotenv()
@@ -22,6 +27,9 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# jsonify() encodes UUID/date/Decimal columns itself (orjson when installed)
+app.json = serialization.JSONProvider(app)
+
 # Database configuration
 DB_CONFIG = {
     'host': os.getenv('DB_HOST', '192.168.0.110'),
@@ -31,26 +39,33 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'postgres'),
 }
 
-# JWT Secret (in production, use a secure random key)
-JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key-change-in-production')
-
 
-def get_db_connection():
-    """Get PostgreSQL database connection using pg8000"""
+def _connect():
+    """Open a new PostgreSQL connection using pg8000 (used by the pool)"""
     try:
-        conn = pg8000.connect(
+        return metrics.instrument_connection(pg8000.connect(
             host=DB_CONFIG['host'],
             port=DB_CONFIG['port'],
             database=DB_CONFIG['database'],
             user=DB_CONFIG['user'],
             password=DB_CONFIG['password']
-        )
-        return conn
+        ))
     except Exception as e:
         print(f"Database connection error: {e}")
         raise
 
 
+db_pool = ConnectionPool(_connect, **POOL_CONFIG)
+
+# Request timing and GET /api/metrics
+metrics.init_app(app, db_pool, password_pool)
+
+
+def get_db_connection():
+    """Borrow a pooled connection; use as `with get_db_connection() as conn:`"""
+    return db_pool.connection()
+
+
 def row_to_dict(cursor, row):
     """Convert database row to dictionary"""
     if row is None:
@@ -59,18 +74,18 @@ def row_to_dict(cursor, row):
     return dict(zip(columns, row))
 
 
-def hash_password(password: str) -> str:
-    """Hash password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def password_busy_response(e):
+    """503 response for when the password worker pool is saturated"""
+    response = jsonify({'error': 'Server is busy, please retry shortly'})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
 
 
-def verify_password(password: str, hashed: str) -> bool:
-    """Verify password against hash"""
-    try:
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
-    except Exception as e:
-        print(f"Password verification error: {e}")
-        return False
+def rate_limited_response(e):
+    """429 response for a login refused by the rate limiter"""
+    response = jsonify({'error': 'Too many login attempts, please retry later'})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
 
 
 # ============================================
@@ -88,57 +103,65 @@ def login():
         if not email or not password:
             return jsonify({'error': 'Email and password are required'}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # Refuse floods before they cost a query and a bcrypt verification. The
+        # attempt is reserved now and counts as a failure unless it succeeds.
+        login_limiter.check(client_ip(request.remote_addr, request.headers.get('X-Forwarded-For')), email)
 
-        # Get user by email
-        cursor.execute(
-            '''
-            SELECT user_id, email, password_hash, full_name, created_at, 
-                   last_login, is_active, email_verified
-            FROM users 
-            WHERE email = %s AND is_active = TRUE
-            ''',
-            (email,)
-        )
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
 
-        row = cursor.fetchone()
-        user = row_to_dict(cursor, row) if row else None
+            # Get user by email
+            cursor.execute(
+                '''
+                SELECT user_id, email, username, password_hash, full_name, created_at,
+                       last_login, is_active, email_verified
+                FROM users 
+                WHERE email = %s AND is_active = TRUE
+                ''',
+                (email,)
+            )
+
+            row = cursor.fetchone()
+            user = row_to_dict(cursor, row) if row else None
 
         if not user:
-            cursor.close()
-            conn.close()
             return jsonify({'error': 'Invalid email or password'}), 401
 
-        # Verify password
+        # Verify password (on the password pool, without holding a DB connection)
         if not verify_password(password, user['password_hash']):
-            cursor.close()
-            conn.close()
             return jsonify({'error': 'Invalid email or password'}), 401
 
-        # Update last login
-        cursor.execute(
-            'UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE user_id = %s',
-            (user['user_id'],)
-        )
-        conn.commit()
-
-        # Return user data (without password hash)
-        user_data = {
-            'user_id': str(user['user_id']),
-            'email': user['email'],
-            'full_name': user['full_name'],
-            'created_at': user['created_at'].isoformat() if user['created_at'] else None,
-            'last_login': datetime.now(timezone.utc).isoformat(),
-            'is_active': user['is_active'],
-            'email_verified': user['email_verified'],
-        }
-
-        cursor.close()
-        conn.close()
-
-        return jsonify({'user': user_data}), 200
-
+        login_limiter.record_success(email)
+
+        # Upgrade hashes made with a different bcrypt cost while we know the password
+        new_hash = hash_password(password) if needs_rehash(user['password_hash']) else None
+
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+
+            # Update last login
+            if new_hash:
+                cursor.execute(
+                    'UPDATE users SET last_login = CURRENT_TIMESTAMP, password_hash = %s WHERE user_id = %s',
+                    (new_hash, user['user_id'])
+                )
+            else:
+                cursor.execute(
+                    'UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE user_id = %s',
+                    (user['user_id'],)
+                )
+            conn.commit()
+
+        # Return user data (without password hash) and a token pair
+        user['last_login'] = datetime.now(timezone.utc)
+        tokens = auth.issue_tokens(user['user_id'], new_hash or user['password_hash'])
+        return jsonify({'user': project(user, USER_FIELDS), **tokens}), 200
+
+    except RateLimited as e:
+        return rate_limited_response(e)
+    except PasswordPoolBusy as e:
+        login_limiter.release(email)
+        return password_busy_response(e)
     except Exception as e:
         print(f"Login error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -159,61 +182,85 @@ def signup():
         if len(password) < 6:
             return jsonify({'error': 'Password must be at least 6 characters'}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
 
-        # Check if email already exists
-        cursor.execute('SELECT user_id FROM users WHERE email = %s', (email,))
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Email already exists'}), 409
+            # Check if email already exists
+            cursor.execute('SELECT user_id FROM users WHERE email = %s', (email,))
+            if cursor.fetchone():
+                return jsonify({'error': 'Email already exists'}), 409
 
-        # Hash password
+        # Hash password (on the password pool, without holding a DB connection)
         password_hash = hash_password(password)
 
-        # Create user
-        user_id = str(uuid.uuid4())
-        cursor.execute(
-            '''
-            INSERT INTO users (user_id, email, password_hash, full_name, email_verified, is_active)
-            VALUES (%s, %s, %s, %s, TRUE, TRUE)
-            RETURNING user_id, email, full_name, created_at, is_active, email_verified
-            ''',
-            (user_id, email, password_hash, full_name)
-        )
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+
+            # Create user
+            user_id = str(uuid.uuid4())
+            cursor.execute(
+                '''
+                INSERT INTO users (user_id, email, password_hash, full_name, email_verified, is_active)
+                VALUES (%s, %s, %s, %s, TRUE, TRUE)
+                RETURNING user_id, email, full_name, created_at, is_active, email_verified
+                ''',
+                (user_id, email, password_hash, full_name)
+            )
+
+            row = cursor.fetchone()
+            user = row_to_dict(cursor, row)
+
+            # Create default user settings
+            cursor.execute(
+                '''
+                INSERT INTO user_settings (user_id, currency, appearance_mode, default_category, push_notifications_enabled)
+                VALUES (%s, 'USD', 'system', 'Uncategorized', TRUE)
+                ON CONFLICT (user_id) DO NOTHING
+                ''',
+                (user_id,)
+            )
+
+            conn.commit()
+
+        # RETURNING lists exactly the response fields
+        return jsonify({'user': user, **auth.issue_tokens(user['user_id'], password_hash)}), 201
+
+    except PasswordPoolBusy as e:
+        return password_busy_response(e)
+    except Exception as e:
+        print(f"Signup error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
 
-        row = cursor.fetchone()
-        user = row_to_dict(cursor, row)
 
-        # Create default user settings
+def _active_password_hash(user_id):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute(
-            '''
-            INSERT INTO user_settings (user_id, currency, appearance_mode, default_category, push_notifications_enabled)
-            VALUES (%s, 'USD', 'system', 'Uncategorized', TRUE)
-            ON CONFLICT (user_id) DO NOTHING
-            ''',
+            'SELECT password_hash FROM users WHERE user_id = %s AND is_active = TRUE',
             (user_id,)
         )
+        row = cursor.fetchone()
+    return row[0] if row else None
 
-        conn.commit()
 
-        user_data = {
-            'user_id': str(user['user_id']),
-            'email': user['email'],
-            'full_name': user['full_name'],
-            'created_at': user['created_at'].isoformat() if user['created_at'] else None,
-            'is_active': user['is_active'],
-            'email_verified': user['email_verified'],
-        }
+@app.route('/api/auth/refresh', methods=['POST'])
+def refresh_tokens():
+    """Exchange a refresh token for a new access + refresh token pair"""
+    try:
+        data = request.get_json(silent=True) or {}
+        token = data.get('refresh_token')
+        if not token:
+            return jsonify({'error': 'refresh_token is required'}), 400
 
-        cursor.close()
-        conn.close()
+        try:
+            user_id, password_hash = auth.authenticator.verify_refresh(token, _active_password_hash)
+        except auth.InvalidToken as e:
+            return auth.unauthorized(str(e), e.reason)
 
-        return jsonify({'user': user_data}), 201
+        return jsonify(auth.issue_tokens(user_id, password_hash)), 200
 
     except Exception as e:
-        print(f"Signup error: {e}")
+        print(f"Refresh token error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -224,12 +271,17 @@ def signup():
 def health_check():
     """Health check endpoint"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT 1')
-        cursor.close()
-        conn.close()
-        return jsonify({'status': 'healthy', 'database': 'connected'}), 200
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+        return jsonify({
+            'status': 'healthy',
+            'database': 'connected',
+            'pool': db_pool.stats(),
+            'passwords': password_pool.stats(),
+            'ratelimit': login_limiter.stats(),
+        }), 200
     except Exception as e:
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
 
@@ -0,0 +1,356 @@
+"""
+Bill Scanner App - Stateless Authentication (JWT)
+
+Login issues a short-lived access token and a long-lived refresh token.
+Requests send the access token as `Authorization: Bearer <token>`, and
+@auth_required checks its signature and expiry locally: no session table
+and no users query per request. The caller's id is in flask.g.user_id,
+and a `user_id` URL argument must match it.
+
+POST /api/auth/refresh trades a refresh token for a new pair. That is the
+one place the users row is read: inactive users and users whose password
+changed since the token was issued (password reset) are refused.
+
+Key rotation: tokens carry the id (kid) of the key that signed them.
+JWT_SECRET signs; JWT_PREVIOUS_SECRETS are still accepted. To rotate,
+move the old secret to JWT_PREVIOUS_SECRETS, set a new JWT_SECRET and
+restart; drop the old one after JWT_REFRESH_TTL. With JWT_KEYS_FILE (one
+secret per line, signing key first) the file is re-read when it changes,
+without a restart.
+
+Importing this module fails without a signing secret (JWT_SECRET or
+JWT_KEYS_FILE): anyone who knows the key can sign tokens for any user, so
+there is no built-in default. For local development, AUTH_DEV_SECRET=1
+signs with a random key made at startup (tokens die with the process).
+"""
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+import uuid
+from functools import wraps
+from secrets import token_urlsafe
+
+import jwt
+from dotenv import load_dotenv
+from flask import g, jsonify, request
+
+import metrics
+from cache import MemoryCache
+
+# The apps import this module before their own load_dotenv()
+load_dotenv()
+
+# Authentication configuration
+AUTH_CONFIG = {
+    'secret': os.getenv('JWT_SECRET', ''),
+    # Comma-separated secrets still accepted for verification (rotation)
+    'previous_secrets': [s for s in os.getenv('JWT_PREVIOUS_SECRETS', '').split(',') if s.strip()],
+    # Optional file with one secret per line (first one signs); overrides the two above
+    'keys_file': os.getenv('JWT_KEYS_FILE', ''),
+    'algorithm': os.getenv('JWT_ALGORITHM', 'HS256'),
+    'issuer': os.getenv('JWT_ISSUER', 'bill-scanner'),
+    'access_ttl': int(os.getenv('JWT_ACCESS_TTL', 900)),
+    'refresh_ttl': int(os.getenv('JWT_REFRESH_TTL', 30 * 24 * 3600)),
+    # Clock skew tolerated when checking exp/iat, in seconds
+    'leeway': int(os.getenv('JWT_LEEWAY', 30)),
+    # Verified access tokens remembered per worker (skips HMAC + decode on reuse)
+    'token_cache_size': int(os.getenv('JWT_CACHE_SIZE', 10000)),
+    # 0 lets requests without a token through (for rolling out clients);
+    # a token that is sent is always checked
+    'required': os.getenv('AUTH_REQUIRED', '1') != '0',
+    # 1 signs with a random per-process key when no secret is configured
+    # (development only: tokens are not shared between workers or restarts)
+    'dev_secret': os.getenv('AUTH_DEV_SECRET', '0') == '1',
+}
+
+# Placeholder from old .env templates; refused as a key
+PLACEHOLDER_SECRET = 'your-secret-key-change-in-production'
+
+# Seconds between checks of JWT_KEYS_FILE for changes
+KEYS_FILE_CHECK_INTERVAL = 30
+
+if AUTH_CONFIG['algorithm'] not in ('HS256', 'HS384', 'HS512'):
+    raise ValueError('JWT_ALGORITHM must be HS256, HS384 or HS512')
+
+
+class InvalidToken(Exception):
+    """Token malformed, expired, of the wrong type or signed by an unknown key"""
+
+    def __init__(self, message, reason='invalid'):
+        super().__init__(message)
+        self.reason = reason  # metrics label
+
+
+def key_id(secret):
+    """Short, stable id for a secret; goes in the token header as `kid`"""
+    return hashlib.sha256(b'bill-scanner-kid:' + secret).hexdigest()[:12]
+
+
+# ----------------------------------------
+# Keys
+# ----------------------------------------
+
+class KeyRing:
+    """Signing key and still-accepted previous keys, by kid"""
+
+    def __init__(self, secrets, algorithm='HS256', keys_file=''):
+        self.algorithm = algorithm
+        self.keys_file = keys_file
+        self._lock = threading.Lock()
+        self._file_mtime = None
+        self._next_check = 0.0
+        if keys_file:
+            # Must load at startup; later reload errors keep the current keys
+            self._reload_file(strict=True)
+        else:
+            self._load(secrets)
+
+    def _load(self, secrets):
+        keys = {}
+        for secret in secrets:
+            secret = secret.strip()
+            if secret == PLACEHOLDER_SECRET:
+                raise ValueError('JWT secret is the public placeholder; set a long random one')
+            if secret:
+                secret = secret.encode('utf-8')
+                keys.setdefault(key_id(secret), secret)
+        if not keys:
+            raise ValueError('No JWT signing secret configured (set JWT_SECRET or JWT_KEYS_FILE)')
+        # Swap both at once: readers never see a kid without its key
+        self._signing = next(iter(keys.items()))
+        self._keys = keys
+
+    def _reload_file(self, strict=False):
+        try:
+            mtime = os.stat(self.keys_file).st_mtime
+            if mtime == self._file_mtime:
+                return
+            with open(self.keys_file, encoding='utf-8') as f:
+                self._load(f.read().splitlines())
+            self._file_mtime = mtime
+            print(f"Loaded {len(self._keys)} JWT key(s) from {self.keys_file}")
+        except (OSError, ValueError) as e:
+            if strict:
+                raise ValueError(f'Could not load JWT keys from {self.keys_file}: {e}')
+            print(f"Could not load JWT keys from {self.keys_file}: {e}")
+
+    def _maybe_reload(self):
+        if not self.keys_file or time.monotonic() < self._next_check:
+            return
+        with self._lock:
+            if time.monotonic() >= self._next_check:
+                self._next_check = time.monotonic() + KEYS_FILE_CHECK_INTERVAL
+                self._reload_file()
+
+    @property
+    def signing_kid(self):
+        self._maybe_reload()
+        return self._signing[0]
+
+    def sign(self, claims, kid=None):
+        """Encoded token, signed with the signing key (or the given kid)"""
+        self._maybe_reload()
+        kid, secret = (kid, self._keys[kid]) if kid else self._signing
+        return jwt.encode(claims, secret, algorithm=self.algorithm, headers={'kid': kid})
+
+    def key_for(self, kid):
+        self._maybe_reload()
+        return self._keys.get(kid)
+
+    def fingerprint(self, value, kid=None):
+        """Digest of a value under one key (default: the signing key), for
+        claims that must not reveal it"""
+        secret = self._keys[kid] if kid else self._signing[1]
+        return hmac.new(secret, value.encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+
+# ----------------------------------------
+# Tokens
+# ----------------------------------------
+
+class Authenticator:
+    def __init__(self, keyring, issuer='bill-scanner', access_ttl=900, refresh_ttl=2592000,
+                 leeway=30, token_cache_size=10000):
+        self.keyring = keyring
+        self.issuer = issuer
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.leeway = leeway
+        # token -> (kid, user_id); entries expire with the token
+        self._verified = MemoryCache(max_entries=token_cache_size, ttl=access_ttl)
+
+    def issue(self, user_id, password_hash):
+        """Access + refresh token pair, as returned by login, signup and refresh"""
+        now = int(time.time())
+        user_id = str(user_id)
+        kid = self.keyring.signing_kid
+        access = self.keyring.sign({
+            'sub': user_id, 'typ': 'access', 'iss': self.issuer,
+            'iat': now, 'exp': now + self.access_ttl,
+        }, kid)
+        refresh = self.keyring.sign({
+            'sub': user_id, 'typ': 'refresh', 'iss': self.issuer,
+            'iat': now, 'exp': now + self.refresh_ttl, 'jti': uuid.uuid4().hex,
+            # Changes when the password does, which retires every refresh token
+            'pwd': self.keyring.fingerprint(password_hash, kid),
+        }, kid)
+        return {
+            'access_token': access,
+            'refresh_token': refresh,
+            'token_type': 'Bearer',
+            'expires_in': self.access_ttl,
+        }
+
+    def decode(self, token, token_type):
+        """Verified claims of a token; raises InvalidToken"""
+        return self._decode(token, token_type)[1]
+
+    def _decode(self, token, token_type):
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+            key = self.keyring.key_for(kid)
+            if key is None:
+                raise InvalidToken('Token signed with an unknown key', 'unknown_key')
+            claims = jwt.decode(
+                token, key,
+                algorithms=[self.keyring.algorithm],
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={'require': ['sub', 'typ', 'exp', 'iat']},
+            )
+        except jwt.ExpiredSignatureError:
+            raise InvalidToken('Token expired', 'expired')
+        except jwt.InvalidTokenError as e:
+            raise InvalidToken(f'Invalid token: {e}')
+        if claims['typ'] != token_type:
+            raise InvalidToken(f'Wrong token type (expected {token_type})', 'wrong_type')
+        return kid, claims
+
+    def verify_access(self, token):
+        """User id of a valid access token; raises InvalidToken"""
+        cached = self._verified.get(token)
+        if isinstance(cached, tuple):
+            kid, user_id = cached
+            # A key removed by rotation takes its tokens with it
+            if self.keyring.key_for(kid) is not None:
+                return user_id
+            self._verified.delete(token)
+        kid, claims = self._decode(token, 'access')
+        remaining = claims['exp'] - time.time()
+        if remaining > 0:
+            self._verified.set(token, (kid, claims['sub']), ttl=remaining)
+        return claims['sub']
+
+    def stats(self):
+        return {'signing_kid': self.keyring.signing_kid, 'cached_tokens': self._verified.size()}
+
+    def verify_refresh(self, token, load_password_hash):
+        """
+        (user_id, password_hash) for a valid refresh token; raises InvalidToken.
+
+        load_password_hash(user_id) returns the user's current hash, or None
+        if the user is missing or inactive.
+        """
+        kid, claims = self._decode(token, 'refresh')
+        password_hash = load_password_hash(claims['sub'])
+        if password_hash is None:
+            raise InvalidToken('User not found or inactive', 'inactive')
+        if not hmac.compare_digest(claims.get('pwd', ''), self.keyring.fingerprint(password_hash, kid)):
+            raise InvalidToken('Password changed, sign in again', 'revoked')
+        return claims['sub'], password_hash
+
+
+def _configured_secrets():
+    """JWT_SECRET then JWT_PREVIOUS_SECRETS (unused with JWT_KEYS_FILE); raises ValueError without JWT_SECRET"""
+    if AUTH_CONFIG['keys_file'] or AUTH_CONFIG['secret'].strip():
+        return [AUTH_CONFIG['secret']] + AUTH_CONFIG['previous_secrets']
+    if not AUTH_CONFIG['dev_secret']:
+        raise ValueError('JWT_SECRET is not set (or use JWT_KEYS_FILE; AUTH_DEV_SECRET=1 for local development)')
+    print("WARNING: AUTH_DEV_SECRET=1 and no JWT_SECRET: signing with a random key for this "
+          "process only. Never use this in production.")
+    return [token_urlsafe(32)]
+
+
+authenticator = Authenticator(
+    KeyRing(
+        _configured_secrets(),
+        algorithm=AUTH_CONFIG['algorithm'],
+        keys_file=AUTH_CONFIG['keys_file'],
+    ),
+    issuer=AUTH_CONFIG['issuer'],
+    access_ttl=AUTH_CONFIG['access_ttl'],
+    refresh_ttl=AUTH_CONFIG['refresh_ttl'],
+    leeway=AUTH_CONFIG['leeway'],
+    token_cache_size=AUTH_CONFIG['token_cache_size'],
+)
+
+
+def issue_tokens(user_id, password_hash):
+    return authenticator.issue(user_id, password_hash)
+
+
+def authenticate(authorization):
+    """
+    Caller's user id from an Authorization header value; raises InvalidToken.
+
+    None for a request without a token when AUTH_REQUIRED=0.
+    """
+    scheme, _, token = (authorization or '').partition(' ')
+    token = token.strip() if scheme.lower() == 'bearer' else ''
+    if token:
+        return authenticator.verify_access(token)
+    if AUTH_CONFIG['required']:
+        raise InvalidToken('Missing bearer token', 'missing')
+    return None
+
+
+def same_user(caller, user_id):
+    """Whether user_id is the caller (always true for anonymous callers,
+    which only exist when AUTH_REQUIRED=0)"""
+    return caller is None or str(user_id).lower() == caller
+
+
+# ----------------------------------------
+# Flask integration
+# ----------------------------------------
+
+def unauthorized(message, reason='invalid'):
+    metrics.record_auth_failure(reason)
+    response = jsonify({'error': message})
+    response.headers['WWW-Authenticate'] = 'Bearer error="invalid_token"'
+    return response, 401
+
+
+def forbidden():
+    metrics.record_auth_failure('wrong_user')
+    return jsonify({'error': 'Not allowed for this user'}), 403
+
+
+def is_caller(user_id):
+    """Whether user_id is the authenticated user of this request"""
+    return same_user(g.get('user_id'), user_id)
+
+
+def auth_required(view):
+    """
+    Require a valid access token; sets g.user_id.
+
+    A `user_id` URL argument must be the caller's own id (403 otherwise).
+    Views that take a user id elsewhere (body, query string) check it with
+    is_caller().
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            g.user_id = authenticate(request.headers.get('Authorization'))
+        except InvalidToken as e:
+            return unauthorized(str(e), e.reason)
+
+        if 'user_id' in kwargs and not is_caller(kwargs['user_id']):
+            return forbidden()
+        return view(*args, **kwargs)
+
+    return wrapper
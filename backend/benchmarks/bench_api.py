@@ -0,0 +1,490 @@
+"""
+Benchmark: API throughput, latency and allocations under a realistic mix
+
+Starts a throwaway PostgreSQL (benchmarks/pg_fixture.py) with the
+consolidated schema and seeds synthetic users. For each --bills size
+(bills per user, e.g. 1000 up to 1000000), it runs every --server under
+Gunicorn (gunicorn.conf.py) and drives a weighted mix of login, bill list,
+filtered list, bill create and settings requests from --clients
+keep-alive connections. It reports throughput and p50/p95/p99 per
+operation.
+
+Allocations per request come from a separate in-process pass (Flask test
+client, tracemalloc): the peak and the retained Python heap growth per
+request. Operations a server does not implement (app_pg8000.py has only
+auth and health) are skipped for that server.
+
+Results can be saved as a named baseline and compared against later runs.
+
+Usage (from backend/):
+    python benchmarks/bench_api.py --bills 1000,100000 --duration 30 --save before
+    python benchmarks/bench_api.py --bills 1000,100000 --duration 30 --compare before
+    python benchmarks/bench_api.py --external ...   # scratch database on DB_HOST instead
+
+Needs psycopg2, bcrypt and gunicorn, plus the PostgreSQL server binaries
+(initdb, pg_ctl; set PG_BIN if they are not on PATH) unless --external.
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import quote
+
+import bcrypt
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_DIR = os.path.join(BENCH_DIR, 'baselines')
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.pg_fixture import PostgresFixture, free_port  # noqa: E402
+
+PASSWORD = 'bench-password'
+DEFAULT_MIX = 'login=5,list=40,filter=25,create=10,settings=20'
+SERVERS = ('app', 'app_pg8000')
+
+
+# ----------------------------------------
+# Data
+# ----------------------------------------
+
+def seed(conn, users, bills_per_user):
+    """Create `users` benchmark users (once) and top each up to `bills_per_user` bills"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT user_id, email FROM users WHERE username LIKE 'bench\\_%%' ORDER BY username")
+        existing = cursor.fetchall()
+        if len(existing) < users:
+            rounds = int(os.getenv('BCRYPT_ROUNDS', 12))
+            password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+            cursor.execute(
+                '''
+                INSERT INTO users (email, username, password_hash, full_name, is_active, email_verified)
+                SELECT 'bench-' || g || '@example.invalid', 'bench_' || lpad(g::text, 5, '0'), %s,
+                       'Benchmark User ' || g, TRUE, TRUE
+                FROM generate_series(%s, %s) AS g
+                ''',
+                (password_hash, len(existing) + 1, users)
+            )
+            cursor.execute(
+                '''
+                INSERT INTO user_settings (user_id)
+                SELECT user_id FROM users WHERE username LIKE 'bench\\_%%'
+                ON CONFLICT (user_id) DO NOTHING
+                '''
+            )
+            cursor.execute("SELECT user_id, email FROM users WHERE username LIKE 'bench\\_%%' ORDER BY username")
+            existing = cursor.fetchall()
+
+        bench_users = [{'user_id': str(u), 'email': email} for u, email in existing[:users]]
+        for user in bench_users:
+            cursor.execute('SELECT COUNT(*) FROM bills WHERE user_id = %s', (user['user_id'],))
+            have = cursor.fetchone()[0]
+            if have >= bills_per_user:
+                continue
+            # ~5 years of bills over 97 vendors and the default categories
+            cursor.execute(
+                '''
+                INSERT INTO bills (user_id, vendor_name, amount, bill_date, category_id, currency, is_paid)
+                SELECT %s, 'Vendor ' || (g %% 97), (g %% 10000) / 100.0 + 1,
+                       DATE '2020-01-01' + (g %% 1826),
+                       (SELECT ids[1 + g %% array_length(ids, 1)]
+                        FROM (SELECT array_agg(category_id) AS ids FROM categories WHERE is_default) c),
+                       'USD', g %% 3 = 0
+                FROM generate_series(%s, %s) AS g
+                ''',
+                (user['user_id'], have + 1, bills_per_user)
+            )
+        cursor.execute('ANALYZE')
+    return bench_users
+
+
+def issue_tokens(users):
+    """Give each user an access token, signed like the servers' (same JWT_* environment)"""
+    import auth
+
+    for user in users:
+        user['token'] = auth.issue_tokens(user['user_id'], '')['access_token']
+
+
+# ----------------------------------------
+# Traffic
+# ----------------------------------------
+
+def build_request(operation, user, rng):
+    """(method, path, body) for one request of the given operation"""
+    user_id = user['user_id']
+    if operation == 'login':
+        # `email` rather than `email_or_username`: app_pg8000.py only accepts the former
+        return 'POST', '/api/auth/login', {'email': user['email'], 'password': PASSWORD}
+    if operation == 'list':
+        return 'GET', f'/api/bills/{user_id}?limit=50', None
+    if operation == 'filter':
+        start = date(2020, 1, 1) + timedelta(days=rng.randrange(1500))
+        end = start + timedelta(days=180)
+        vendor = quote(f'Vendor {rng.randrange(97)}')
+        return 'GET', f'/api/bills/{user_id}?start_date={start}&end_date={end}&vendor_name={vendor}&limit=50', None
+    if operation == 'create':
+        return 'POST', '/api/bills', {
+            'user_id': user_id,
+            'vendor_name': f'Vendor {rng.randrange(97)}',
+            'amount': round(rng.uniform(1, 200), 2),
+            'bill_date': (date(2024, 1, 1) + timedelta(days=rng.randrange(365))).isoformat(),
+            'currency': 'USD',
+        }
+    if operation == 'settings':
+        return 'GET', f'/api/settings/{user_id}', None
+    raise ValueError(f'Unknown operation: {operation}')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        build_request(name.strip(), {'user_id': '', 'email': ''}, random.Random())  # validates
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class HttpClient:
+    """One keep-alive connection; reconnects after errors"""
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+
+    def send(self, method, path, body=None, token=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        headers = {'Content-Type': 'application/json'} if data else {}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=data, headers=headers)
+                response = self.conn.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+def drive(port, users, mix, clients, warmup, duration, seed_value=1):
+    """Run the mix; returns {operation: {'latencies': [...], 'errors': n}} and measured seconds"""
+    operations = list(mix)
+    weights = [mix[op] for op in operations]
+    results = {op: {'latencies': [], 'errors': 0} for op in operations}
+    lock = threading.Lock()
+    start_at = time.monotonic() + warmup
+    stop_at = start_at + duration
+
+    def client_loop(index):
+        rng = random.Random(seed_value * 1000 + index)
+        client = HttpClient(port)
+        local = {op: {'latencies': [], 'errors': 0} for op in operations}
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= stop_at:
+                    break
+                operation = rng.choices(operations, weights)[0]
+                user = rng.choice(users)
+                method, path, body = build_request(operation, user, rng)
+                begin = time.perf_counter()
+                try:
+                    status = client.send(method, path, body, user.get('token'))
+                    ok = status < 400
+                except Exception:
+                    ok = False
+                elapsed = time.perf_counter() - begin
+                if now >= start_at:
+                    if ok:
+                        local[operation]['latencies'].append(elapsed)
+                    else:
+                        local[operation]['errors'] += 1
+        finally:
+            client.close()
+        with lock:
+            for op in operations:
+                results[op]['latencies'].extend(local[op]['latencies'])
+                results[op]['errors'] += local[op]['errors']
+
+    threads = [threading.Thread(target=client_loop, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, duration
+
+
+def supported_operations(port, users, mix):
+    """Drop operations the server answers with 404/405 (route not implemented)"""
+    client = HttpClient(port)
+    supported = {}
+    try:
+        for operation, weight in mix.items():
+            method, path, body = build_request(operation, users[0], random.Random(0))
+            status = client.send(method, path, body, users[0].get('token'))
+            if status in (404, 405):
+                print(f"  {operation}: not implemented by this server ({status}), skipped")
+            else:
+                supported[operation] = weight
+    finally:
+        client.close()
+    return supported
+
+
+# ----------------------------------------
+# Server
+# ----------------------------------------
+
+def start_server(module, db_env, port, workers, threads, log_path):
+    env = dict(os.environ, **db_env)
+    env.update({
+        'WEB_CONCURRENCY': str(workers),
+        'GUNICORN_THREADS': str(threads),
+        'GUNICORN_ACCESS_LOG': '',
+        'GUNICORN_MAX_REQUESTS': '0',
+        # Every simulated client logs in from 127.0.0.1
+        'LOGIN_RATE_LIMIT': '0',
+    })
+    log = open(log_path, 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', f'{module}:app', '--bind', f'127.0.0.1:{port}'],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{module} exited during startup, see {log_path}')
+        try:
+            if HttpClient(port).send('GET', '/api/health') == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f'{module} did not become healthy, see {log_path}')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# ----------------------------------------
+# Allocations (in-process)
+# ----------------------------------------
+
+def measure_allocations(module, db_env, users, operations, samples):
+    """Run in a spawned process: per-request Python heap peak/retained (KiB) by operation"""
+    import importlib
+    import tracemalloc
+
+    os.environ.update(db_env)
+    os.environ.update({'PASSWORD_WORKERS': '0', 'METRICS_ENABLED': '1', 'LOGIN_RATE_LIMIT': '0'})
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(BACKEND_DIR)
+    client = importlib.import_module(module).app.test_client()
+    rng = random.Random(7)
+
+    def call(operation):
+        user = rng.choice(users)
+        method, path, body = build_request(operation, user, rng)
+        headers = {'Authorization': f"Bearer {user['token']}"} if user.get('token') else {}
+        return client.open(path, method=method, json=body, headers=headers)
+
+    results = {}
+    for operation in operations:
+        for _ in range(5):  # warm caches, pool and lazy imports
+            call(operation)
+        count = samples if operation != 'login' else max(samples // 10, 3)
+        peaks, retained = [], []
+        tracemalloc.start()
+        for _ in range(count):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            call(operation)
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+        tracemalloc.stop()
+        results[operation] = {
+            'alloc_peak_kib': round(statistics.median(peaks) / 1024, 1),
+            'alloc_retained_kib': round(statistics.mean(retained) / 1024, 2),
+        }
+    return results
+
+
+# ----------------------------------------
+# Reporting
+# ----------------------------------------
+
+def summarize(raw, seconds):
+    summary = {}
+    for operation, data in raw.items():
+        latencies = sorted(data['latencies'])
+        entry = {'count': len(latencies), 'errors': data['errors'], 'rps': round(len(latencies) / seconds, 1)}
+        if len(latencies) >= 2:
+            cuts = statistics.quantiles(latencies, n=100)
+            entry.update(p50_ms=round(cuts[49] * 1000, 2), p95_ms=round(cuts[94] * 1000, 2),
+                         p99_ms=round(cuts[98] * 1000, 2))
+        summary[operation] = entry
+    return summary
+
+
+def print_table(server, bills, ops, total_rps):
+    print(f"\n{server} - {bills:,} bills/user - {total_rps:,.1f} req/s total")
+    print(f"{'operation':<10} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'errors':>7} {'peak KiB':>9} {'kept KiB':>9}")
+    for operation, r in ops.items():
+        print(f"{operation:<10} {r['rps']:>9.1f} {r.get('p50_ms', 0):>9.2f} {r.get('p95_ms', 0):>9.2f} "
+              f"{r.get('p99_ms', 0):>9.2f} {r['errors']:>7} {r.get('alloc_peak_kib', '-'):>9} "
+              f"{r.get('alloc_retained_kib', '-'):>9}")
+
+
+def compare(current, baseline):
+    """Print changes against a saved baseline for every (server, size, operation) in both"""
+    print(f"\nCompared with baseline from {baseline['created']}:")
+    print(f"{'server':<11} {'bills':>9} {'operation':<10} {'req/s':>9} {'p50':>9} {'p99':>9} {'peak KiB':>9}")
+
+    def change(new, old, lower_is_better=True):
+        if new is None or not old:
+            return '-'
+        pct = (new - old) / old * 100
+        flag = '!' if (pct > 10 if lower_is_better else pct < -10) else ' '
+        return f'{pct:+.1f}%{flag}'
+
+    for server, sizes in current['results'].items():
+        for size, run in sizes.items():
+            old_run = baseline['results'].get(server, {}).get(size)
+            if not old_run:
+                continue
+            for operation, r in run['operations'].items():
+                old = old_run['operations'].get(operation)
+                if not old:
+                    continue
+                print(f"{server:<11} {int(size):>9,} {operation:<10} "
+                      f"{change(r['rps'], old['rps'], lower_is_better=False):>9} "
+                      f"{change(r.get('p50_ms'), old.get('p50_ms')):>9} "
+                      f"{change(r.get('p99_ms'), old.get('p99_ms')):>9} "
+                      f"{change(r.get('alloc_peak_kib'), old.get('alloc_peak_kib')):>9}")
+    print("(! = more than 10% worse)")
+
+
+def baseline_path(name):
+    return name if name.endswith('.json') else os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+# ----------------------------------------
+# Main
+# ----------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', action='append', choices=SERVERS,
+                        help='app module to benchmark (repeatable; default: both)')
+    parser.add_argument('--bills', default='1000,100000',
+                        help='comma-separated bills per user, e.g. 1000,10000,100000,1000000')
+    parser.add_argument('--users', type=int, default=4, help='benchmark users')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'operation weights (default {DEFAULT_MIX})')
+    parser.add_argument('--clients', type=int, default=32, help='concurrent keep-alive clients')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds per run')
+    parser.add_argument('--warmup', type=float, default=5, help='unmeasured seconds before each run')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='threads per worker')
+    parser.add_argument('--alloc-samples', type=int, default=50, help='requests per operation for allocations (0 = skip)')
+    parser.add_argument('--external', action='store_true', help='use a scratch database on DB_HOST instead of initdb')
+    parser.add_argument('--keep', action='store_true', help='keep the benchmark database afterwards')
+    parser.add_argument('--save', metavar='NAME', help='save results as benchmarks/baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='compare with a saved baseline')
+    args = parser.parse_args()
+
+    servers = args.server or list(SERVERS)
+    sizes = sorted(int(float(size)) for size in args.bills.split(','))
+    mix = parse_mix(args.mix)
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'host': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'config': {k: v for k, v in vars(args).items() if k not in ('save', 'compare', 'keep')},
+        'results': {},
+    }
+
+    log_dir = tempfile.mkdtemp(prefix='billscanner-bench-logs-')
+    with PostgresFixture(external=args.external, keep=args.keep) as db:
+        print(f"Database: {db.describe()}")
+        conn = db.connect()
+        try:
+            for size in sizes:
+                print(f"\nSeeding {args.users} users x {size:,} bills...")
+                started = time.monotonic()
+                users = seed(conn, args.users, size)
+                issue_tokens(users)
+                print(f"Seeded in {time.monotonic() - started:.1f}s")
+
+                for server in servers:
+                    port = free_port()
+                    process = start_server(server, db.env, port, args.workers, args.threads,
+                                           os.path.join(log_dir, f'{server}-{size}.log'))
+                    try:
+                        print(f"\n{server}: {args.clients} clients, {args.warmup:g}s warmup + {args.duration:g}s")
+                        server_mix = supported_operations(port, users, mix)
+                        raw, seconds = drive(port, users, server_mix, args.clients, args.warmup, args.duration)
+                    finally:
+                        stop_server(process)
+
+                    ops = summarize(raw, seconds)
+                    if args.alloc_samples:
+                        # A fresh process per server: the app modules read DB_* at import
+                        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                            allocations = pool.submit(
+                                measure_allocations,
+                                server, db.env, users, list(server_mix), args.alloc_samples,
+                            ).result()
+                        for operation, values in allocations.items():
+                            ops[operation].update(values)
+
+                    total_rps = sum(r['rps'] for r in ops.values())
+                    report['results'].setdefault(server, {})[str(size)] = {
+                        'total_rps': round(total_rps, 1), 'operations': ops,
+                    }
+                    print_table(server, size, ops, total_rps)
+        finally:
+            conn.close()
+    print(f"\nServer logs: {log_dir}")
+
+    if args.save:
+        path = baseline_path(args.save)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline: {path}")
+    if args.compare:
+        with open(baseline_path(args.compare), encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: receipt field extraction accuracy and throughput
+
+Runs receipt_extraction.extract over a corpus of OCR'd receipt texts with
+known answers (benchmarks/data/receipts.jsonl; `default_currency` stands
+in for the user's currency setting) and reports, per field, the
+share extracted correctly and the mean confidence of right and wrong
+answers, plus receipts per second. Needs no database.
+
+Usage (from backend/):
+    python benchmarks/bench_extraction.py [--corpus path.jsonl] [--rounds 200]
+    python benchmarks/bench_extraction.py --show-misses
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from receipt_extraction import extract  # noqa: E402
+
+FIELDS = ('vendor_name', 'amount', 'bill_date', 'currency')
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'receipts.jsonl')
+# Fixed "today" so results do not drift as the corpus ages
+TODAY = date(2024, 12, 31)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def matches(field, got, expected):
+    if got is None:
+        return False
+    if field == 'amount':
+        return abs(got - expected) < 0.005
+    if field == 'vendor_name':
+        return got.casefold() == expected.casefold()
+    return got == expected
+
+
+def accuracy(corpus, show_misses):
+    results = {field: {'right': [], 'wrong': [], 'missing': 0} for field in FIELDS}
+    for index, receipt in enumerate(corpus):
+        fields = extract(receipt['text'], default_currency=receipt.get('default_currency'), today=TODAY)
+        for field in FIELDS:
+            got, expected = fields[field]['value'], receipt['expected'][field]
+            if got is None:
+                results[field]['missing'] += 1
+            bucket = 'right' if matches(field, got, expected) else 'wrong'
+            if bucket == 'wrong' and got is not None:
+                results[field]['wrong'].append(fields[field]['confidence'])
+            elif bucket == 'right':
+                results[field]['right'].append(fields[field]['confidence'])
+            if bucket == 'wrong' and show_misses:
+                print(f"  #{index} {field}: got {got!r}, expected {expected!r}")
+    return results
+
+
+def throughput(corpus, rounds):
+    inputs = [(receipt['text'], receipt.get('default_currency')) for receipt in corpus]
+    for text, currency in inputs:  # warm up
+        extract(text, default_currency=currency, today=TODAY)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text, currency in inputs:
+            extract(text, default_currency=currency, today=TODAY)
+    elapsed = time.perf_counter() - start
+    return rounds * len(inputs) / elapsed, elapsed / (rounds * len(inputs)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Receipt extraction accuracy and speed')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--rounds', type=int, default=200, help='passes over the corpus for timing')
+    parser.add_argument('--show-misses', action='store_true', help='print every wrong field')
+    args = parser.parse_args()
+
+    corpus = load(args.corpus)
+    print(f"Corpus: {len(corpus)} receipts ({args.corpus})")
+    if args.show_misses:
+        print("Misses:")
+    results = accuracy(corpus, args.show_misses)
+
+    def mean(values):
+        return f"{statistics.mean(values):.2f}" if values else '-'
+
+    print(f"{'field':<12} {'accuracy':>9} {'missing':>8} {'conf(right)':>12} {'conf(wrong)':>12}")
+    overall = 0
+    for field in FIELDS:
+        r = results[field]
+        right = len(r['right'])
+        overall += right
+        print(f"{field:<12} {right / len(corpus):>8.1%} {r['missing']:>8} "
+              f"{mean(r['right']):>12} {mean(r['wrong']):>12}")
+    print(f"{'all fields':<12} {overall / (len(corpus) * len(FIELDS)):>8.1%}")
+
+    per_second, micros = throughput(corpus, args.rounds)
+    print(f"Throughput: {per_second:,.0f} receipts/s ({micros:.0f} us per receipt)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark: currency conversion with the in-memory rate index
+
+Builds a RateIndex over ten years of daily rates for --currencies
+currencies, then converts --bills synthetic mixed-currency bills (random
+currency, date and amount, a few in currencies without rates) to one
+target currency:
+
+- per row: a rate lookup for each bill (two binary searches), the way a
+  per-row loop or a join to fx_rates per bill works
+- batched: RateIndex.convert() over the whole set, and page by page as
+  GET /api/bills does (one search per currency per batch), with numpy
+  and with the pure-Python fallback
+- monthly: RateIndex.monthly_factors() over every (currency, month) cell,
+  as GET /api/analytics does
+
+and checks that every method gives the same amounts. Needs no database.
+
+Usage (from backend/):
+    python benchmarks/bench_fx.py [--bills 1000000] [--currencies 30] [--page 50]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fx  # noqa: E402
+
+START = date(2016, 1, 1)
+DAYS = 3653
+TARGET = 'EUR'
+
+
+def make_rates(currencies):
+    """Weekday rates against USD for each currency, drifting randomly"""
+    rng = random.Random(1)
+    rows = []
+    for code in currencies:
+        rate = rng.uniform(0.5, 150)
+        for offset in range(DAYS):
+            day = START + timedelta(days=offset)
+            rate *= 1 + rng.gauss(0, 0.004)
+            if day.weekday() < 5:
+                rows.append((day, 'USD', code, rate))
+    return rows
+
+
+def make_bills(count, currencies):
+    """(amounts, currencies, dates): mostly USD and a few common currencies, 1% without rates"""
+    rng = random.Random(2)
+    weights = [40, 20, 10, 8] + [1] * (len(currencies) - 3)
+    codes = rng.choices(['USD'] + currencies, weights=weights[:len(currencies) + 1], k=count)
+    codes = [code if rng.random() > 0.01 else 'XXX' for code in codes]
+    dates = [START + timedelta(days=rng.randrange(DAYS)) for _ in range(count)]
+    amounts = [round(rng.uniform(1, 500), 2) for _ in range(count)]
+    return amounts, codes, dates
+
+
+def per_row(index, amounts, codes, dates):
+    result = []
+    for amount, code, day in zip(amounts, codes, dates):
+        ordinal = day.toordinal()
+        factor = index._rate(TARGET, ordinal) / index._rate(fx.bill_currency(code), ordinal)
+        result.append(None if math.isnan(factor) else round(amount * factor, 2))
+    return result
+
+
+def paged(index, amounts, codes, dates, page):
+    result = []
+    for start in range(0, len(amounts), page):
+        end = start + page
+        result.extend(index.convert(amounts[start:end], codes[start:end], dates[start:end], TARGET))
+    return result
+
+
+def timed(label, count, unit, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<34} {elapsed:8.3f}s  {count / elapsed:>12,.0f} {unit}/s")
+    return result
+
+
+def mismatches(expected, actual):
+    """Results that differ by more than a cent (rounding of float products)"""
+    bad = 0
+    for a, b in zip(expected, actual):
+        if (a is None) != (b is None) or (a is not None and abs(a - b) > 0.011):
+            bad += 1
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark currency conversion')
+    parser.add_argument('--bills', type=int, default=1_000_000)
+    parser.add_argument('--currencies', type=int, default=30, help='currencies with rates, besides USD')
+    parser.add_argument('--page', type=int, default=50, help='bills per page for the paged run')
+    args = parser.parse_args()
+
+    currencies = [TARGET] + [f'C{i:02d}' for i in range(args.currencies - 1)]
+    rows = make_rates(currencies)
+    amounts, codes, dates = make_bills(args.bills, currencies)
+    months = sorted({d.replace(day=1) for d in dates})
+    cell_codes = [code for code in ['USD'] + currencies for _ in months]
+    cell_months = months * (len(currencies) + 1)
+    print(f"{len(rows):,} rates for {len(currencies)} currencies, {args.bills:,} bills, "
+          f"{len(cell_codes):,} month cells; converting to {TARGET}")
+
+    numpy = fx.np
+    results = {}
+    for label, np_module in (('numpy', numpy), ('pure Python', None)):
+        if label == 'numpy' and numpy is None:
+            print("numpy is not installed: skipping the vectorized runs")
+            continue
+        fx.np = np_module
+        print(f"{label}:")
+        index = timed('build index', len(rows), 'rates', lambda: fx.RateIndex(rows, base='USD', max_age_days=7))
+        if label == 'pure Python':
+            results['per row'] = timed('per row', args.bills, 'bills', lambda: per_row(index, amounts, codes, dates))
+        results[f'{label} batch'] = timed(
+            'one batch', args.bills, 'bills', lambda: index.convert(amounts, codes, dates, TARGET))
+        results[f'{label} paged'] = timed(
+            f'pages of {args.page}', args.bills, 'bills', lambda: paged(index, amounts, codes, dates, args.page))
+        timed('month cells', len(cell_codes), 'cells', lambda: index.monthly_factors(cell_codes, cell_months, TARGET))
+    fx.np = numpy
+
+    expected = results['per row']
+    unconverted = sum(value is None for value in expected)
+    print(f"{unconverted:,} bills without a rate")
+    for label, result in results.items():
+        if label != 'per row':
+            print(f"  {label:<34} {mismatches(expected, result)} mismatches against per row")
+
+
+if __name__ == '__main__':
+    main()
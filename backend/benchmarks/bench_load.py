@@ -0,0 +1,147 @@
+"""
+Benchmark: request throughput and latency under many concurrent clients
+
+Opens --clients keep-alive HTTP/1.1 connections to a running server and has
+each one send GET requests back to back for --duration seconds, then
+reports requests per second and latency percentiles. Use it to compare the
+threaded Flask app with the async app on the same database, e.g.
+
+    gunicorn -w 4 --threads 8 -b :5000 app:app
+    uvicorn app_async:app --workers 4 --port 5001
+
+Usage (from backend/):
+    python benchmarks/bench_load.py --url http://localhost:5000/api/bills/<user_id>?limit=20
+        --header 'Authorization: Bearer <access_token>'
+        [--clients 1000] [--duration 30] [--warmup 5] [--header 'If-None-Match: W/"..."']
+
+Needs no third-party packages. Raise the open-file limit (ulimit -n) above
+--clients first; a single load process tops out at a few thousand requests
+per second, so for fast endpoints run several with --clients split between
+them and add up the results.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.recording = False
+
+    def record(self, status, seconds):
+        if self.recording:
+            self.latencies.append(seconds)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns (status, keep_alive)"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed by server')
+    status = int(status_line.split()[1])
+    # HTTP/1.0 servers close after each response unless they say otherwise
+    length, chunked, keep_alive = 0, False, status_line.startswith(b'HTTP/1.1')
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value:
+            chunked = True
+        elif name == 'connection':
+            keep_alive = value == 'keep-alive' or (keep_alive and value != 'close')
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def client(target, request, stats, deadline):
+    host, port, tls = target
+    writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port, ssl=tls or None)
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+            stats.record(status, time.perf_counter() - start)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            if stats.recording:
+                stats.errors += 1
+            if writer is not None:
+                writer.close()
+                writer = None
+            await asyncio.sleep(0.1)
+    if writer is not None:
+        writer.close()
+
+
+async def run(args):
+    parts = urlsplit(args.url)
+    tls = parts.scheme == 'https'
+    target = (parts.hostname, parts.port or (443 if tls else 80), tls)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+
+    lines = [f'GET {path} HTTP/1.1', f'Host: {parts.netloc}', 'Connection: keep-alive']
+    lines += args.header
+    request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    stats = Stats()
+    deadline = time.monotonic() + args.warmup + args.duration
+    tasks = [asyncio.create_task(client(target, request, stats, deadline)) for _ in range(args.clients)]
+
+    await asyncio.sleep(args.warmup)
+    stats.recording = True
+    start = time.monotonic()
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - start
+    return stats, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP load generator with many keep-alive clients')
+    parser.add_argument('--url', required=True)
+    parser.add_argument('--clients', type=int, default=1000, help='concurrent connections')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='unmeasured seconds first')
+    parser.add_argument('--header', action='append', default=[], help="extra header, 'Name: value'")
+    args = parser.parse_args()
+
+    stats, elapsed = asyncio.run(run(args))
+
+    done = len(stats.latencies)
+    print(f"{args.url}: {args.clients} clients, {elapsed:.1f}s measured")
+    print(f"Requests: {done} ({done / elapsed:,.0f}/s), errors: {stats.errors}")
+    print(f"Status codes: {dict(sorted(stats.statuses.items()))}")
+    if done >= 2:
+        cuts = statistics.quantiles(stats.latencies, n=100)
+        print(f"Latency ms: p50 {cuts[49] * 1000:.1f}  p90 {cuts[89] * 1000:.1f}  "
+              f"p99 {cuts[98] * 1000:.1f}  max {max(stats.latencies) * 1000:.1f}")
+
+
+if __name__ == '__main__':
+    main()
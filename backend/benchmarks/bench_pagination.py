@@ -0,0 +1,107 @@
+"""
+Benchmark: OFFSET vs keyset (cursor) paging on GET /api/bills/<user_id>
+
+Seeds a throwaway user with many bills (using few distinct dates, so
+bill_date ties are common), then times fetching pages at increasing depth
+through the real Flask endpoint. Keyset latency should stay flat while
+OFFSET latency grows with depth.
+
+Usage (from backend/, with .env pointing at a test database):
+    python benchmarks/bench_pagination.py --bills 50000 --page-size 50
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, get_db_connection  # noqa: E402
+
+
+def seed(user_id, bills):
+    """Create a benchmark user with `bills` bills spread over ~1 year"""
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            '''
+            INSERT INTO users (user_id, email, username, password_hash, full_name)
+            VALUES (%s, %s, %s, 'x', 'Pagination Benchmark')
+            ''',
+            (user_id, f'bench-{user_id}@example.invalid', f'bench_{user_id[:8]}')
+        )
+        cursor.execute(
+            '''
+            INSERT INTO bills (user_id, vendor_name, amount, bill_date)
+            SELECT %s, 'Vendor ' || (g %% 97), (g %% 10000) / 100.0,
+                   DATE '2024-01-01' + (g %% 365)
+            FROM generate_series(1, %s) AS g
+            ''',
+            (user_id, bills)
+        )
+        cursor.execute('ANALYZE bills')
+        conn.commit()
+
+
+def cleanup(user_id):
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute('DELETE FROM users WHERE user_id = %s', (user_id,))
+        conn.commit()
+
+
+def timed_get(client, url, repeat):
+    samples = []
+    body = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        body = response.get_json()
+    return statistics.median(samples), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bills', type=int, default=50000)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--keep', action='store_true', help='keep the seeded user afterwards')
+    args = parser.parse_args()
+
+    user_id = str(uuid.uuid4())
+    print(f"Seeding {args.bills} bills for user {user_id}...")
+    seed(user_id, args.bills)
+
+    client = app.test_client()
+    base = f'/api/bills/{user_id}?limit={args.page_size}'
+    pages = args.bills // args.page_size
+    checkpoints = sorted({1, 10, 100, 1000, pages // 2, pages - 1} & set(range(1, pages)))
+
+    try:
+        print("=" * 60)
+        print(f"{'page':>8} {'offset ms':>12} {'cursor ms':>12}")
+        print("=" * 60)
+
+        # Walk the keyset chain once, remembering the cursor of each page
+        cursors = {0: ''}
+        token = ''
+        for page in range(1, max(checkpoints) + 1):
+            _, body = timed_get(client, f'{base}&cursor={token}', 1)
+            token = body['next_cursor']
+            cursors[page] = token
+
+        for page in checkpoints:
+            offset_ms, _ = timed_get(client, f'{base}&offset={page * args.page_size}', args.repeat)
+            cursor_ms, _ = timed_get(client, f'{base}&cursor={cursors[page]}', args.repeat)
+            print(f"{page:>8} {offset_ms:>12.2f} {cursor_ms:>12.2f}")
+        print("=" * 60)
+    finally:
+        if not args.keep:
+            cleanup(user_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark: login rate limiter overhead
+
+Times LoginLimiter.check() (what a failed login pays: the attempt is
+reserved against both limits in one step) against the in-process store,
+or a Redis store with --redis-url, for a few key-space sizes and thread
+counts, and compares it with one bcrypt verification at BCRYPT_ROUNDS.
+Then replays a credential-stuffing burst from one IP, sequentially and
+from parallel threads against one account, and counts how many attempts
+would still have reached the database and bcrypt. Needs no database.
+
+Usage (from backend/):
+    python benchmarks/bench_ratelimit.py [--ops 200000] [--threads 1,4,8]
+    python benchmarks/bench_ratelimit.py --redis-url redis://localhost:6379/15
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import bcrypt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import LoginLimiter, MemoryStore, RateLimited, RedisStore  # noqa: E402
+
+WINDOW = 300.0
+
+
+def make_store(redis_url, prefix):
+    if not redis_url:
+        return MemoryStore(max_keys=1_000_000)
+    import redis
+    return RedisStore(redis.Redis.from_url(redis_url), WINDOW, prefix=prefix)
+
+
+def overhead(store, ops, threads, keys):
+    """Mean microseconds per failed-login bookkeeping (check)"""
+    # Limits no key reaches, so every call takes the full path
+    limiter = LoginLimiter(store, window=WINDOW, per_ip=10 ** 9, per_account=10 ** 9)
+    per_thread = ops // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def run(offset):
+        barrier.wait()
+        for i in range(per_thread):
+            n = (offset + i) % keys
+            limiter.check(f'10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}', f'user{n}@example.com')
+
+    workers = [threading.Thread(target=run, args=(t * 7919,)) for t in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    return elapsed / (per_thread * threads) * 1e6, limiter.stats()['errors']
+
+
+def bcrypt_micros(rounds):
+    hashed = bcrypt.hashpw(b'bench-password', bcrypt.gensalt(rounds))
+    start = time.perf_counter()
+    bcrypt.checkpw(b'wrong-password', hashed)
+    return (time.perf_counter() - start) * 1e6
+
+
+def burst(store, attempts, accounts, per_ip, per_account):
+    """Attempts from one IP over `accounts` accounts, all with wrong passwords"""
+    limiter = LoginLimiter(store, window=WINDOW, per_ip=per_ip, per_account=per_account)
+    reached = 0
+    for i in range(attempts):
+        account = f'victim{i % accounts}@example.com'
+        try:
+            limiter.check('203.0.113.7', account)
+        except RateLimited:
+            continue
+        reached += 1
+    return reached, limiter.stats()
+
+
+def parallel_burst(store, threads, per_account, verify_seconds=0.01):
+    """`threads` simultaneous wrong passwords for one account, each taking verify_seconds"""
+    limiter = LoginLimiter(store, window=WINDOW, per_ip=10 ** 9, per_account=per_account)
+    barrier = threading.Barrier(threads)
+    reached = []
+
+    def attempt(n):
+        barrier.wait()
+        try:
+            limiter.check(f'198.51.100.{n % 256}', 'victim@example.com')
+        except RateLimited:
+            return
+        reached.append(n)
+        time.sleep(verify_seconds)  # bcrypt, then a 401
+
+    workers = [threading.Thread(target=attempt, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(reached)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login rate limiter overhead')
+    parser.add_argument('--ops', type=int, default=200000, help='failed logins per measurement')
+    parser.add_argument('--threads', default='1,4,8', help='comma-separated thread counts')
+    parser.add_argument('--keys', default='1,1000,100000', help='comma-separated distinct IP/account counts')
+    parser.add_argument('--redis-url', default='', help='measure a Redis store instead of memory')
+    parser.add_argument('--rounds', type=int, default=int(os.getenv('BCRYPT_ROUNDS', 12)),
+                        help='bcrypt cost to compare with')
+    parser.add_argument('--burst', type=int, default=10000, help='attempts in the stuffing burst')
+    args = parser.parse_args()
+    threads = [int(t) for t in args.threads.split(',')]
+    key_counts = [int(k) for k in args.keys.split(',')]
+    ops = args.ops if not args.redis_url else min(args.ops, 20000)
+
+    cost = bcrypt_micros(args.rounds)
+    print(f"Store: {'redis ' + args.redis_url if args.redis_url else 'memory'}; "
+          f"one bcrypt verify (cost {args.rounds}): {cost:,.0f} us")
+    print(f"{'keys':>8} {'threads':>8} {'us/login':>9} {'% of bcrypt':>12} {'errors':>7}")
+    for keys in key_counts:
+        for count in threads:
+            store = make_store(args.redis_url, f'billscanner:bench-rl:{time.time_ns()}:')
+            micros, errors = overhead(store, ops, count, keys)
+            print(f"{keys:>8} {count:>8} {micros:>9.2f} {micros / cost:>11.3%} {errors:>7}")
+
+    for accounts in (1, 100):
+        store = make_store(args.redis_url, f'billscanner:bench-rl:{time.time_ns()}:')
+        reached, stats = burst(store, args.burst, accounts, per_ip=30, per_account=5)
+        print(f"Burst of {args.burst} wrong passwords from one IP over {accounts} account(s): "
+              f"{reached} reached bcrypt (rejected: ip {stats['rejected_ip']}, "
+              f"account {stats['rejected_account']})")
+
+    store = make_store(args.redis_url, f'billscanner:bench-rl:{time.time_ns()}:')
+    reached = parallel_burst(store, 50, per_account=5)
+    print(f"50 parallel wrong passwords for one account (limit 5): {reached} reached bcrypt")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Throwaway PostgreSQL database for benchmarks
+
+Either starts a private cluster (initdb + pg_ctl in a temp directory, on a
+free port) or, with external=True, creates a scratch database on the
+server in DB_HOST/DB_PORT/DB_USER/DB_PASSWORD. Both load
+database/Bills_Scanner_ConsolidatedScripts.sql and are removed again on
+exit.
+
+    with PostgresFixture() as db:
+        db.env       # DB_* variables for a server process
+        db.connect() # psycopg2 connection (autocommit)
+"""
+
+import glob
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import uuid
+
+import psycopg2
+
+SCHEMA_SQL = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'database', 'Bills_Scanner_ConsolidatedScripts.sql',
+)
+
+
+def find_pg_bin():
+    """Directory holding initdb/pg_ctl: PG_BIN, PATH, or a Debian/RHEL install"""
+    candidates = [os.getenv('PG_BIN')] if os.getenv('PG_BIN') else []
+    on_path = shutil.which('initdb')
+    if on_path:
+        candidates.append(os.path.dirname(on_path))
+    candidates += sorted(glob.glob('/usr/lib/postgresql/*/bin'), reverse=True)
+    candidates += sorted(glob.glob('/usr/pgsql-*/bin'), reverse=True)
+    for path in candidates:
+        if os.path.exists(os.path.join(path, 'initdb')):
+            return path
+    return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class PostgresFixture:
+    def __init__(self, external=False, keep=False, max_connections=200):
+        self.external = external
+        self.keep = keep
+        self.max_connections = max_connections
+        self.datadir = None
+        self.pg_bin = None
+        self.params = None
+
+    # ----------------------------------------
+    # Lifecycle
+    # ----------------------------------------
+
+    def __enter__(self):
+        try:
+            if self.external:
+                self._create_database()
+            else:
+                self._start_cluster()
+            self._load_schema()
+        except Exception:
+            self.keep = False
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        if self.keep:
+            print(f"Keeping benchmark database: {self.describe()}")
+            return
+        if self.external and self.params and self.params['database'] != 'postgres':
+            admin = psycopg2.connect(**dict(self.params, database='postgres'))
+            admin.autocommit = True
+            with admin.cursor() as cursor:
+                cursor.execute(f'DROP DATABASE IF EXISTS {self.params["database"]}')
+            admin.close()
+        elif self.datadir:
+            subprocess.run([os.path.join(self.pg_bin, 'pg_ctl'), '-D', self.datadir, '-m', 'fast', 'stop'],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            shutil.rmtree(self.datadir, ignore_errors=True)
+
+    # ----------------------------------------
+    # Access
+    # ----------------------------------------
+
+    @property
+    def env(self):
+        """DB_* environment for app.py / app_pg8000.py"""
+        return {
+            'DB_HOST': self.params['host'],
+            'DB_PORT': str(self.params['port']),
+            'DB_NAME': self.params['database'],
+            'DB_USER': self.params['user'],
+            'DB_PASSWORD': self.params['password'],
+        }
+
+    def connect(self):
+        conn = psycopg2.connect(**self.params)
+        conn.autocommit = True
+        return conn
+
+    def describe(self):
+        where = self.datadir or 'external server'
+        return f"{self.params['database']} @ {self.params['host']}:{self.params['port']} ({where})"
+
+    # ----------------------------------------
+    # Internals
+    # ----------------------------------------
+
+    def _start_cluster(self):
+        self.pg_bin = find_pg_bin()
+        if not self.pg_bin:
+            raise RuntimeError('initdb not found: install PostgreSQL, set PG_BIN, or use --external')
+        if hasattr(os, 'geteuid') and os.geteuid() == 0:
+            raise RuntimeError('initdb refuses to run as root: run as another user or use --external')
+
+        self.datadir = tempfile.mkdtemp(prefix='billscanner-bench-pg-')
+        port = free_port()
+        subprocess.run(
+            [os.path.join(self.pg_bin, 'initdb'), '-D', self.datadir, '-U', 'postgres',
+             '--auth=trust', '-E', 'UTF8', '--no-sync'],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        options = (f'-p {port} -k {self.datadir} -c listen_addresses=127.0.0.1 '
+                   f'-c max_connections={self.max_connections}')
+        subprocess.run(
+            [os.path.join(self.pg_bin, 'pg_ctl'), '-D', self.datadir, '-o', options,
+             '-l', os.path.join(self.datadir, 'server.log'), '-w', 'start'],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        self.params = {'host': '127.0.0.1', 'port': port, 'user': 'postgres', 'password': '',
+                       'database': 'postgres'}
+        self._create_database()
+
+    def _create_database(self):
+        if self.params is None:
+            self.params = {
+                'host': os.getenv('DB_HOST', 'localhost'),
+                'port': int(os.getenv('DB_PORT', 5432)),
+                'user': os.getenv('DB_USER', 'postgres'),
+                'password': os.getenv('DB_PASSWORD', 'postgres'),
+                'database': 'postgres',
+            }
+        name = f'bill_scanner_bench_{uuid.uuid4().hex[:8]}'
+        admin = psycopg2.connect(**self.params)
+        admin.autocommit = True
+        with admin.cursor() as cursor:
+            cursor.execute(f'CREATE DATABASE {name}')
+        admin.close()
+        self.params['database'] = name
+
+    def _load_schema(self):
+        with open(SCHEMA_SQL, encoding='utf-8') as f:
+            script = f.read()
+        conn = self.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(script)
+        finally:
+            conn.close()
@@ -0,0 +1,363 @@
+"""
+Bill Scanner App - Read-Through Cache
+In-process LRU + TTL cache for rarely-changing rows (categories, settings),
+optionally backed by a shared Redis-compatible store instead
+
+Values must be encodable by serialization.dumps (handlers cache their
+response rows, UUIDs and datetimes included).
+
+Invalidation bumps a generation number per key, and a value loaded on a
+miss is only stored if its key's generation did not change while it was
+loading, so a load that read the database before a write cannot put the
+old value back after the write's invalidation.
+
+The in-process backend only sees invalidations made in its own process.
+Servers running several processes (Gunicorn workers, uvicorn --workers)
+call require_shared(), which turns it off unless CACHE_ALLOW_STALE=1
+accepts reads up to CACHE_TTL old; set CACHE_REDIS_URL to cache there.
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import serialization
+
+# Cache configuration
+CACHE_CONFIG = {
+    'max_entries': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+    'ttl': float(os.getenv('CACHE_TTL', 300)),
+    # e.g. redis://localhost:6379/0 (requires the `redis` package)
+    'redis_url': os.getenv('CACHE_REDIS_URL', ''),
+}
+
+# With several processes and no Redis, keep the in-process cache anyway:
+# other processes' writes are seen only after CACHE_TTL
+ALLOW_STALE = os.getenv('CACHE_ALLOW_STALE', '0') == '1'
+
+# Seconds a key's generation outlives its last invalidation in Redis; far
+# longer than any load
+GENERATION_TTL = 86400
+
+_MISSING = object()
+
+
+class MemoryCache:
+    """Thread-safe LRU cache with a per-entry expiry time"""
+
+    backend = 'memory'
+    blocking = False
+
+    def __init__(self, max_entries=10000, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self.evictions = 0
+        # key -> generation of its last invalidation, LRU-bounded like the
+        # entries; keys not in it are at _floor, the highest one dropped
+        self._generations = OrderedDict()
+        self._counter = 0
+        self._floor = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def generation(self, key):
+        with self._lock:
+            return self._generations.get(key, self._floor)
+
+    def set(self, key, value, ttl=None, generation=None):
+        """Store value; with `generation`, only if key's generation still equals it"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and self._generations.get(key, self._floor) != generation:
+                return False
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._counter += 1
+            self._generations[key] = self._counter
+            self._generations.move_to_end(key)
+            while len(self._generations) > self.max_entries:
+                self._floor = max(self._floor, self._generations.popitem(last=False)[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._counter += 1
+            self._floor = self._counter
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisCache:
+    """Same interface as MemoryCache, stored in Redis as JSON with SETEX"""
+
+    backend = 'redis'
+    blocking = True
+
+    # SETEX only if the generation key still holds ARGV[1]
+    _SET_IF_GENERATION = """
+        if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then return 0 end
+        redis.call('SETEX', KEYS[1], ARGV[2], ARGV[3])
+        return 1
+    """
+
+    def __init__(self, client, ttl=300.0, prefix='billscanner:'):
+        self._client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.evictions = 0  # handled by Redis maxmemory policy
+        self._set_if_generation = client.register_script(self._SET_IF_GENERATION)
+
+    def _generation_key(self, key):
+        return f'{self.prefix}gen:{key}'
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        return _MISSING if raw is None else serialization.loads(raw)
+
+    def generation(self, key):
+        raw = self._client.get(self._generation_key(key))
+        return '0' if raw is None else raw.decode()
+
+    def set(self, key, value, ttl=None, generation=None):
+        seconds = max(int(self.ttl if ttl is None else ttl), 1)
+        if generation is None:
+            self._client.setex(self.prefix + key, seconds, serialization.dumps(value))
+            return True
+        return bool(self._set_if_generation(
+            keys=[self.prefix + key, self._generation_key(key)],
+            args=[generation, seconds, serialization.dumps(value)],
+        ))
+
+    def delete(self, key):
+        pipe = self._client.pipeline()
+        pipe.delete(self.prefix + key)
+        pipe.incr(self._generation_key(key))
+        pipe.expire(self._generation_key(key), GENERATION_TTL)
+        pipe.execute()
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+    def size(self):
+        return None
+
+
+class NullCache:
+    """Caches nothing: every read loads (see require_shared)"""
+
+    backend = 'none'
+    blocking = False
+    evictions = 0
+
+    def get(self, key):
+        return _MISSING
+
+    def generation(self, key):
+        return None
+
+    def set(self, key, value, ttl=None, generation=None):
+        return False
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def size(self):
+        return 0
+
+
+class ReadThroughCache:
+    """Wraps a backend with load-on-miss and hit/miss counters"""
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'invalidations': 0, 'discarded': 0, 'errors': 0}
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Return the cached value for key, calling loader() on a miss.
+        A loader returning None is not cached (e.g. "not found")."""
+        value = self._get(key)
+        if value is not _MISSING:
+            return value
+        generation = self._generation(key)
+        value = loader()
+        self._set(key, value, ttl, generation)
+        return value
+
+    async def get_or_load_async(self, key, loader, ttl=None):
+        """get_or_load for an async loader (a zero-argument coroutine function).
+        Blocking backends (Redis) are called on a worker thread, not the event loop."""
+        value = await self._call(self._get, key)
+        if value is not _MISSING:
+            return value
+        generation = await self._call(self._generation, key)
+        value = await loader()
+        await self._call(self._set, key, value, ttl, generation)
+        return value
+
+    async def _call(self, fn, *args):
+        if self.store.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    def _get(self, key):
+        try:
+            value = self.store.get(key)
+        except Exception as e:
+            # A cache outage must not take the API down: fall through to the DB
+            print(f"Cache get error ({key}): {e}")
+            self._count('errors')
+            value = _MISSING
+        self._count('misses' if value is _MISSING else 'hits')
+        return value
+
+    def _generation(self, key):
+        """Key's generation before a load; None (do not cache the load) on error"""
+        try:
+            return self.store.generation(key)
+        except Exception as e:
+            print(f"Cache generation error ({key}): {e}")
+            self._count('errors')
+            return None
+
+    def _set(self, key, value, ttl, generation):
+        if value is None or generation is None:
+            return
+        try:
+            if not self.store.set(key, value, ttl, generation=generation):
+                # Invalidated while loading: the value may predate the write
+                self._count('discarded')
+        except Exception as e:
+            print(f"Cache set error ({key}): {e}")
+            self._count('errors')
+
+    def invalidate(self, *keys):
+        for key in keys:
+            try:
+                self.store.delete(key)
+            except Exception as e:
+                print(f"Cache delete error ({key}): {e}")
+                self._count('errors')
+        self._count('invalidations', len(keys))
+
+    def clear(self):
+        self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        stats['backend'] = self.store.backend
+        stats['entries'] = self.store.size()
+        stats['evictions'] = self.store.evictions
+        return stats
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+
+def _create_store(max_entries, ttl, redis_url):
+    if redis_url:
+        try:
+            import redis
+            return RedisCache(redis.Redis.from_url(redis_url), ttl=ttl)
+        except ImportError:
+            print("Warning: CACHE_REDIS_URL is set but the redis package is not installed; "
+                  "using the in-process cache")
+    return MemoryCache(max_entries=max_entries, ttl=ttl)
+
+
+read_cache = ReadThroughCache(_create_store(**CACHE_CONFIG))
+
+
+def get_or_load(key, loader, ttl=None):
+    """Module-level shortcut for read_cache.get_or_load"""
+    return read_cache.get_or_load(key, loader, ttl)
+
+
+async def get_or_load_async(key, loader, ttl=None):
+    """Module-level shortcut for read_cache.get_or_load_async"""
+    return await read_cache.get_or_load_async(key, loader, ttl)
+
+
+def stats():
+    return read_cache.stats()
+
+
+def require_shared(processes):
+    """
+    Called by servers with the number of processes serving requests. With
+    more than one, the in-process backend is replaced by NullCache (unless
+    CACHE_ALLOW_STALE=1): its invalidations would not reach the others.
+    """
+    if processes > 1 and read_cache.store.backend == 'memory' and not ALLOW_STALE:
+        read_cache.store = NullCache()
+        print(f"Cache disabled: {processes} processes share no cache; "
+              f"set CACHE_REDIS_URL (or CACHE_ALLOW_STALE=1)")
+
+
+def versioned(value):
+    """
+    Cache entry carrying a content hash next to the value, computed once at
+    load time, so conditional GETs can compare ETags without re-hashing
+    """
+    body = serialization.dumps(value, sort_keys=True)
+    return {'etag': hashlib.sha1(body).hexdigest()[:20], 'data': value}
+
+
+# ----------------------------------------
+# Cache keys
+# ----------------------------------------
+
+def default_categories_key():
+    return 'categories:default'
+
+
+def user_categories_key(user_id):
+    return f'categories:user:{user_id}'
+
+
+def settings_key(user_id):
+    return f'settings:{user_id}'
+
+
+def invalidate_categories(user_id=None):
+    """Call after writing categories: a user's own, or the defaults (user_id=None)"""
+    read_cache.invalidate(user_categories_key(user_id) if user_id else default_categories_key())
+
+
+def invalidate_settings(user_id):
+    """Call after writing a user's settings"""
+    read_cache.invalidate(settings_key(user_id))
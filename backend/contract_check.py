@@ -0,0 +1,210 @@
+"""
+Bill Scanner App - API contract check
+Drives the routes the mobile app uses against a running server and checks
+status codes and response keys, so app.py, app_pg8000.py and app_async.py
+can be verified to answer alike. Creates a throwaway user and bill.
+
+Usage:
+    python contract_check.py [--base-url http://localhost:5000]
+"""
+
+import argparse
+import json
+import sys
+import urllib.error
+import urllib.request
+import uuid
+
+TOKEN_KEYS = {'access_token', 'refresh_token', 'token_type', 'expires_in'}
+USER_KEYS = {'user_id', 'email', 'full_name', 'created_at', 'is_active', 'email_verified'}
+BILL_KEYS = {
+    'bill_id', 'user_id', 'vendor_name', 'amount', 'bill_date', 'category_id',
+    'category_name', 'category_color', 'description', 'image_path', 'currency',
+    'is_paid', 'created_at', 'updated_at',
+}
+CATEGORY_KEYS = {'category_id', 'name', 'color', 'icon', 'is_default', 'created_at'}
+SETTINGS_KEYS = {
+    'currency', 'appearance_mode', 'default_category',
+    'push_notifications_enabled', 'email_notifications_enabled', 'bill_reminders_enabled',
+}
+
+
+class Checker:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.failures = 0
+        self.access_token = None
+
+    def call(self, method, path, body=None, headers=None):
+        """Return (status, headers, decoded JSON body or None)"""
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        req.add_header('Content-Type', 'application/json')
+        if self.access_token:
+            req.add_header('Authorization', f'Bearer {self.access_token}')
+        for name, value in (headers or {}).items():
+            req.add_header(name, value)
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                status, resp_headers, raw = resp.status, resp.headers, resp.read()
+        except urllib.error.HTTPError as e:
+            status, resp_headers, raw = e.code, e.headers, e.read()
+        try:
+            payload = json.loads(raw) if raw else None
+        except ValueError:
+            payload = None
+        return status, resp_headers, payload
+
+    def expect(self, name, condition, detail=''):
+        print(f"  {'ok  ' if condition else 'FAIL'} {name}{'' if condition else f' {detail}'}")
+        if not condition:
+            self.failures += 1
+        return condition
+
+    def expect_status(self, name, status, expected, payload=None):
+        return self.expect(f'{name} -> {expected}', status == expected, f'(got {status}: {payload})')
+
+    def expect_keys(self, name, obj, keys):
+        missing = keys - set(obj or {})
+        return self.expect(f'{name} keys', not missing, f'(missing {sorted(missing)})')
+
+    def run(self):
+        suffix = uuid.uuid4().hex[:10]
+        email = f'contract_{suffix}@example.com'
+        username = f'contract_{suffix}'
+        password = 'contract-check-1'
+
+        print(f"Contract check against {self.base_url}")
+
+        status, _, body = self.call('GET', '/api/health')
+        self.expect_status('GET /api/health', status, 200, body)
+
+        status, _, body = self.call('POST', '/api/auth/signup', {
+            'email': email, 'username': username, 'password': password, 'full_name': 'Contract Check',
+        })
+        if not self.expect_status('POST /api/auth/signup', status, 201, body):
+            return
+        user_id = body['user']['user_id']
+        self.expect_keys('signup user', body['user'], USER_KEYS | {'username'})
+        self.expect_keys('signup tokens', body, TOKEN_KEYS)
+
+        status, _, body = self.call('POST', '/api/auth/signup', {
+            'email': email, 'username': username + 'x', 'password': password, 'full_name': 'Contract Check',
+        })
+        self.expect_status('POST /api/auth/signup (duplicate email)', status, 409, body)
+
+        status, _, body = self.call('POST', '/api/auth/login', {'email': email, 'password': 'wrong-password'})
+        self.expect_status('POST /api/auth/login (bad password)', status, 401, body)
+
+        status, _, body = self.call('POST', '/api/auth/login', {'email_or_username': username, 'password': password})
+        if not self.expect_status('POST /api/auth/login', status, 200, body):
+            return
+        self.expect_keys('login user', body['user'], USER_KEYS | {'username', 'last_login'})
+        self.expect_keys('login tokens', body, TOKEN_KEYS)
+        refresh_token = body['refresh_token']
+
+        status, _, body = self.call('GET', f'/api/users/{user_id}')
+        self.expect_status('GET /api/users/<id> (no token)', status, 401, body)
+
+        status, _, body = self.call('GET', f'/api/bills/{user_id}')
+        self.expect_status('GET /api/bills/<user_id> (no token)', status, 401, body)
+
+        status, _, body = self.call('POST', '/api/auth/refresh', {'refresh_token': refresh_token})
+        if self.expect_status('POST /api/auth/refresh', status, 200, body):
+            self.expect_keys('refreshed tokens', body, TOKEN_KEYS)
+            self.access_token = body['access_token']
+
+        status, _, body = self.call('POST', '/api/auth/refresh', {'refresh_token': self.access_token})
+        self.expect_status('POST /api/auth/refresh (access token)', status, 401, body)
+
+        status, _, body = self.call('GET', f'/api/users/{uuid.uuid4()}')
+        self.expect_status('GET /api/users/<other id>', status, 403, body)
+
+        status, _, body = self.call('GET', f'/api/bills/{uuid.uuid4()}')
+        self.expect_status('GET /api/bills/<other id>', status, 403, body)
+
+        status, headers, body = self.call('GET', f'/api/users/{user_id}')
+        if self.expect_status('GET /api/users/<id>', status, 200, body):
+            self.expect_keys('user', body['user'], USER_KEYS | {'last_login'})
+            self.check_not_modified(f'/api/users/{user_id}', headers)
+
+        status, _, body = self.call('POST', '/api/bills', {'user_id': user_id})
+        self.expect_status('POST /api/bills (missing fields)', status, 400, body)
+
+        status, _, body = self.call('POST', '/api/bills', {
+            'user_id': user_id, 'vendor_name': 'Contract Cafe', 'amount': 12.5,
+            'bill_date': '2024-03-05', 'description': 'contract check', 'currency': 'EUR',
+        })
+        if self.expect_status('POST /api/bills', status, 201, body):
+            self.expect_keys('created bill', body['bill'], BILL_KEYS)
+            self.expect('created bill values',
+                        body['bill']['amount'] == 12.5 and body['bill']['bill_date'] == '2024-03-05',
+                        f"(got {body['bill']})")
+
+        status, headers, body = self.call('GET', f'/api/bills/{user_id}?limit=1')
+        if self.expect_status('GET /api/bills/<user_id>', status, 200, body):
+            self.expect('bills page shape', len(body['bills']) == 1 and 'next_cursor' in body, f'(got {body})')
+            self.expect_keys('listed bill', body['bills'][0], BILL_KEYS | {'thumbnail_path'})
+            self.check_not_modified(f'/api/bills/{user_id}?limit=1', headers)
+
+        status, _, body = self.call('GET', f'/api/bills/{user_id}?cursor=not-a-cursor')
+        self.expect_status('GET /api/bills/<user_id> (bad cursor)', status, 400, body)
+
+        status, headers, body = self.call('GET', f'/api/categories?user_id={user_id}')
+        if self.expect_status('GET /api/categories', status, 200, body):
+            if body['categories']:
+                self.expect_keys('category', body['categories'][0], CATEGORY_KEYS)
+            self.check_not_modified(f'/api/categories?user_id={user_id}', headers)
+
+        status, headers, body = self.call('GET', f'/api/settings/{user_id}')
+        if self.expect_status('GET /api/settings/<id>', status, 200, body):
+            self.expect_keys('settings', body['settings'], SETTINGS_KEYS)
+            etag = headers.get('ETag')
+
+            status, _, body = self.call('PUT', f'/api/settings/{user_id}', {'currency': 'EUR'})
+            self.expect_status('PUT /api/settings/<id>', status, 200, body)
+
+            status, _, body = self.call('GET', f'/api/settings/{user_id}', headers={'If-None-Match': etag or ''})
+            self.expect_status('GET /api/settings/<id> after update', status, 200, body)
+            self.expect('settings updated', body and body['settings']['currency'] == 'EUR', f'(got {body})')
+
+        status, _, body = self.call('PUT', f'/api/settings/{user_id}', {})
+        self.expect_status('PUT /api/settings/<id> (no fields)', status, 400, body)
+
+        status, _, body = self.call('POST', '/api/auth/forgot-password', {'email': email})
+        if self.expect_status('POST /api/auth/forgot-password', status, 200, body):
+            token = body['token']
+            status, _, body = self.call('POST', '/api/auth/reset-password',
+                                        {'token': token, 'new_password': password + '2'})
+            self.expect_status('POST /api/auth/reset-password', status, 200, body)
+            status, _, body = self.call('POST', '/api/auth/reset-password',
+                                        {'token': token, 'new_password': password + '3'})
+            self.expect_status('POST /api/auth/reset-password (token reused)', status, 400, body)
+
+            # A password change retires refresh tokens issued before it
+            status, _, body = self.call('POST', '/api/auth/refresh', {'refresh_token': refresh_token})
+            self.expect_status('POST /api/auth/refresh (after password reset)', status, 401, body)
+
+    def check_not_modified(self, path, headers):
+        etag = headers.get('ETag')
+        if not self.expect(f'{path} sends ETag', bool(etag)):
+            return
+        status, _, _ = self.call('GET', path, headers={'If-None-Match': etag})
+        self.expect_status(f'GET {path} (If-None-Match)', status, 304)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check an API server against the client contract')
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    args = parser.parse_args()
+
+    checker = Checker(args.base_url)
+    checker.run()
+    if checker.failures:
+        print(f"{checker.failures} check(s) failed")
+        sys.exit(1)
+    print("All checks passed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+Bill Scanner App - Database Connection Pool
+Thread-safe PostgreSQL connection pool shared by app.py (psycopg2)
+and app_pg8000.py (pg8000)
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# Pool configuration
+POOL_CONFIG = {
+    'min_size': int(os.getenv('DB_POOL_MIN', 2)),
+    'max_size': int(os.getenv('DB_POOL_MAX', 20)),
+    # Seconds an idle connection is kept above min_size before it is closed
+    'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 300)),
+    # Seconds a request waits for a free connection before giving up
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    # Connections idle longer than this are pinged on checkout
+    'ping_after': float(os.getenv('DB_POOL_PING_AFTER', 5)),
+}
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout"""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of DB-API connections.
+
+    `connect` is a zero-argument callable returning a new connection, so the
+    same pool works for psycopg2 and pg8000. Idle connections are kept in a
+    LIFO stack: the most recently used (warm) connection is handed out first
+    and the ones at the bottom age out after `max_idle` seconds.
+    """
+
+    def __init__(self, connect, min_size=2, max_size=20, max_idle=300.0,
+                 timeout=10.0, ping_after=5.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError('Invalid pool size: min_size=%s max_size=%s' % (min_size, max_size))
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = []  # stack of (conn, last_used)
+        self._size = 0   # open connections, idle + checked out
+        self._closed = False
+
+    # ----------------------------------------
+    # Checkout / return
+    # ----------------------------------------
+
+    def getconn(self):
+        """Check a healthy connection out of the pool"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            conn, last_used = self._reserve(deadline)
+            if conn is None:
+                # Reserved a slot for a brand new connection
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+                metrics.record_pool_wait(time.monotonic() - start)
+                return conn
+
+            if self._is_healthy(conn, last_used):
+                metrics.record_pool_wait(time.monotonic() - start)
+                return conn
+
+            # Stale or broken connection: drop it and try again
+            self._discard(conn)
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, rolling back any open transaction"""
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception as e:
+                print(f"Pool: discarding connection that failed to roll back: {e}")
+                discard = True
+
+        if discard or self._closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            expired = self._pop_expired()
+            self._cond.notify()
+        self._close_quietly(expired)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a `with` block.
+
+        The connection always goes back to the pool, whichever way the block
+        exits (return, exception or early return). Uncommitted work is rolled
+        back, and connections left in a broken state are discarded.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        except BaseException:
+            self.putconn(conn, discard=self._is_broken(conn))
+            raise
+        else:
+            self.putconn(conn)
+
+    # ----------------------------------------
+    # Lifecycle / introspection
+    # ----------------------------------------
+
+    def warm(self):
+        """Open connections up to min_size (best effort, e.g. at startup)"""
+        opened = []
+        try:
+            while True:
+                with self._cond:
+                    if self._size >= self.min_size:
+                        break
+                    self._size += 1
+                try:
+                    opened.append(self._connect())
+                except Exception:
+                    self._release_slot()
+                    raise
+        finally:
+            now = time.monotonic()
+            with self._cond:
+                self._idle.extend((conn, now) for conn in opened)
+                self._cond.notify_all()
+
+    def closeall(self):
+        """Close every idle connection and refuse to pool returned ones"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._size -= len(idle)
+            self._idle = []
+            self._cond.notify_all()
+        self._close_quietly(idle)
+
+    def reset(self):
+        """Drop inherited connections after fork without touching the sockets"""
+        with self._cond:
+            self._idle = []
+            self._size = 0
+            self._closed = False
+            self._cond = threading.Condition()
+
+    def stats(self):
+        """Current pool occupancy"""
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            }
+
+    # ----------------------------------------
+    # Internals
+    # ----------------------------------------
+
+    def _reserve(self, deadline):
+        """Pop an idle connection, or reserve a slot to open a new one"""
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout('Connection pool is closed')
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f'No database connection available within {self.timeout}s '
+                        f'(max_size={self.max_size})'
+                    )
+                self._cond.wait(remaining)
+
+    def _pop_expired(self):
+        """Remove connections idle for longer than max_idle (caller holds the lock)"""
+        expired = []
+        cutoff = time.monotonic() - self.max_idle
+        # Oldest connections sit at the bottom of the stack
+        while self._idle and self._size > self.min_size and self._idle[0][1] < cutoff:
+            expired.append(self._idle.pop(0)[0])
+            self._size -= 1
+        return expired
+
+    def _is_healthy(self, conn, last_used):
+        if self._is_broken(conn):
+            return False
+        if time.monotonic() - last_used < self.ping_after:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception as e:
+            print(f"Pool: health check failed, reconnecting: {e}")
+            return False
+
+    @staticmethod
+    def _is_broken(conn):
+        # psycopg2 exposes `closed` (non-zero once the socket is gone)
+        return bool(getattr(conn, 'closed', False))
+
+    def _discard(self, conn):
+        self._close_quietly([conn])
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
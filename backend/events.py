@@ -0,0 +1,308 @@
+"""
+Bill Scanner App - Change Events
+Pushes bill, notification and settings changes to clients as
+Server-Sent Events on GET /api/stream/<user_id>, instead of them polling
+GET /api/bills every few seconds.
+
+The triggers in database/18_change_events.sql NOTIFY the
+billscanner_changes channel once per user per statement. Each server
+process LISTENs on one connection of its own (not a pool connection) and
+hands every notification to the open streams of its user through an
+in-memory queue per stream. Events say what changed (table, op, ids), not
+the rows themselves: clients fetch those with GET /api/sync.
+
+Nothing is replayed. Events raised while the listener is reconnecting,
+or while a client is disconnected or too slow to drain its queue, are
+lost; open streams then get a `resync` event, and a client that
+reconnects should call GET /api/sync before relying on the stream.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import select
+import threading
+
+# Stream configuration
+STREAM_CONFIG = {
+    'enabled': os.getenv('STREAM_ENABLED', '1') != '0',
+    # Seconds between keep-alive comments on an idle stream; also how soon
+    # a closed client is noticed
+    'heartbeat': float(os.getenv('STREAM_HEARTBEAT', 25)),
+    # Events queued for a stream before it is sent `resync` instead
+    'queue_size': int(os.getenv('STREAM_QUEUE_SIZE', 100)),
+    # Open streams per process (app_async.py)
+    'max_streams': int(os.getenv('STREAM_MAX_STREAMS', 10000)),
+    # Open streams per Gunicorn worker for app.py, where each one holds a
+    # request thread; keep it below GUNICORN_THREADS
+    'max_threads': int(os.getenv('STREAM_MAX_THREADS', 4)),
+}
+
+# NOTIFY channel written by notify_user_changes()
+CHANNEL = 'billscanner_changes'
+
+# (event name, data) sent when events may have been lost
+RESYNC = ('resync', '{}')
+
+# Sent first on every stream: EventSource reconnect delay in milliseconds
+PREAMBLE = 'retry: 5000\n\n'
+
+# Comment line that keeps proxies from closing an idle stream
+HEARTBEAT = ': keep-alive\n\n'
+
+
+class StreamLimit(Exception):
+    """Raised when a process already holds its maximum number of streams"""
+
+    def __init__(self, retry_after=30):
+        super().__init__('Too many open streams')
+        self.retry_after = retry_after
+
+
+def format_event(event):
+    """SSE frame for an (event name, data) pair"""
+    name, data = event
+    return f'event: {name}\ndata: {data}\n\n'
+
+
+class Subscription:
+    """One open stream: a bounded queue of events for a user"""
+
+    def __init__(self, user_id, queue_size):
+        self.user_id = user_id
+        self._queue = queue.Queue(queue_size)
+        self._overflowed = False
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self._overflowed = True
+            return False
+
+    def _drain(self):
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def get(self, timeout):
+        """Next event, RESYNC after lost events, or None after `timeout` seconds"""
+        if self._overflowed:
+            self._overflowed = False
+            self._drain()
+            return RESYNC
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """Subscription for asyncio servers; put() must run on the event loop"""
+
+    def __init__(self, user_id, queue_size):
+        self.user_id = user_id
+        self._queue = asyncio.Queue(queue_size)
+        self._overflowed = False
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self._overflowed = True
+            return False
+
+    def _drain(self):
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    async def get(self, timeout):
+        if self._overflowed:
+            self._overflowed = False
+            self._drain()
+            return RESYNC
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    """
+    Routes change notifications to the subscriptions of their user.
+
+    With `connect` (a function returning a new psycopg2 connection), the
+    hub LISTENs on a background thread started by the first subscribe().
+    Without it, the caller feeds dispatch() itself (app_async.py does, from
+    an asyncpg listener).
+    """
+
+    def __init__(self, connect=None, max_streams=None, queue_size=None, heartbeat=None,
+                 subscription=Subscription):
+        self._connect = connect
+        self.max_streams = max_streams or STREAM_CONFIG['max_streams']
+        self.queue_size = queue_size or STREAM_CONFIG['queue_size']
+        self.heartbeat = heartbeat or STREAM_CONFIG['heartbeat']
+        self._subscription = subscription
+        self.reset()
+
+    def reset(self):
+        """Forget streams and a listener thread inherited across fork()"""
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._users = {}
+        self._streams = 0
+        self._listening = False
+        self._delivered = 0
+        self._overflows = 0
+        self._reconnects = 0
+
+    def subscribe(self, user_id):
+        """New Subscription for user_id; raises StreamLimit"""
+        with self._lock:
+            if self._streams >= self.max_streams:
+                raise StreamLimit()
+            subscription = self._subscription(str(user_id).lower(), self.queue_size)
+            self._users.setdefault(subscription.user_id, set()).add(subscription)
+            self._streams += 1
+        self.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._users.get(subscription.user_id)
+            if subscriptions is None or subscription not in subscriptions:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._users[subscription.user_id]
+            self._streams -= 1
+
+    def dispatch(self, payload):
+        """Deliver one NOTIFY payload to its user's streams"""
+        try:
+            event = json.loads(payload)
+            user_id = event['user_id']
+            name = event['table']
+        except (ValueError, KeyError, TypeError):
+            print(f"Change events: ignoring malformed payload {payload[:200]!r}")
+            return
+        with self._lock:
+            subscriptions = list(self._users.get(user_id, ()))
+        self._deliver(subscriptions, (name, payload))
+
+    def resync_all(self):
+        """Tell every open stream that events may have been lost"""
+        with self._lock:
+            subscriptions = [s for group in self._users.values() for s in group]
+        self._deliver(subscriptions, RESYNC)
+
+    def _deliver(self, subscriptions, event):
+        delivered = overflows = 0
+        for subscription in subscriptions:
+            if subscription.put(event):
+                delivered += 1
+            else:
+                overflows += 1
+        if subscriptions:
+            with self._lock:
+                self._delivered += delivered
+                self._overflows += overflows
+
+    def set_listening(self, listening):
+        """Record whether the LISTEN connection is up (for stats)"""
+        with self._lock:
+            was_listening, self._listening = self._listening, listening
+            if not listening and was_listening:
+                self._reconnects += 1
+
+    # ----------------------------------------
+    # psycopg2 listener thread
+    # ----------------------------------------
+
+    def start(self):
+        """Start the LISTEN thread (once per process); no-op without `connect`"""
+        if self._connect is None or not STREAM_CONFIG['enabled']:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._listen, name='change-events', daemon=True)
+            self._thread.start()
+
+    def _listen(self):
+        backoff = 1
+        lost = False
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                self.set_listening(True)
+                if lost:
+                    self.resync_all()
+                backoff = 1
+                self._receive(conn)
+            except Exception as e:
+                print(f"Change events listener error: {e}")
+            finally:
+                self.set_listening(False)
+                lost = True
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _receive(self, conn):
+        idle = 0.0
+        while not self._stop.is_set():
+            if select.select([conn], [], [], 1.0)[0]:
+                conn.poll()
+                while conn.notifies:
+                    self.dispatch(conn.notifies.pop(0).payload)
+                idle = 0.0
+                continue
+            idle += 1.0
+            if idle >= self.heartbeat:
+                # A dead TCP connection can stay silent for ever; make it fail
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                idle = 0.0
+
+    def stream(self, subscription):
+        """SSE text chunks for a subscription, heartbeat while idle (sync servers)"""
+        yield PREAMBLE
+        while True:
+            event = subscription.get(self.heartbeat)
+            yield format_event(event) if event else HEARTBEAT
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': STREAM_CONFIG['enabled'],
+                'listening': self._listening,
+                'streams': self._streams,
+                'users': len(self._users),
+                'max_streams': self.max_streams,
+                'delivered': self._delivered,
+                'overflows': self._overflows,
+                'reconnects': self._reconnects,
+            }
+
+    def shutdown(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5)
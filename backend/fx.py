@@ -0,0 +1,358 @@
+"""
+Bill Scanner App - Currency Conversion
+Converts bill amounts to the user's currency (user_settings.currency)
+using the fx_rates table (see database/19_fx_rates.sql).
+
+Each server process keeps the table in memory as a RateIndex: per
+currency, the sorted dates on which a rate was published and the rate
+from each date, so the rate on any day is a binary search (the latest
+rate on or before that day, if it is at most FX_MAX_AGE_DAYS old).
+Conversion is done for a whole page or result set at once: one search
+per currency in the batch (numpy.searchsorted when numpy is installed)
+instead of a lookup per bill.
+
+Rates are held against one base currency (FX_BASE_CURRENCY); other
+currencies convert through it. Rows in fx_rates that do not have the
+base on either side are ignored.
+
+Load or update rates from a CSV file with a header row of
+date,base,quote,rate (rate = quote per 1 base):
+
+Usage:
+    python fx.py load <file.csv>
+"""
+
+import argparse
+import calendar
+import csv
+import math
+import os
+import re
+import threading
+import time
+from bisect import bisect_right
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Currency conversion configuration
+FX_CONFIG = {
+    'base': os.getenv('FX_BASE_CURRENCY', 'USD').upper(),
+    # A rate is used for at most this many days after its rate_date
+    # (covers weekends and holidays, when no rates are published)
+    'max_age_days': int(os.getenv('FX_MAX_AGE_DAYS', 7)),
+    # Seconds between checks of fx_rates for new rates, per process
+    'refresh': float(os.getenv('FX_REFRESH', 300)),
+}
+
+NAN = float('nan')
+
+# Batches smaller than this skip numpy, whose fixed cost per call outweighs
+# the per-row work on a page of bills
+VECTOR_MIN_BATCH = 256
+
+_CURRENCY_RE = re.compile(r'^[A-Z]{3}$')
+
+PRESENT_SQL = "SELECT to_regclass('fx_rates') IS NOT NULL"
+VERSION_SQL = 'SELECT COUNT(*), MAX(loaded_at) FROM fx_rates'
+RATES_SQL = 'SELECT rate_date, base_currency, quote_currency, rate FROM fx_rates'
+
+LOAD_SQL = '''
+    INSERT INTO fx_rates (base_currency, quote_currency, rate_date, rate)
+    VALUES %s
+    ON CONFLICT (base_currency, quote_currency, rate_date) DO UPDATE
+    SET rate = EXCLUDED.rate, loaded_at = CURRENT_TIMESTAMP
+    WHERE fx_rates.rate IS DISTINCT FROM EXCLUDED.rate
+'''
+
+
+def parse_currency(code):
+    """Upper-cased ISO 4217 code; raises ValueError"""
+    code = (code or '').strip().upper()
+    if not _CURRENCY_RE.match(code):
+        raise ValueError(f'Invalid currency code: {code!r}')
+    return code
+
+
+def bill_currency(code):
+    """A bill's currency as stored in fx_rates: NULL means USD, like the rest of the API"""
+    return (code or 'USD').strip().upper()
+
+
+class RateIndex:
+    """Rates per currency (units per 1 base) as step functions of the date"""
+
+    def __init__(self, rows=(), base=None, max_age_days=None, version=None):
+        self.base = base or FX_CONFIG['base']
+        self.max_age = FX_CONFIG['max_age_days'] if max_age_days is None else max_age_days
+        self.version = version
+        self.rows = 0
+        self.skipped = 0
+
+        series = {}
+        for rate_date, row_base, quote, rate in rows:
+            row_base, quote = row_base.upper(), quote.upper()
+            if row_base == self.base:
+                currency, per_base = quote, float(rate)
+            elif quote == self.base:
+                currency, per_base = row_base, 1 / float(rate)
+            else:
+                self.skipped += 1
+                continue
+            series.setdefault(currency, {})[rate_date.toordinal()] = per_base
+            self.rows += 1
+
+        # Lists for bisect on small batches, arrays for searchsorted on large ones
+        self._series = {}
+        self._arrays = {}
+        for currency, by_day in series.items():
+            days = sorted(by_day)
+            rates = [by_day[day] for day in days]
+            self._series[currency] = (days, rates)
+            if np is not None:
+                self._arrays[currency] = (np.array(days, dtype=np.int64), np.array(rates, dtype=np.float64))
+
+    def __bool__(self):
+        return bool(self._series)
+
+    def currencies(self):
+        return sorted(set(self._series) | {self.base})
+
+    def _rate(self, currency, day):
+        """Units of currency per base on day (an ordinal), or NAN"""
+        if currency == self.base:
+            return 1.0
+        series = self._series.get(currency)
+        if series is None:
+            return NAN
+        days, rates = series
+        i = bisect_right(days, day) - 1
+        if i < 0 or day - days[i] > self.max_age:
+            return NAN
+        return rates[i]
+
+    def _rates(self, currency, days):
+        """_rate for an array of days, in one searchsorted (numpy only)"""
+        if currency == self.base:
+            return np.ones(len(days))
+        series = self._arrays.get(currency)
+        if series is None:
+            return np.full(len(days), NAN)
+        series_days, rates = series
+        i = np.searchsorted(series_days, days, side='right') - 1
+        found = np.maximum(i, 0)
+        fresh = (i >= 0) & (days - series_days[found] <= self.max_age)
+        return np.where(fresh, rates[found], NAN)
+
+    def factors(self, currencies, days, target):
+        """
+        Multiplier taking an amount in currencies[i] (as stored on bills) on
+        days[i] (ordinals) to target; NAN where either rate is missing. A
+        list, or an array for batches of VECTOR_MIN_BATCH and more with numpy.
+        """
+        if np is None or len(days) < VECTOR_MIN_BATCH:
+            return self._factors_by_row(currencies, days, target)
+
+        # Group rows by currency: one searchsorted per currency, not per bill
+        groups = {currency: code for code, currency in enumerate(dict.fromkeys(currencies))}
+        codes = np.fromiter(map(groups.__getitem__, currencies), dtype=np.int64, count=len(days))
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(groups) + 1))
+
+        days = np.asarray(days, dtype=np.int64)
+        first = int(days.min())
+        span = int(days.max()) - first + 1
+        if span <= len(days):
+            # Fewer calendar days than rows: rate each day once, then gather
+            grid = np.arange(first, first + span)
+            offsets = days - first
+
+            def rates(currency, positions=slice(None)):
+                return self._rates(currency, grid)[offsets[positions]]
+        else:
+            def rates(currency, positions=slice(None)):
+                return self._rates(currency, days[positions])
+
+        factors = rates(target)
+        for currency, code in groups.items():
+            positions = order[bounds[code]:bounds[code + 1]]
+            currency = bill_currency(currency)
+            if currency == target:
+                factors[positions] = 1.0
+            else:
+                factors[positions] /= rates(currency, positions)
+        return factors
+
+    def _factors_by_row(self, currencies, days, target):
+        # One search per distinct (currency, day) in the batch
+        memo = {}
+        factors = []
+        for currency, day in zip(currencies, days):
+            factor = memo.get((currency, day))
+            if factor is None:
+                code = bill_currency(currency)
+                factor = 1.0 if code == target else self._rate(target, day) / self._rate(code, day)
+                memo[(currency, day)] = factor
+            factors.append(factor)
+        return factors
+
+    def convert(self, amounts, currencies, dates, target):
+        """amounts[i] (in currencies[i], on dates[i]) in target, rounded to cents; None without a rate"""
+        if np is None or len(amounts) < VECTOR_MIN_BATCH:
+            factors = self._factors_by_row(currencies, [d.toordinal() for d in dates], target)
+            return [
+                None if amount is None or math.isnan(factor) else round(float(amount) * factor, 2)
+                for amount, factor in zip(amounts, factors)
+            ]
+
+        days = np.fromiter(map(date.toordinal, dates), dtype=np.int64, count=len(dates))
+        values = np.round(np.array(amounts, dtype=np.float64) * self.factors(currencies, days, target), 2)
+        result = values.tolist()
+        for i in np.flatnonzero(np.isnan(values)).tolist():
+            result[i] = None
+        return result
+
+    def monthly_factors(self, currencies, months, target):
+        """
+        Multiplier for a month's total in currencies[i] (months[i] is its
+        first day): the mean over the days of that month that have rates.
+        NAN when none has.
+        """
+        lengths = [calendar.monthrange(m.year, m.month)[1] for m in months]
+        day_currencies = [c for c, n in zip(currencies, lengths) for _ in range(n)]
+        days = [m.toordinal() + k for m, n in zip(months, lengths) for k in range(n)]
+        daily = self.factors(day_currencies, days, target)
+
+        if isinstance(daily, list):
+            result = []
+            start = 0
+            for n in lengths:
+                known = [f for f in daily[start:start + n] if not math.isnan(f)]
+                result.append(sum(known) / len(known) if known else NAN)
+                start += n
+            return result
+
+        cells = np.repeat(np.arange(len(months)), lengths)
+        known = ~np.isnan(daily)
+        sums = np.bincount(cells, weights=np.where(known, daily, 0.0), minlength=len(months))
+        counts = np.bincount(cells, weights=known, minlength=len(months))
+        return np.divide(sums, counts, out=np.full(len(months), NAN), where=counts > 0).tolist()
+
+    def stats(self):
+        return {
+            'base': self.base,
+            'currencies': len(self.currencies()) if self._series else 0,
+            'rates': self.rows,
+            'skipped': self.skipped,
+            'vectorized': np is not None,
+        }
+
+
+class RateCache:
+    """The process's RateIndex, reloaded when fx_rates changes"""
+
+    def __init__(self, refresh=None):
+        self.refresh = FX_CONFIG['refresh'] if refresh is None else refresh
+        self.index = RateIndex()
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def due(self):
+        """Whether this caller should check fx_rates now (one caller per FX_REFRESH)"""
+        now = time.monotonic()
+        with self._lock:
+            if self._checked is not None and now - self._checked < self.refresh:
+                return False
+            self._checked = now
+            return True
+
+    def update(self, version, load_rows):
+        """Rebuild the index from load_rows() if version differs from the loaded one"""
+        version = tuple(version)
+        if version != self.index.version:
+            self.index = RateIndex(load_rows(), version=version)
+            print(f"Exchange rates loaded: {self.index.rows} rates for {len(self.index.currencies())} currencies")
+        return self.index
+
+    def get(self, conn):
+        """Current RateIndex, checked against fx_rates on conn (psycopg2) when due"""
+        if not self.due():
+            return self.index
+        with conn.cursor() as cursor:
+            cursor.execute(PRESENT_SQL)
+            if not cursor.fetchone()[0]:
+                return self.index
+            cursor.execute(VERSION_SQL)
+            version = cursor.fetchone()
+
+            def load_rows():
+                cursor.execute(RATES_SQL)
+                return cursor.fetchall()
+
+            return self.update(version, load_rows)
+
+    def stats(self):
+        return dict(self.index.stats(), refresh=self.refresh)
+
+
+rate_cache = RateCache()
+
+
+# ----------------------------------------
+# Loading
+# ----------------------------------------
+
+def read_rates(path):
+    """(base, quote, date, rate) tuples from a CSV file with a date,base,quote,rate header"""
+    with open(path, newline='', encoding='utf-8') as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                rate = float(row['rate'])
+                if not rate > 0:
+                    raise ValueError('rate must be positive')
+                yield (parse_currency(row['base']), parse_currency(row['quote']),
+                       date.fromisoformat(row['date'].strip()), row['rate'].strip())
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f'{path}, line {line}: {e}')
+
+
+def load(cursor, rows, page_size=5000):
+    """Upsert rate rows; returns rows inserted or changed. Caller commits."""
+    from psycopg2.extras import execute_values
+
+    changed = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == page_size:
+            execute_values(cursor, LOAD_SQL, batch, page_size=page_size)
+            changed += cursor.rowcount
+            batch = []
+    if batch:
+        execute_values(cursor, LOAD_SQL, batch, page_size=page_size)
+        changed += cursor.rowcount
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage exchange rates')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    load_parser = subparsers.add_parser('load', help='upsert rates from a CSV file (date,base,quote,rate)')
+    load_parser.add_argument('file')
+    args = parser.parse_args()
+
+    from app import db_pool
+
+    start = time.perf_counter()
+    with db_pool.connection() as conn:
+        with conn.cursor() as cursor:
+            changed = load(cursor, read_rates(args.file))
+        conn.commit()
+    print(f"Loaded {changed} new or changed rates in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Bill Scanner App - Production server configuration (Gunicorn)
+Read automatically by `gunicorn` when started from backend/:
+
+    gunicorn app:app
+    gunicorn app_pg8000:app
+
+The app is imported once in the master (preload) and workers fork from
+it, sharing its memory copy-on-write. Nothing in the app opens a
+connection or thread at import time, and post_fork below drops whatever a
+worker inherited anyway, so each worker starts its own DB pool, password
+process pool and image threads.
+
+Signals (to the master): HUP restarts workers gracefully with the new
+config; with preload on, new code needs USR2 (start a new master) then
+QUIT to the old one. TERM finishes in-flight requests, up to
+graceful_timeout.
+"""
+
+import multiprocessing
+import os
+import sys
+
+cpus = multiprocessing.cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', 5000)}")
+
+# Requests spend most of their time waiting on PostgreSQL (bcrypt runs on
+# its own process pool), so a few processes with threads go further than
+# many single-threaded ones. Each worker has its own DB pool: keep
+# workers * DB_POOL_MAX below PostgreSQL's max_connections, and
+# GUNICORN_THREADS at or below DB_POOL_MAX so threads do not queue for
+# connections.
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', cpus))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+
+# Seconds an idle keep-alive connection is held open. Behind a proxy that
+# reuses upstream connections, set this above the proxy's idle timeout.
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# A worker silent for this long is killed and replaced (exports stream, so
+# they keep the worker alive)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recycle workers now and then to cap slow memory growth; jitter keeps
+# them from restarting together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+
+# The worker heartbeat file lives in tmpfs so a slow disk cannot get
+# workers killed
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# Each worker starts its own bcrypt process pool; unless configured, split
+# the CPUs between workers rather than giving every worker all of them
+os.environ.setdefault('PASSWORD_WORKERS', str(max(cpus // max(workers, 1), 1)))
+
+
+def _app_modules():
+    return [sys.modules[name] for name in ('app', 'app_pg8000') if name in sys.modules]
+
+
+def post_fork(server, worker):
+    """Drop pools inherited from the master; they start fresh in this worker"""
+    import images
+    import passwords
+    import scheduler
+
+    for module in _app_modules():
+        module.db_pool.reset()
+        if hasattr(module, 'event_hub'):
+            module.event_hub.reset()
+    passwords.password_pool.reset()
+    images.image_workers.reset()
+    scheduler.reset_all()
+
+
+def post_worker_init(worker):
+    """Open DB_POOL_MIN connections before the worker takes requests, then set up caching and jobs"""
+    for module in _app_modules():
+        try:
+            module.db_pool.warm()
+        except Exception as e:
+            print(f"Worker {worker.pid}: could not pre-open DB connections: {e}")
+
+    # The in-process read cache cannot see other workers' invalidations
+    if 'cache' in sys.modules:
+        sys.modules['cache'].require_shared(workers)
+
+    # Background jobs (app.py only: their SQL is psycopg2's). Every worker
+    # runs them; advisory locks let one pass of each run at a time.
+    if 'app' in sys.modules:
+        import scheduler
+        scheduler.start_all(sys.modules['app'].db_pool)
+
+
+def worker_exit(server, worker):
+    """Stop background jobs and the change listener, let queued thumbnails finish and stop the bcrypt processes"""
+    import images
+    import passwords
+    import scheduler
+
+    scheduler.shutdown_all()
+    for module in _app_modules():
+        if hasattr(module, 'event_hub'):
+            module.event_hub.shutdown()
+    images.image_workers.shutdown()
+    passwords.password_pool.shutdown()
@@ -0,0 +1,274 @@
+"""
+Bill Scanner App - Bill Images
+Content-addressed image storage and background generation of the
+normalized ("processed") image and thumbnail recorded in bill_images
+
+Files are named after the SHA-256 of their bytes (ab/cd/abcd....jpg), so
+the same scan uploaded twice is stored once and a stored file never
+changes, which lets clients cache image URLs forever.
+"""
+
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Image configuration
+IMAGE_CONFIG = {
+    'storage_dir': os.getenv(
+        'IMAGE_STORAGE_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'storage', 'images'),
+    ),
+    'max_bytes': int(os.getenv('IMAGE_MAX_MB', 20)) * 1024 * 1024,
+}
+
+# Background worker configuration
+IMAGE_WORKER_CONFIG = {
+    # Threads generating derived images (Pillow releases the GIL while
+    # decoding and resizing)
+    'workers': int(os.getenv('IMAGE_WORKERS', 2)),
+    # Longest side, in pixels, of the normalized image and the thumbnail
+    'processed_size': int(os.getenv('IMAGE_PROCESSED_SIZE', 2000)),
+    'thumbnail_size': int(os.getenv('IMAGE_THUMBNAIL_SIZE', 320)),
+}
+
+# Leading bytes -> file extension for the formats we accept
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+)
+
+_PATH_RE = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.(jpg|png|webp)$')
+
+
+class ImageTooLarge(Exception):
+    """Raised when an upload exceeds IMAGE_MAX_MB"""
+
+
+class UnsupportedImage(Exception):
+    """Raised when an upload is not a JPEG, PNG or WebP image"""
+
+
+def sniff_extension(head):
+    """File extension for an image's first bytes, or None"""
+    for signature, ext in _SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+# ----------------------------------------
+# Storage
+# ----------------------------------------
+
+class UploadFile:
+    """
+    Writable temp file that hashes and counts bytes as they arrive.
+
+    Handed to the multipart parser as its stream factory, so an upload goes
+    straight from the socket to disk in chunks and is never held in memory.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._file = tempfile.NamedTemporaryFile(dir=store.tmp_dir, delete=False)
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self._store.max_bytes:
+            raise ImageTooLarge(f'Image exceeds {self._store.max_bytes // (1024 * 1024)} MB')
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    @property
+    def name(self):
+        return self._file.name
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def finish(self):
+        """Flush the upload to disk and close it, ready to be moved into place"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.unlink(self._file.name)
+        except FileNotFoundError:
+            pass
+
+
+class ImageStore:
+    """Content-addressed files under a root directory"""
+
+    def __init__(self, storage_dir, max_bytes):
+        self.root = storage_dir
+        self.max_bytes = max_bytes
+        self.tmp_dir = os.path.join(storage_dir, '.tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def upload_file(self):
+        return UploadFile(self)
+
+    def commit(self, upload):
+        """Move a finished UploadFile into place; returns its stored path"""
+        try:
+            upload.seek(0)
+            ext = sniff_extension(upload.read(16))
+            if ext is None:
+                raise UnsupportedImage('Only JPEG, PNG and WebP images are supported')
+            upload.finish()
+            path = self._place(upload.hexdigest(), ext, upload.name)
+        except BaseException:
+            upload.discard()
+            raise
+        return {'image_path': path, 'sha256': upload.hexdigest(), 'file_size': upload.size}
+
+    def save_bytes(self, data, ext):
+        """Store generated bytes (derived images); returns the stored path"""
+        with tempfile.NamedTemporaryFile(dir=self.tmp_dir, delete=False) as tmp:
+            tmp.write(data)
+        return self._place(hashlib.sha256(data).hexdigest(), ext, tmp.name)
+
+    def absolute(self, image_path):
+        """Filesystem path for a stored path (raises ValueError for anything else)"""
+        if not _PATH_RE.match(image_path or ''):
+            raise ValueError('Invalid image path')
+        return os.path.join(self.root, *image_path.split('/'))
+
+    def _place(self, digest, ext, tmp_name):
+        image_path = f'{digest[:2]}/{digest[2:4]}/{digest}.{ext}'
+        target = os.path.join(self.root, digest[:2], digest[2:4], f'{digest}.{ext}')
+        if os.path.exists(target):
+            # Same bytes already stored
+            os.unlink(tmp_name)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_name, target)
+        return image_path
+
+
+# ----------------------------------------
+# Derived images
+# ----------------------------------------
+
+def _encode_jpeg(img, size, quality):
+    copy = img.copy()
+    copy.thumbnail((size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    copy.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue(), copy.size
+
+
+def derive(store, image_path, processed_size=2000, thumbnail_size=320):
+    """
+    Generate the normalized image and thumbnail for a stored original.
+
+    Returns {'original': (width, height), 'processed': {...}, 'thumbnail': {...}}
+    where each derived entry has image_path, file_size, width and height.
+    """
+    if Image is None:
+        raise RuntimeError('Pillow is not installed')
+
+    with Image.open(store.absolute(image_path)) as img:
+        original_size = img.size
+        # Let the JPEG decoder downscale by powers of two while decoding:
+        # far cheaper than decoding a full phone photo and resizing it
+        img.draft('RGB', (processed_size, processed_size))
+        img = ImageOps.exif_transpose(img).convert('RGB')
+
+    derived = {'original': original_size}
+    for image_type, size, quality in (('processed', processed_size, 85),
+                                      ('thumbnail', thumbnail_size, 75)):
+        data, (width, height) = _encode_jpeg(img, size, quality)
+        derived[image_type] = {
+            'image_path': store.save_bytes(data, 'jpg'),
+            'file_size': len(data),
+            'width': width,
+            'height': height,
+        }
+    return derived
+
+
+# ----------------------------------------
+# Worker pool
+# ----------------------------------------
+
+class ImageWorkerPool:
+    """Background threads for derived images, with counters for /api/health"""
+
+    def __init__(self, workers=2, processed_size=2000, thumbnail_size=320):
+        self.workers = workers
+        self.processed_size = processed_size
+        self.thumbnail_size = thumbnail_size
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._stats = {'queued': 0, 'processed': 0, 'failed': 0, 'seconds': 0.0}
+
+    def submit(self, fn, *args):
+        """Run fn(*args) in the background; failures are logged and counted"""
+        with self._lock:
+            self._stats['queued'] += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(self.workers, 1), thread_name_prefix='images')
+            executor = self._executor
+        executor.submit(self._run, fn, *args)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(workers=self.workers, pillow=Image is not None)
+        return stats
+
+    def reset(self):
+        """Forget the executor inherited across fork; a new one starts lazily"""
+        with self._lock:
+            self._executor = None
+            self._stats['queued'] = 0
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _run(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            fn(*args)
+            outcome = 'processed'
+        except Exception as e:
+            print(f"Image worker error: {e}")
+            outcome = 'failed'
+        with self._lock:
+            self._stats['queued'] -= 1
+            self._stats[outcome] += 1
+            self._stats['seconds'] += time.perf_counter() - start
+
+
+image_store = ImageStore(**IMAGE_CONFIG)
+image_workers = ImageWorkerPool(**IMAGE_WORKER_CONFIG)
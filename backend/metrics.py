@@ -0,0 +1,404 @@
+"""
+Bill Scanner App - Request Metrics
+Per-route latency histograms with the request time split into database,
+connection-pool wait, bcrypt and Python time, plus queries per request,
+served in Prometheus text format at GET /api/metrics. Statements slower
+than SLOW_QUERY_MS are logged with their SQL and the shape (not the
+values) of their parameters.
+
+Counters live in the serving process: with several Gunicorn workers each
+scrape sees the worker that answered it (see README).
+"""
+
+import contextvars
+import os
+import re
+import threading
+import time
+
+# Metrics configuration
+METRICS_CONFIG = {
+    # Set METRICS_ENABLED=0 to skip all instrumentation
+    'enabled': os.getenv('METRICS_ENABLED', '1') != '0',
+    # Log statements slower than this many milliseconds (0 = off)
+    'slow_query_ms': float(os.getenv('SLOW_QUERY_MS', 0)),
+}
+
+# Latency buckets (seconds) and queries-per-request buckets
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+# ----------------------------------------
+# Registry
+# ----------------------------------------
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in values:
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._values = {}  # labels -> [per-bucket counts, sum, count]
+
+    def observe(self, value, *labels):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, ([*e[0]], e[1], e[2])) for labels, e in self._values.items())
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    """Metrics plus collectors that report point-in-time values at scrape time"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=SECONDS_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """collect() returns [(name, help, type, [(labels dict, value), ...]), ...]"""
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+                continue
+            for name, help_text, kind, samples in families:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f'{name}{_labels(labels.keys(), labels.values())} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+ROUTE_LABELS = ('route', 'method')
+
+request_count = registry.counter(
+    'billscanner_http_requests_total', 'Requests handled', ('route', 'method', 'status'))
+request_seconds = registry.histogram(
+    'billscanner_http_request_duration_seconds', 'Request latency', ROUTE_LABELS)
+request_db_seconds = registry.histogram(
+    'billscanner_http_request_db_seconds', 'Time spent executing SQL per request', ROUTE_LABELS)
+request_python_seconds = registry.histogram(
+    'billscanner_http_request_python_seconds',
+    'Request time outside SQL, pool wait and bcrypt', ROUTE_LABELS)
+request_queries = registry.histogram(
+    'billscanner_http_request_queries', 'SQL statements executed per request', ROUTE_LABELS, QUERY_BUCKETS)
+pool_wait_seconds = registry.histogram(
+    'billscanner_db_pool_wait_seconds', 'Time to check a connection out of the pool (incl. connecting)')
+password_seconds = registry.histogram(
+    'billscanner_password_seconds', 'bcrypt hash/verify time including queueing', ('operation',))
+slow_query_count = registry.counter(
+    'billscanner_db_slow_queries_total', 'Statements slower than SLOW_QUERY_MS', ('route',))
+auth_failure_count = registry.counter(
+    'billscanner_auth_failures_total', 'Requests refused by auth_required', ('reason',))
+rate_limited_count = registry.counter(
+    'billscanner_login_rate_limited_total', 'Login attempts refused by the rate limiter', ('scope',))
+
+
+# ----------------------------------------
+# Per-request accounting
+# ----------------------------------------
+
+class RequestStats:
+    __slots__ = ('start', 'route', 'db_seconds', 'queries', 'pool_wait_seconds', 'password_seconds')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.route = None
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.pool_wait_seconds = 0.0
+        self.password_seconds = 0.0
+
+
+_current = contextvars.ContextVar('billscanner_request_stats', default=None)
+
+
+def begin_request():
+    if METRICS_CONFIG['enabled']:
+        _current.set(RequestStats())
+
+
+def end_request(route, method, status):
+    """Record the finished request; route is the URL rule, never the raw path"""
+    stats = _current.get()
+    if stats is None:
+        return
+    _current.set(None)
+    elapsed = time.perf_counter() - stats.start
+    python_seconds = max(elapsed - stats.db_seconds - stats.pool_wait_seconds - stats.password_seconds, 0.0)
+
+    request_count.inc(route, method, str(status))
+    request_seconds.observe(elapsed, route, method)
+    request_db_seconds.observe(stats.db_seconds, route, method)
+    request_python_seconds.observe(python_seconds, route, method)
+    request_queries.observe(stats.queries, route, method)
+
+
+def set_route(route):
+    stats = _current.get()
+    if stats is not None:
+        stats.route = route
+
+
+def record_query(seconds, sql, params, many=False):
+    stats = _current.get()
+    if stats is not None:
+        stats.db_seconds += seconds
+        stats.queries += 1
+
+    threshold = METRICS_CONFIG['slow_query_ms']
+    if threshold and seconds * 1000 >= threshold:
+        route = stats.route if stats is not None and stats.route else '-'
+        slow_query_count.inc(route)
+        if isinstance(sql, bytes):
+            sql = sql.decode('utf-8', 'replace')
+        statement = _WHITESPACE.sub(' ', str(sql)).strip()[:2000]
+        print(f"Slow query ({seconds * 1000:.1f} ms, {route}): {statement} params={param_shape(params, many)}")
+
+
+def record_pool_wait(seconds):
+    if not METRICS_CONFIG['enabled']:
+        return
+    pool_wait_seconds.observe(seconds)
+    stats = _current.get()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+
+
+def record_password(operation, seconds):
+    if not METRICS_CONFIG['enabled']:
+        return
+    password_seconds.observe(seconds, operation)
+    stats = _current.get()
+    if stats is not None:
+        stats.password_seconds += seconds
+
+
+def record_auth_failure(reason):
+    if METRICS_CONFIG['enabled']:
+        auth_failure_count.inc(reason)
+
+
+def record_rate_limited(scope):
+    if METRICS_CONFIG['enabled']:
+        rate_limited_count.inc(scope)
+
+
+def param_shape(params, many=False):
+    """Types of the parameters, never their values (they may be passwords or PII)"""
+    if many:
+        rows = params if isinstance(params, (list, tuple)) else list(params)
+        return f'{len(rows)} x {param_shape(rows[0]) if rows else "()"}'
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in params.items()) + '}'
+    return '(' + ', '.join(type(v).__name__ for v in params) + ')'
+
+
+# ----------------------------------------
+# DB-API instrumentation
+# ----------------------------------------
+
+class TimedCursor:
+    """Wraps a DB-API cursor, timing execute/executemany"""
+
+    __slots__ = ('_cursor',)
+
+    def __init__(self, cursor):
+        object.__setattr__(self, '_cursor', cursor)
+
+    def execute(self, sql, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, *args, **kwargs)
+        finally:
+            record_query(time.perf_counter() - start, sql, args[0] if args else None)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, seq_of_params)
+        finally:
+            record_query(time.perf_counter() - start, sql, seq_of_params, many=True)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+
+class TimedConnection:
+    """Wraps a DB-API connection so every cursor it opens is a TimedCursor"""
+
+    __slots__ = ('_conn',)
+
+    def __init__(self, conn):
+        object.__setattr__(self, '_conn', conn)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+
+def instrument_connection(conn):
+    """Wrap a new connection for query timing (no-op when metrics are off)"""
+    return TimedConnection(conn) if METRICS_CONFIG['enabled'] else conn
+
+
+# ----------------------------------------
+# Flask integration
+# ----------------------------------------
+
+def init_app(app, pool=None, password_pool=None):
+    """Install request hooks and GET /api/metrics on a Flask app"""
+    from flask import Response, request
+
+    if pool is not None:
+        registry.add_collector(lambda: _pool_families(pool))
+    if password_pool is not None:
+        registry.add_collector(lambda: _password_families(password_pool))
+
+    if METRICS_CONFIG['enabled']:
+        @app.before_request
+        def _metrics_begin():
+            begin_request()
+            set_route(request.url_rule.rule if request.url_rule else 'unmatched')
+
+        @app.after_request
+        def _metrics_end(response):
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            end_request(route, request.method, response.status_code)
+            return response
+
+    def metrics_endpoint():
+        """Prometheus text exposition of this process's metrics"""
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/api/metrics', 'metrics', metrics_endpoint, methods=['GET'])
+
+
+def _pool_families(pool):
+    stats = pool.stats()
+    return [
+        ('billscanner_db_pool_connections', 'Open pooled connections by state', 'gauge', [
+            ({'state': 'idle'}, stats['idle']),
+            ({'state': 'in_use'}, stats['in_use']),
+        ]),
+        ('billscanner_db_pool_max_connections', 'Pool size limit', 'gauge', [({}, stats['max_size'])]),
+    ]
+
+
+def _password_families(password_pool):
+    stats = password_pool.stats()
+    return [
+        ('billscanner_password_in_flight', 'bcrypt jobs running or queued', 'gauge', [({}, stats['in_flight'])]),
+        ('billscanner_password_rejected_total', 'bcrypt jobs refused with 503', 'counter',
+         [({}, stats['rejected_count'])]),
+    ]
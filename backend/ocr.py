@@ -0,0 +1,327 @@
+"""
+Bill Scanner App - Server-side OCR
+Postgres-backed OCR job queue (see database/14_ocr_jobs.sql) and the
+worker processes that drain it with Tesseract, writing bills.ocr_text.
+
+Jobs are claimed with FOR UPDATE SKIP LOCKED in a short transaction of
+their own, so any number of workers can poll the queue without blocking
+each other, and OCR itself never holds a transaction open. A failed job is
+retried with exponential backoff; a job whose worker died is handed out
+again once its lease expires. A worker only closes a job it still holds:
+if its lease expired and the job was reaped (and perhaps claimed by
+another worker), its result is dropped.
+
+Usage:
+    python ocr.py work [--workers <n>]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import time
+
+from psycopg2.extras import Json, RealDictCursor
+
+import images
+import receipt_extraction
+
+try:
+    import pytesseract
+    from PIL import Image, ImageOps
+except ImportError:
+    pytesseract = None
+
+# OCR configuration
+OCR_CONFIG = {
+    # Worker processes started by `python ocr.py work` (one OCR at a time each)
+    'workers': int(os.getenv('OCR_WORKERS', os.cpu_count() or 2)),
+    # Tesseract language(s), e.g. 'eng' or 'eng+deu'
+    'lang': os.getenv('OCR_LANG', 'eng'),
+    # Seconds before a single Tesseract run is killed
+    'timeout': float(os.getenv('OCR_TIMEOUT', 60)),
+    # Attempts per job before it is marked failed
+    'max_attempts': int(os.getenv('OCR_MAX_ATTEMPTS', 5)),
+    # Retry delay: OCR_BACKOFF * 2^(attempt-1) seconds, capped, with jitter
+    'backoff': float(os.getenv('OCR_BACKOFF', 5)),
+    'backoff_max': float(os.getenv('OCR_BACKOFF_MAX', 900)),
+    # Seconds an idle worker sleeps between polls
+    'poll_interval': float(os.getenv('OCR_POLL_INTERVAL', 1)),
+    # Seconds after which a running job is presumed abandoned
+    'lease': float(os.getenv('OCR_LEASE', 300)),
+}
+
+
+# ----------------------------------------
+# Queue
+# ----------------------------------------
+
+def enqueue(cursor, bill_id, image_id, image_path):
+    """Queue OCR for an image; returns job_id. Caller commits (with the upload)."""
+    cursor.execute(
+        '''
+        INSERT INTO ocr_jobs (bill_id, image_id, image_path, max_attempts)
+        VALUES (%s, %s, %s, %s)
+        RETURNING job_id
+        ''',
+        (bill_id, image_id, image_path, OCR_CONFIG['max_attempts'])
+    )
+    return cursor.fetchone()['job_id']
+
+
+def claim(cursor, worker_id):
+    """Lock the next runnable job for this worker, or return None. Caller commits."""
+    cursor.execute(
+        '''
+        UPDATE ocr_jobs
+        SET status = 'running',
+            attempts = attempts + 1,
+            locked_by = %s,
+            locked_at = CURRENT_TIMESTAMP,
+            queue_seconds = EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - created_at)
+        WHERE job_id = (
+            SELECT job_id FROM ocr_jobs
+            WHERE status = 'queued' AND run_after <= CURRENT_TIMESTAMP
+            ORDER BY run_after, job_id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING job_id, bill_id, image_path, attempts, max_attempts, locked_by,
+                  (SELECT s.currency FROM bills b JOIN user_settings s ON s.user_id = b.user_id
+                   WHERE b.bill_id = ocr_jobs.bill_id) AS default_currency
+        ''',
+        (worker_id,)
+    )
+    return cursor.fetchone()
+
+
+def complete(cursor, job, text, ocr_seconds, extracted=None):
+    """
+    Close the job and store the recognized text on the bill, keeping the
+    extracted receipt fields on the job for clients to pre-fill from.
+    Returns False, writing nothing, if the job's lease was lost. Caller commits.
+    """
+    cursor.execute(
+        '''
+        UPDATE ocr_jobs
+        SET status = 'done', ocr_seconds = %s, text_length = %s, extracted = %s,
+            last_error = NULL, locked_by = NULL, finished_at = CURRENT_TIMESTAMP
+        WHERE job_id = %s AND locked_by = %s AND status = 'running'
+        ''',
+        (ocr_seconds, len(text), Json(extracted) if extracted else None, job['job_id'], job['locked_by'])
+    )
+    if cursor.rowcount == 0:
+        return False
+    cursor.execute('UPDATE bills SET ocr_text = %s WHERE bill_id = %s', (text, job['bill_id']))
+    return True
+
+
+def backoff_seconds(attempts):
+    """Delay before retry number `attempts` (full jitter over the upper half)"""
+    delay = min(OCR_CONFIG['backoff'] * 2 ** (attempts - 1), OCR_CONFIG['backoff_max'])
+    return delay * random.uniform(0.5, 1.0)
+
+
+def fail(cursor, job, error, ocr_seconds=None):
+    """
+    Requeue with backoff, or mark failed after max_attempts; returns whether
+    it was final, or None if the job's lease was lost. Caller commits.
+    """
+    final = job['attempts'] >= job['max_attempts']
+    cursor.execute(
+        '''
+        UPDATE ocr_jobs
+        SET status = %s,
+            run_after = CURRENT_TIMESTAMP + make_interval(secs => %s),
+            last_error = %s, ocr_seconds = %s, locked_by = NULL,
+            finished_at = CASE WHEN %s THEN CURRENT_TIMESTAMP END
+        WHERE job_id = %s AND locked_by = %s AND status = 'running'
+        ''',
+        ('failed' if final else 'queued', 0 if final else backoff_seconds(job['attempts']),
+         str(error)[:2000], ocr_seconds, final, job['job_id'], job['locked_by'])
+    )
+    return final if cursor.rowcount else None
+
+
+def reap(cursor):
+    """Release jobs whose lease expired (worker crashed or was killed). Caller commits."""
+    cursor.execute(
+        '''
+        UPDATE ocr_jobs
+        SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+            run_after = CURRENT_TIMESTAMP,
+            last_error = 'Lease expired (worker ' || COALESCE(locked_by, '?') || ' lost)',
+            locked_by = NULL,
+            finished_at = CASE WHEN attempts >= max_attempts THEN CURRENT_TIMESTAMP END
+        WHERE status = 'running'
+          AND locked_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+        ''',
+        (OCR_CONFIG['lease'],)
+    )
+    return cursor.rowcount
+
+
+def queue_status(cursor, window_minutes=60):
+    """Queue depth plus throughput and timing over the last `window_minutes`"""
+    cursor.execute(
+        '''
+        SELECT
+            (SELECT COUNT(*) FROM ocr_jobs WHERE status = 'queued') AS queued,
+            (SELECT COUNT(*) FROM ocr_jobs WHERE status = 'running') AS running,
+            (SELECT EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - MIN(run_after))
+             FROM ocr_jobs
+             WHERE status = 'queued' AND run_after <= CURRENT_TIMESTAMP) AS oldest_wait_seconds,
+            COUNT(*) FILTER (WHERE status = 'done') AS done,
+            COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+            AVG(queue_seconds) FILTER (WHERE status = 'done') AS avg_queue_seconds,
+            AVG(ocr_seconds) FILTER (WHERE status = 'done') AS avg_ocr_seconds,
+            percentile_cont(0.95) WITHIN GROUP (ORDER BY ocr_seconds)
+                FILTER (WHERE status = 'done') AS p95_ocr_seconds
+        FROM ocr_jobs
+        WHERE finished_at >= CURRENT_TIMESTAMP - make_interval(mins => %s)
+        ''',
+        (window_minutes,)
+    )
+    row = cursor.fetchone()
+    status = {k: (float(v) if v is not None and k.endswith('seconds') else v) for k, v in row.items()}
+    status['window_minutes'] = window_minutes
+    status['jobs_per_minute'] = round(status['done'] / window_minutes, 2)
+    return status
+
+
+def latest_job(cursor, bill_id):
+    """Most recent OCR job for a bill, or None"""
+    cursor.execute(
+        '''
+        SELECT job_id, bill_id, image_id, status, attempts, max_attempts, run_after,
+               last_error, queue_seconds, ocr_seconds, text_length, extracted,
+               created_at, finished_at
+        FROM ocr_jobs
+        WHERE bill_id = %s
+        ORDER BY job_id DESC
+        LIMIT 1
+        ''',
+        (bill_id,)
+    )
+    return cursor.fetchone()
+
+
+# ----------------------------------------
+# Engine
+# ----------------------------------------
+
+def recognize(path, lang=None, timeout=None):
+    """Run Tesseract on an image file and return the text"""
+    if pytesseract is None:
+        raise RuntimeError('pytesseract (and the tesseract binary) are required for OCR')
+    with Image.open(path) as img:
+        # Tesseract binarizes internally; grayscale just cuts the bytes it is sent
+        img = ImageOps.exif_transpose(img).convert('L')
+        return pytesseract.image_to_string(
+            img,
+            lang=lang or OCR_CONFIG['lang'],
+            timeout=timeout or OCR_CONFIG['timeout'],
+        ).strip()
+
+
+# ----------------------------------------
+# Worker
+# ----------------------------------------
+
+def run_one(conn, worker_id):
+    """Claim and process one job; returns False when the queue is empty"""
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        job = claim(cursor, worker_id)
+        conn.commit()
+    if job is None:
+        return False
+
+    start = time.perf_counter()
+    try:
+        text = recognize(images.image_store.absolute(job['image_path']))
+        extracted = receipt_extraction.extract(text, default_currency=job['default_currency'])
+    except Exception as e:
+        # Fail now rather than leave the job 'running' until its lease expires
+        elapsed = time.perf_counter() - start
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            final = fail(cursor, job, e, elapsed)
+            conn.commit()
+        if final is None:
+            print(f"OCR job {job['job_id']} lease lost; dropping its error: {e}")
+        else:
+            print(f"OCR job {job['job_id']} attempt {job['attempts']} failed"
+                  f"{' permanently' if final else ''}: {e}")
+        return True
+
+    elapsed = time.perf_counter() - start
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        done = complete(cursor, job, text, elapsed, extracted)
+        conn.commit()
+    if done:
+        print(f"OCR job {job['job_id']} done in {elapsed:.2f}s ({len(text)} chars)")
+    else:
+        print(f"OCR job {job['job_id']} lease lost after {elapsed:.2f}s; result dropped")
+    return True
+
+
+def work(stop, index):
+    """Worker process main loop: drain the queue, sleep when it is empty"""
+    from app import db_pool
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl+C
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    last_reap = 0.0
+
+    while not stop.is_set():
+        try:
+            with db_pool.connection() as conn:
+                if time.monotonic() - last_reap > OCR_CONFIG['lease'] / 2:
+                    with conn.cursor() as cursor:
+                        reaped = reap(cursor)
+                        conn.commit()
+                    if reaped:
+                        print(f"OCR worker {index}: released {reaped} expired jobs")
+                    last_reap = time.monotonic()
+
+                busy = run_one(conn, worker_id)
+        except Exception as e:
+            print(f"OCR worker {index} error: {e}")
+            busy = False
+        if not busy:
+            stop.wait(OCR_CONFIG['poll_interval'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the OCR job queue workers')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    work_parser = subparsers.add_parser('work', help='drain ocr_jobs until interrupted')
+    work_parser.add_argument('--workers', type=int, default=OCR_CONFIG['workers'],
+                             help='worker processes (default OCR_WORKERS)')
+    args = parser.parse_args()
+
+    if pytesseract is None:
+        parser.error('pytesseract and Pillow must be installed (plus the tesseract binary)')
+
+    context = multiprocessing.get_context('spawn')
+    stop = context.Event()
+    processes = [context.Process(target=work, args=(stop, i), name=f'ocr-{i}')
+                 for i in range(args.workers)]
+    for process in processes:
+        process.start()
+    print(f"OCR: {args.workers} workers started (lang={OCR_CONFIG['lang']})")
+
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        while not stop.is_set():
+            stop.wait(1)
+    except KeyboardInterrupt:
+        stop.set()
+    print("OCR: stopping after current jobs")
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
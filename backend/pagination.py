@@ -0,0 +1,39 @@
+"""
+Bill Scanner App - Keyset Pagination Helpers
+Opaque cursors for seek-based ("keyset") pagination
+"""
+
+import base64
+import json
+
+# Upper bound on page size for list endpoints
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue"""
+
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row on a page as an opaque token"""
+    payload = [v.isoformat() if hasattr(v, 'isoformat') else str(v) for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Decode a token produced by encode_cursor into `size` string values"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise InvalidCursor('Malformed cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Malformed cursor')
+    return values
+
+
+def page_size(raw, default=50):
+    """Parse a `limit` query argument, clamped to 1..MAX_PAGE_SIZE"""
+    limit = int(raw) if raw not in (None, '') else default
+    return max(1, min(limit, MAX_PAGE_SIZE))
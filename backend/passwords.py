@@ -0,0 +1,199 @@
+"""
+Bill Scanner App - Password Hashing
+bcrypt hashing and verification on a bounded process pool, so password
+work never runs on (or starves) the request threads
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import bcrypt
+
+import metrics
+
+# Password pool configuration
+PASSWORD_CONFIG = {
+    # bcrypt cost factor for new hashes; stored hashes with a different cost
+    # are rehashed transparently on the next successful login
+    'rounds': int(os.getenv('BCRYPT_ROUNDS', 12)),
+    # Worker processes (0 = hash inline on the calling thread)
+    'workers': int(os.getenv('PASSWORD_WORKERS', os.cpu_count() or 2)),
+    # Jobs allowed to wait for a worker before new requests get a 503
+    'queue_size': int(os.getenv('PASSWORD_QUEUE_SIZE', 32)),
+    # Seconds to wait for a hash before giving up
+    'timeout': float(os.getenv('PASSWORD_TIMEOUT', 10)),
+    # Retry-After hint (seconds) sent with 503 responses
+    'retry_after': int(os.getenv('PASSWORD_RETRY_AFTER', 1)),
+}
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the password pool queue is full"""
+
+    def __init__(self, retry_after):
+        super().__init__('Password hashing capacity exhausted, retry later')
+        self.retry_after = retry_after
+
+
+# ----------------------------------------
+# Worker functions (run in the pool processes)
+# ----------------------------------------
+
+def _hashpw(password, rounds):
+    start = time.perf_counter()
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds))
+    return hashed.decode('utf-8'), time.perf_counter() - start
+
+
+def _checkpw(password, hashed):
+    start = time.perf_counter()
+    try:
+        valid = bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except Exception as e:
+        print(f"Password verification error: {e}")
+        valid = False
+    return valid, time.perf_counter() - start
+
+
+# ----------------------------------------
+# Pool
+# ----------------------------------------
+
+class PasswordPool:
+    """Process pool with an admission limit of workers + queue_size jobs"""
+
+    def __init__(self, rounds=12, workers=2, queue_size=32, timeout=10.0, retry_after=1):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + queue_size)
+        self._in_flight = 0
+        self._stats = {
+            'hash_count': 0,
+            'verify_count': 0,
+            'rejected_count': 0,
+            'cpu_seconds': 0.0,
+            'wait_seconds': 0.0,
+            'max_seconds': 0.0,
+        }
+
+    def hash(self, password):
+        return self._run('hash_count', _hashpw, password, self.rounds)
+
+    def verify(self, password, hashed):
+        return self._run('verify_count', _checkpw, password, hashed)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+            stats['queue_depth'] = max(self._in_flight - self.workers, 0)
+        stats.update(workers=self.workers, queue_size=self.queue_size, rounds=self.rounds)
+        return stats
+
+    def reset(self):
+        """Forget the executor inherited across fork; a new one starts lazily"""
+        with self._lock:
+            self._executor = None
+            self._in_flight = 0
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1) + self.queue_size)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: forking a threaded server can copy held locks
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._executor
+
+    def _run(self, counter, fn, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected_count'] += 1
+            raise PasswordPoolBusy(self.retry_after)
+
+        with self._lock:
+            self._in_flight += 1
+
+        def release(_future=None):
+            with self._lock:
+                self._in_flight -= 1
+            slots.release()
+
+        start = time.perf_counter()
+        if self.workers <= 0:
+            try:
+                result, cpu = fn(*args)
+            finally:
+                release()
+        else:
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except Exception:
+                release()
+                raise
+            # The slot is held until the job is done or cancelled, not just
+            # until we stop waiting: a timed-out bcrypt call keeps its worker
+            future.add_done_callback(release)
+            try:
+                result, cpu = future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel()
+                raise PasswordPoolBusy(self.retry_after)
+        elapsed = time.perf_counter() - start
+
+        metrics.record_password(counter.split('_')[0], elapsed)
+        with self._lock:
+            self._stats[counter] += 1
+            self._stats['cpu_seconds'] += cpu
+            self._stats['wait_seconds'] += elapsed - cpu
+            self._stats['max_seconds'] = max(self._stats['max_seconds'], elapsed)
+        return result
+
+
+password_pool = PasswordPool(**PASSWORD_CONFIG)
+
+
+# ----------------------------------------
+# Public helpers
+# ----------------------------------------
+
+def hash_password(password: str) -> str:
+    """Hash password using bcrypt (raises PasswordPoolBusy when saturated)"""
+    return password_pool.hash(password)
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    """Verify password against hash (raises PasswordPoolBusy when saturated)"""
+    return password_pool.verify(password, hashed)
+
+
+def hash_cost(hashed: str):
+    """Cost factor encoded in a bcrypt hash ('$2b$12$...' -> 12), or None"""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True when a stored hash was made with a different cost than configured"""
+    return hash_cost(hashed) != password_pool.rounds
@@ -0,0 +1,303 @@
+"""
+Bill Scanner App - Login Rate Limiting
+Sliding-window limits on login attempts, checked before the users query
+and bcrypt, so a credential-stuffing burst is turned away cheaply instead
+of queueing on the password pool.
+
+Two limits per window:
+- per client IP: every attempt counts
+- per account (the email/username tried): only failed attempts count, so
+  a user signing in on several devices is not locked out
+
+check() reserves the attempt against both limits in one atomic step (under
+a lock, or in one Lua script on Redis), so parallel attempts cannot all
+pass a limit before any of them is counted. The account's reservation
+stands as a failure unless the login succeeds (record_success clears the
+account's count) or ends without checking the password (release).
+
+Each limit is a sliding-window counter: the previous fixed window's count,
+weighted by how much of it still overlaps the sliding window, plus the
+current window's count. It is O(1) per key and stores the same two numbers
+in either backend. Counts live in process memory by default (per worker);
+set RATE_LIMIT_REDIS_URL (or CACHE_REDIS_URL) to share them between
+workers and hosts.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# Rate limit configuration
+RATE_LIMIT_CONFIG = {
+    'enabled': os.getenv('LOGIN_RATE_LIMIT', '1') != '0',
+    'window': float(os.getenv('LOGIN_RATE_WINDOW', 300)),
+    # Attempts per client IP per window
+    'per_ip': int(os.getenv('LOGIN_RATE_PER_IP', 30)),
+    # Failed attempts per account per window
+    'per_account': int(os.getenv('LOGIN_RATE_PER_ACCOUNT', 5)),
+    # Keys tracked by the in-process store (least recently used are dropped)
+    'max_keys': int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000)),
+    # e.g. redis://localhost:6379/1 (requires the `redis` package)
+    'redis_url': os.getenv('RATE_LIMIT_REDIS_URL', os.getenv('CACHE_REDIS_URL', '')),
+    # Reverse proxies in front of the app that append to X-Forwarded-For;
+    # 0 uses the socket address
+    'proxy_hops': int(os.getenv('RATE_LIMIT_PROXY_HOPS', 0)),
+}
+
+
+class RateLimited(Exception):
+    """Raised when a limit is exhausted"""
+
+    def __init__(self, scope, retry_after):
+        super().__init__(f'Too many login attempts ({scope})')
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+# ----------------------------------------
+# Stores
+# ----------------------------------------
+
+class MemoryStore:
+    """Per-process counters: key -> [window index, previous count, current count]"""
+
+    backend = 'memory'
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._windows = OrderedDict()
+
+    def _roll(self, key, index):
+        entry = self._windows.get(key)
+        if entry is None:
+            entry = [index, 0, 0]
+        elif entry[0] != index:
+            # Moved on: the current window becomes the previous one, unless
+            # more than one window passed
+            entry[1] = entry[2] if entry[0] == index - 1 else 0
+            entry[2] = 0
+            entry[0] = index
+        return entry
+
+    def reserve(self, limits, index, overlap):
+        """
+        Count one attempt against every (key, limit) in window `index`, or
+        against none if a limit is exhausted. Returns None, or (position of
+        the exhausted limit, previous count, current count).
+        """
+        with self._lock:
+            entries = [self._roll(key, index) for key, _ in limits]
+            for position, ((_, limit), entry) in enumerate(zip(limits, entries)):
+                if entry[1] * overlap + entry[2] >= limit:
+                    return position, entry[1], entry[2]
+            for (key, _), entry in zip(limits, entries):
+                entry[2] += 1
+                self._windows[key] = entry
+                self._windows.move_to_end(key)
+            while len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+            return None
+
+    def refund(self, key, index):
+        """Take back one attempt reserved in window `index`"""
+        with self._lock:
+            entry = self._windows.get(key)
+            if entry is not None and entry[0] == index and entry[2] > 0:
+                entry[2] -= 1
+
+    def reset(self, key, index):
+        with self._lock:
+            self._windows.pop(key, None)
+
+    def size(self):
+        with self._lock:
+            return len(self._windows)
+
+
+class RedisStore:
+    """Same interface as MemoryStore: one INCR'd key per key and window"""
+
+    backend = 'redis'
+
+    # KEYS: previous and current window of each limit; ARGV: overlap,
+    # expiry, then the limits. Same result as MemoryStore.reserve, 0-based.
+    _RESERVE = """
+        local overlap = tonumber(ARGV[1])
+        for i = 1, #KEYS / 2 do
+            local previous = tonumber(redis.call('GET', KEYS[2 * i - 1]) or '0')
+            local current = tonumber(redis.call('GET', KEYS[2 * i]) or '0')
+            if previous * overlap + current >= tonumber(ARGV[i + 2]) then
+                return {i - 1, previous, current}
+            end
+        end
+        for i = 1, #KEYS / 2 do
+            redis.call('INCR', KEYS[2 * i])
+            redis.call('EXPIRE', KEYS[2 * i], ARGV[2])
+        end
+        return nil
+    """
+
+    _REFUND = """
+        if tonumber(redis.call('GET', KEYS[1]) or '0') > 0 then
+            redis.call('DECR', KEYS[1])
+        end
+    """
+
+    def __init__(self, client, window, prefix='billscanner:rl:'):
+        self._client = client
+        self.window = window
+        self.prefix = prefix
+        self._reserve = client.register_script(self._RESERVE)
+        self._refund = client.register_script(self._REFUND)
+
+    def reserve(self, limits, index, overlap):
+        keys = []
+        for key, _ in limits:
+            keys += [f'{self.prefix}{key}:{index - 1}', f'{self.prefix}{key}:{index}']
+        # A window is still needed as the "previous" one during the next
+        result = self._reserve(keys=keys, args=[overlap, int(self.window * 2) + 1] + [limit for _, limit in limits])
+        return tuple(result) if result else None
+
+    def refund(self, key, index):
+        self._refund(keys=[f'{self.prefix}{key}:{index}'])
+
+    def reset(self, key, index):
+        self._client.delete(f'{self.prefix}{key}:{index - 1}', f'{self.prefix}{key}:{index}')
+
+    def size(self):
+        return None
+
+
+# ----------------------------------------
+# Limiter
+# ----------------------------------------
+
+class LoginLimiter:
+    """Per-IP and per-account sliding windows for login attempts"""
+
+    def __init__(self, store, window=300.0, per_ip=30, per_account=5, enabled=True):
+        self.store = store
+        self.window = window
+        self.limits = {'ip': per_ip, 'account': per_account}
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {
+            'checked': 0, 'rejected_ip': 0, 'rejected_account': 0, 'released': 0, 'errors': 0,
+        }
+
+    def _retry_after(self, limit, previous, current, offset):
+        """Seconds until previous * overlap + current drops below limit"""
+        if current >= limit or not previous:
+            # Only the next window helps
+            return int(self.window - offset) + 1
+        # Wait for the previous window's share to decay
+        overlap_needed = (limit - current) / previous
+        return max(int((1.0 - overlap_needed) * self.window - offset) + 1, 1)
+
+    def check(self, ip, account):
+        """
+        Reserve an attempt from `ip` for `account` against both limits;
+        raises RateLimited (reserving nothing) if either is exhausted. Store
+        errors let the attempt through.
+        """
+        if not self.enabled:
+            return
+        self._count('checked')
+        index, offset = divmod(time.time(), self.window)
+        index = int(index)
+        overlap = 1.0 - offset / self.window
+        scopes = ('ip', 'account')
+        limits = [(f'ip:{ip}', self.limits['ip']), (account_key(account), self.limits['account'])]
+        try:
+            rejected = self.store.reserve(limits, index, overlap)
+        except Exception as e:
+            # A store outage must not lock everyone out
+            print(f"Rate limit store error: {e}")
+            self._count('errors')
+            return
+        if rejected is not None:
+            position, previous, current = rejected
+            scope = scopes[position]
+            self._count(f'rejected_{scope}')
+            metrics.record_rate_limited(scope)
+            raise RateLimited(scope, self._retry_after(limits[position][1], previous, current, offset))
+
+    def release(self, account):
+        """Take back the account's reserved attempt when the password was never checked"""
+        if not self.enabled:
+            return
+        self._count('released')
+        try:
+            self.store.refund(account_key(account), int(time.time() // self.window))
+        except Exception as e:
+            print(f"Rate limit store error: {e}")
+            self._count('errors')
+
+    def record_success(self, account):
+        """Forget the account's failures (and this attempt) once its password was right"""
+        if not self.enabled:
+            return
+        try:
+            self.store.reset(account_key(account), int(time.time() // self.window))
+        except Exception as e:
+            print(f"Rate limit store error: {e}")
+            self._count('errors')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['enabled'] = self.enabled
+        stats['backend'] = self.store.backend
+        stats['keys'] = self.store.size()
+        stats['window'] = self.window
+        stats['limits'] = dict(self.limits)
+        return stats
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+
+def account_key(account):
+    """Store key for an email/username; hashed so stores never hold addresses"""
+    normalized = (account or '').strip().lower().encode('utf-8')
+    return 'acct:' + hashlib.sha1(normalized).hexdigest()
+
+
+def client_ip(remote_addr, forwarded_for=None):
+    """
+    Client address for the per-IP limit: the socket address, or with
+    RATE_LIMIT_PROXY_HOPS=n the address n hops back in X-Forwarded-For
+    (the entry our own proxies appended, which clients cannot forge)
+    """
+    hops = RATE_LIMIT_CONFIG['proxy_hops']
+    if hops and forwarded_for:
+        forwarded = [part.strip() for part in forwarded_for.split(',') if part.strip()]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    return remote_addr or 'unknown'
+
+
+def _create_store(window, max_keys, redis_url):
+    if redis_url:
+        try:
+            import redis
+            return RedisStore(redis.Redis.from_url(redis_url), window)
+        except ImportError:
+            print("Warning: RATE_LIMIT_REDIS_URL is set but the redis package is not installed; "
+                  "using in-process rate limits")
+    return MemoryStore(max_keys=max_keys)
+
+
+login_limiter = LoginLimiter(
+    _create_store(RATE_LIMIT_CONFIG['window'], RATE_LIMIT_CONFIG['max_keys'], RATE_LIMIT_CONFIG['redis_url']),
+    window=RATE_LIMIT_CONFIG['window'],
+    per_ip=RATE_LIMIT_CONFIG['per_ip'],
+    per_account=RATE_LIMIT_CONFIG['per_account'],
+    enabled=RATE_LIMIT_CONFIG['enabled'],
+)
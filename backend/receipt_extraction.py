@@ -0,0 +1,291 @@
+"""
+Bill Scanner App - Receipt Field Extraction
+Heuristic extraction of vendor, total, date and currency from OCR text
+
+Every pattern is compiled once at import; extraction is a few passes over
+the text's lines with no backtracking-heavy expressions, so it is cheap
+enough to run inline in the OCR worker (see benchmarks/bench_extraction.py
+for accuracy and throughput on a sample corpus).
+
+Each field comes back as {'value': ..., 'confidence': 0..1}; value is None
+(confidence 0) when nothing plausible was found. Confidences are heuristic
+scores meant for deciding whether to pre-fill a form, not probabilities.
+"""
+
+import re
+from collections import Counter
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+# ----------------------------------------
+# Amounts
+# ----------------------------------------
+
+# 1,234.56  1.234,56  1 234,56  12.34  12,34  (optionally negative)
+_AMOUNT = r'-?\d{1,3}(?:[.,  ]\d{3})*[.,]\d{2}(?!\d)|-?\d+[.,]\d{2}(?!\d)'
+AMOUNT_RE = re.compile(_AMOUNT)
+
+# Keywords introducing the amount actually paid, strongest first
+TOTAL_KEYWORDS = (
+    (re.compile(r'\b(grand\s*total|amount\s*due|balance\s*due|total\s*due|total\s*to\s*pay|'
+                r'net\s*payable|total\s*ttc|gesamtbetrag|importe\s*total|totale)\b', re.I), 0.95),
+    (re.compile(r'\b(total|summe|gesamt|montant|importe|betrag)\b', re.I), 0.85),
+    (re.compile(r'\b(amount|balance|payment|paid|visa|mastercard|card)\b', re.I), 0.5),
+)
+
+# Lines whose amount is never the total
+NOT_TOTAL_RE = re.compile(
+    r'\b(sub\s*-?\s*total|subtotal|tax|vat|gst|hst|mwst|tva|iva|change|cash\s*tendered|'
+    r'tendered|discount|savings|you\s*saved|tip|rounding|points|qty|quantity)\b',
+    re.I,
+)
+
+
+def parse_amount(raw):
+    """'1.234,56' / '1,234.56' / '12,34' -> Decimal, or None"""
+    raw = raw.replace(' ', '').replace(' ', '')
+    last_dot, last_comma = raw.rfind('.'), raw.rfind(',')
+    decimal_sep = '.' if last_dot > last_comma else ','
+    thousands_sep = ',' if decimal_sep == '.' else '.'
+    raw = raw.replace(thousands_sep, '').replace(decimal_sep, '.')
+    try:
+        return Decimal(raw)
+    except InvalidOperation:
+        return None
+
+
+# ----------------------------------------
+# Currencies
+# ----------------------------------------
+
+CURRENCY_SYMBOLS = {
+    '$': 'USD', '€': 'EUR', '£': 'GBP', '¥': 'JPY', '₹': 'INR',
+    'rs.': 'INR', 'rs': 'INR', 'fr.': 'CHF',
+}
+CURRENCY_CODES = ('USD', 'EUR', 'GBP', 'INR', 'CAD', 'AUD', 'JPY', 'CHF', 'NZD', 'SGD', 'MXN')
+
+CURRENCY_NAMES = {'euro': 'EUR', 'euros': 'EUR', 'rupees': 'INR', 'pounds': 'GBP', 'dollars': 'USD'}
+
+CURRENCY_RE = re.compile(
+    r'(?P<symbol>[$€£¥₹])|\b(?P<word>rs\.?|fr\.)(?=\s?\d)|\b(?P<code>'
+    + '|'.join(CURRENCY_CODES + tuple(CURRENCY_NAMES)) + r')\b',
+    re.I,
+)
+# Codes that disambiguate '$'
+DOLLAR_HINT_RE = re.compile(r'\b(C\$|CA\$|A\$|AU\$|NZ\$|S\$)', re.I)
+DOLLAR_HINTS = {'c$': 'CAD', 'ca$': 'CAD', 'a$': 'AUD', 'au$': 'AUD', 'nz$': 'NZD', 's$': 'SGD'}
+
+
+# ----------------------------------------
+# Dates
+# ----------------------------------------
+
+MONTHS = {
+    'jan': 1, 'january': 1, 'janv': 1, 'januar': 1, 'enero': 1, 'ene': 1,
+    'feb': 2, 'february': 2, 'fev': 2, 'fevr': 2, 'februar': 2, 'febrero': 2,
+    'mar': 3, 'march': 3, 'mars': 3, 'marz': 3, 'maerz': 3, 'marzo': 3,
+    'apr': 4, 'april': 4, 'avr': 4, 'avril': 4, 'abr': 4, 'abril': 4,
+    'may': 5, 'mai': 5, 'mayo': 5,
+    'jun': 6, 'june': 6, 'juin': 6, 'juni': 6, 'junio': 6,
+    'jul': 7, 'july': 7, 'juil': 7, 'juillet': 7, 'juli': 7, 'julio': 7,
+    'aug': 8, 'august': 8, 'aout': 8, 'ago': 8, 'agosto': 8,
+    'sep': 9, 'sept': 9, 'september': 9, 'septembre': 9, 'septiembre': 9,
+    'oct': 10, 'october': 10, 'octobre': 10, 'okt': 10, 'oktober': 10, 'octubre': 10,
+    'nov': 11, 'november': 11, 'novembre': 11, 'noviembre': 11,
+    'dec': 12, 'december': 12, 'decembre': 12, 'dez': 12, 'dezember': 12, 'dic': 12, 'diciembre': 12,
+}
+_MONTH_NAMES = '|'.join(sorted(MONTHS, key=len, reverse=True))
+
+# 2024-03-05, 2024/03/05
+ISO_DATE_RE = re.compile(r'\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b')
+# 05/03/2024, 5-3-24, 05.03.2024
+NUMERIC_DATE_RE = re.compile(r'\b(\d{1,2})([-/.])(\d{1,2})\2(\d{4}|\d{2})\b')
+# 5 Mar 2024, 05-MAR-24, 5. März 2024
+DAY_MONTH_RE = re.compile(
+    r'\b(\d{1,2})\.?[\s-]*(' + _MONTH_NAMES + r')\.?[\s,-]*(\d{4}|\d{2})\b', re.I)
+# Mar 5, 2024 / March 05 2024
+MONTH_DAY_RE = re.compile(
+    r'\b(' + _MONTH_NAMES + r')\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})\b', re.I)
+
+DATE_LABEL_RE = re.compile(r'\b(date|datum|fecha|dated|bill\s*date|invoice\s*date)\b', re.I)
+DUE_LABEL_RE = re.compile(r'\b(due|expir|exp\b|valid|until|best\s*before)', re.I)
+
+_ACCENTS = str.maketrans('éèêäûôÉÈÊÄÛÔ', 'eeeauoEEEAUO')
+
+
+def _year(raw):
+    year = int(raw)
+    return year + 2000 if year < 100 else year
+
+
+def _make_date(year, month, day):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+# Currencies of countries that write dates month-first
+MONTH_FIRST_CURRENCIES = ('USD',)
+
+
+def _numeric_dates(match):
+    """
+    Candidate (date, confidence, order) triples for a dd/mm/yyyy-style match.
+    order is 'dmy' or 'mdy' when the match reads as a valid date both ways.
+    """
+    first, sep, second, year = int(match.group(1)), match.group(2), int(match.group(3)), _year(match.group(4))
+    dmy = _make_date(year, second, first)
+    mdy = _make_date(year, first, second)
+    if dmy and mdy and dmy != mdy:
+        if sep == '.':
+            # Dotted dates are a day-first convention
+            return [(dmy, 0.7, None)]
+        return [(dmy, 0.6, 'dmy'), (mdy, 0.6, 'mdy')]
+    found = dmy or mdy
+    return [(found, 0.8, None)] if found else []
+
+
+def _date_candidates(line):
+    line = line.translate(_ACCENTS)
+    candidates = []
+    for m in ISO_DATE_RE.finditer(line):
+        d = _make_date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        if d:
+            candidates.append((d, 0.9, None))
+    if not candidates:
+        for m in NUMERIC_DATE_RE.finditer(line):
+            candidates.extend(_numeric_dates(m))
+    for m in DAY_MONTH_RE.finditer(line):
+        month = MONTHS.get(m.group(2).lower())
+        d = month and _make_date(_year(m.group(3)), month, int(m.group(1)))
+        if d:
+            candidates.append((d, 0.85, None))
+    for m in MONTH_DAY_RE.finditer(line):
+        month = MONTHS.get(m.group(1).lower())
+        d = month and _make_date(int(m.group(3)), month, int(m.group(2)))
+        if d:
+            candidates.append((d, 0.85, None))
+    return candidates
+
+
+# ----------------------------------------
+# Vendor
+# ----------------------------------------
+
+VENDOR_SKIP_RE = re.compile(
+    r'\b(receipt|invoice|tax\s*invoice|welcome|thank|customer\s*copy|merchant\s*copy|'
+    r'tel|phone|fax|www\.|http|\.com|street|st\.|road|rd\.|avenue|ave\.|suite|gst\s*no|vat\s*no|'
+    r'abn|order|table|server|cashier|store\s*#|store\s*no)\b',
+    re.I,
+)
+PHONE_RE = re.compile(r'\+?\d[\d\s().-]{7,}\d')
+LETTERS_RE = re.compile(r'[^\W\d_]')
+
+
+def _vendor(lines):
+    """Best vendor line among the first few lines of the receipt"""
+    for position, line in enumerate(lines[:6]):
+        if VENDOR_SKIP_RE.search(line) or PHONE_RE.search(line) or AMOUNT_RE.search(line):
+            continue
+        letters = len(LETTERS_RE.findall(line))
+        if letters < 3 or letters < len(line.replace(' ', '')) * 0.6:
+            continue
+        name = line.strip(' *#-=:|.')
+        confidence = 0.8 - 0.1 * position
+        if name.isupper():
+            confidence += 0.05
+        return name, round(min(confidence, 0.9), 2)
+    return None, 0.0
+
+
+# ----------------------------------------
+# Extraction
+# ----------------------------------------
+
+def _field(value, confidence):
+    return {'value': value, 'confidence': round(confidence, 2) if value is not None else 0.0}
+
+
+def extract(text, date_order='auto', default_currency=None, today=None):
+    """
+    Extract {'vendor_name', 'amount', 'bill_date', 'currency'} from receipt text.
+
+    date_order: 'dmy', 'mdy' or 'auto'. Auto reads dates like 05/03/2024
+    month-first only for US dollar receipts (dotted dates are always
+    day-first). default_currency (e.g. the user's setting) is used when the
+    text names none. Dates after `today` (default: date.today()) are ignored.
+    """
+    today = today or date.today()
+    lines = [' '.join(line.split()) for line in (text or '').splitlines()]
+    lines = [line for line in lines if line]
+    count = len(lines)
+
+    best_total = (None, 0.0)
+    largest = None
+    dates = []
+    currencies = Counter()
+    explicit = set()  # currencies named by code or a prefixed dollar sign
+
+    for index, line in enumerate(lines):
+        amounts = [parse_amount(m) for m in AMOUNT_RE.findall(line)]
+        amounts = [a for a in amounts if a is not None and a > 0]
+        if amounts:
+            largest = max(amounts + ([largest] if largest is not None else []))
+            if not NOT_TOTAL_RE.search(line):
+                for pattern, strength in TOTAL_KEYWORDS:
+                    if pattern.search(line):
+                        # Later lines win ties: totals follow the items
+                        score = strength + 0.04 * (index / count)
+                        if score > best_total[1]:
+                            best_total = (amounts[-1], score)
+                        break
+
+        labelled = bool(DATE_LABEL_RE.search(line))
+        if not DUE_LABEL_RE.search(line):
+            for found, confidence, order in _date_candidates(line):
+                if found <= today and found.year >= today.year - 20:
+                    dates.append((found, min(confidence + (0.1 if labelled else 0), 0.99), order))
+
+        for m in CURRENCY_RE.finditer(line):
+            if m.group('code'):
+                code = CURRENCY_NAMES.get(m.group('code').lower(), m.group('code').upper())
+                currencies[code] += 2
+                explicit.add(code)
+            else:
+                currencies[CURRENCY_SYMBOLS[(m.group('symbol') or m.group('word')).lower()]] += 1
+        for m in DOLLAR_HINT_RE.finditer(line):
+            code = DOLLAR_HINTS[m.group(1).lower()]
+            currencies[code] += 3
+            explicit.add(code)
+
+    amount, amount_confidence = best_total
+    if amount is None and largest is not None:
+        # No total line: the largest amount on a receipt is usually the total
+        amount, amount_confidence = largest, 0.4
+
+    if currencies:
+        currency, votes = currencies.most_common(1)[0]
+        currency_confidence = 0.5 + 0.45 * votes / sum(currencies.values())
+        if currency == 'USD' and 'USD' not in explicit:
+            # A bare '$' could be any dollar
+            currency_confidence = min(currency_confidence, 0.7)
+    elif default_currency:
+        currency, currency_confidence = default_currency, 0.3
+    else:
+        currency, currency_confidence = None, 0.0
+
+    if date_order == 'auto':
+        date_order = 'mdy' if currency in MONTH_FIRST_CURRENCIES else 'dmy'
+    # Ambiguous readings only count in the expected order
+    dates = [d for d in dates if d[2] in (None, date_order)]
+    bill_date, date_confidence, _ = max(dates, key=lambda d: d[1]) if dates else (None, 0.0, None)
+
+    vendor, vendor_confidence = _vendor(lines)
+
+    return {
+        'vendor_name': _field(vendor, vendor_confidence),
+        'amount': _field(float(amount) if amount is not None else None, amount_confidence),
+        'bill_date': _field(bill_date.isoformat() if bill_date else None, date_confidence),
+        'currency': _field(currency, currency_confidence),
+    }
@@ -0,0 +1,207 @@
+"""
+Bill Scanner App - Recurring Bills
+Generates the upcoming instances of recurring bills (see
+database/16_recurring_bills.sql for how a series is stored).
+
+A pass walks the heads of all series (is_recurring = TRUE, one row per
+series, via idx_bills_recurring) in user_id order, a batch of heads per
+transaction. One statement per batch inserts every occurrence that has
+come due (catching up missed periods), links each to its predecessor and
+moves is_recurring to the newest one. A head is only advanced together
+with the insert of its successor, and the unique index on
+recurring_parent_id admits one successor per bill, so a pass that is
+interrupted, repeated or run by two processes at once never duplicates a
+bill. Passes also take an advisory lock, so concurrent schedulers (one
+per Gunicorn worker) do not even compete for rows.
+
+Runs in-process every RECURRING_INTERVAL seconds (see scheduler.py), or
+from cron:
+
+Usage:
+    python recurring.py run [--today YYYY-MM-DD] [--lead-days <n>] [--batch-size <n>]
+"""
+
+import argparse
+import os
+import time
+from datetime import date, timedelta
+
+from scheduler import PeriodicJob, exclusive
+
+# Recurring bill configuration
+RECURRING_CONFIG = {
+    # Seconds between in-process passes; 0 leaves it to `python recurring.py run`
+    'interval': float(os.getenv('RECURRING_INTERVAL', 3600)),
+    # Series heads per transaction
+    'batch_size': int(os.getenv('RECURRING_BATCH_SIZE', 1000)),
+    # Create instances this many days before their bill_date
+    'lead_days': int(os.getenv('RECURRING_LEAD_DAYS', 0)),
+    # Most instances one series gets per pass (bounds catch-up after downtime)
+    'max_catch_up': int(os.getenv('RECURRING_MAX_CATCH_UP', 60)),
+}
+
+# recurring_period values and their step; other values are left alone
+PERIODS = {
+    'weekly': '1 week',
+    'monthly': '1 month',
+    'yearly': '1 year',
+}
+
+# pg_try_advisory_lock key held for the duration of a pass
+LOCK_KEY = 0x62696c6c726563  # 'billrec'
+
+NIL_UUID = '00000000-0000-0000-0000-000000000000'
+MAX_UUID = 'ffffffff-ffff-ffff-ffff-ffffffffffff'
+
+_STEP_SQL = 'CASE lower(b.recurring_period) {} END'.format(
+    ' '.join(f"WHEN '{name}' THEN interval '{step}'" for name, step in PERIODS.items()))
+
+BATCH_END_SQL = '''
+    SELECT user_id
+    FROM bills
+    WHERE is_recurring = TRUE AND user_id > %s
+    ORDER BY user_id
+    OFFSET %s LIMIT 1
+'''
+
+GENERATE_SQL = f'''
+    WITH heads AS (
+        SELECT b.bill_id, b.user_id, b.vendor_name, b.amount, b.currency, b.category_id,
+               b.description, b.recurring_period, b.bill_date, b.due_date, b.recurring_seq,
+               COALESCE(b.recurring_anchor, b.bill_date) AS anchor,
+               {_STEP_SQL} AS step
+        FROM bills b
+        WHERE b.is_recurring = TRUE
+          AND b.user_id > %(after)s AND b.user_id <= %(until)s
+          AND lower(b.recurring_period) IN %(periods)s
+          AND (COALESCE(b.recurring_anchor, b.bill_date)
+               + (b.recurring_seq + 1) * {_STEP_SQL})::date <= %(horizon)s
+          AND NOT EXISTS (SELECT 1 FROM bills s WHERE s.recurring_parent_id = b.bill_id)
+        FOR UPDATE OF b SKIP LOCKED
+    ),
+    occurrences AS (
+        SELECT h.bill_id AS head_id, s.seq, (h.anchor + s.seq * h.step)::date AS bill_date,
+               uuid_generate_v4() AS bill_id
+        FROM heads h
+        CROSS JOIN LATERAL generate_series(h.recurring_seq + 1, h.recurring_seq + %(max_catch_up)s) AS s(seq)
+        WHERE (h.anchor + s.seq * h.step)::date <= %(horizon)s
+    ),
+    chained AS (
+        SELECT o.head_id, o.seq, o.bill_date, o.bill_id,
+               COALESCE(lag(o.bill_id) OVER w, o.head_id) AS parent_id,
+               o.seq = max(o.seq) OVER (PARTITION BY o.head_id) AS is_head
+        FROM occurrences o
+        WINDOW w AS (PARTITION BY o.head_id ORDER BY o.seq)
+    ),
+    inserted AS (
+        INSERT INTO bills (bill_id, user_id, vendor_name, amount, currency, bill_date, due_date,
+                           category_id, description, is_paid, is_recurring, recurring_period,
+                           recurring_parent_id, recurring_anchor, recurring_seq)
+        SELECT c.bill_id, h.user_id, h.vendor_name, h.amount, h.currency, c.bill_date,
+               c.bill_date + (h.due_date - h.bill_date),
+               h.category_id, h.description, FALSE, c.is_head, h.recurring_period,
+               c.parent_id, h.anchor, c.seq
+        FROM chained c
+        JOIN heads h ON h.bill_id = c.head_id
+        RETURNING 1
+    ),
+    retired AS (
+        UPDATE bills b
+        SET is_recurring = FALSE, recurring_anchor = h.anchor
+        FROM heads h
+        WHERE b.bill_id = h.bill_id
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM retired), (SELECT COUNT(*) FROM inserted)
+'''
+
+
+# ----------------------------------------
+# Generation
+# ----------------------------------------
+
+def batch_end(cursor, after, batch_size):
+    """user_id closing the next batch of up to batch_size series after `after`"""
+    cursor.execute(BATCH_END_SQL, (after, batch_size - 1))
+    row = cursor.fetchone()
+    return str(row[0]) if row else MAX_UUID
+
+
+def generate(cursor, after, until, horizon, max_catch_up):
+    """
+    Create the due instances of the series whose user_id is in (after, until].
+    Returns (series advanced, bills created). Caller commits.
+    """
+    cursor.execute(GENERATE_SQL, {
+        'after': after,
+        'until': until,
+        'horizon': horizon,
+        'max_catch_up': max_catch_up,
+        'periods': tuple(PERIODS),
+    })
+    series, created = cursor.fetchone()
+    return series, created
+
+
+def run(conn, today=None, lead_days=None, batch_size=None, max_catch_up=None):
+    """
+    One pass over all series, committing per batch. Returns a stats dict, or
+    None when another process is running a pass.
+    """
+    today = today or date.today()
+    lead_days = RECURRING_CONFIG['lead_days'] if lead_days is None else lead_days
+    batch_size = batch_size or RECURRING_CONFIG['batch_size']
+    max_catch_up = max_catch_up or RECURRING_CONFIG['max_catch_up']
+    horizon = today + timedelta(days=lead_days)
+
+    with exclusive(conn, LOCK_KEY) as locked:
+        if not locked:
+            return None
+
+        stats = {'horizon': horizon.isoformat(), 'series': 0, 'created': 0, 'batches': 0}
+        start = time.perf_counter()
+        after = NIL_UUID
+        while after != MAX_UUID:
+            with conn.cursor() as cursor:
+                until = batch_end(cursor, after, batch_size)
+                series, created = generate(cursor, after, until, horizon, max_catch_up)
+            conn.commit()
+            stats['series'] += series
+            stats['created'] += created
+            stats['batches'] += 1
+            after = until
+
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    stats['rows_per_second'] = round(stats['created'] / stats['seconds']) if stats['seconds'] else 0
+    return stats
+
+
+def describe(stats):
+    return (f"{stats['created']} bills for {stats['series']} series in {stats['batches']} batches, "
+            f"{stats['seconds']:.2f}s ({stats['rows_per_second']} rows/s, up to {stats['horizon']})")
+
+
+job = PeriodicJob('recurring-bills', run, RECURRING_CONFIG['interval'], describe)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate instances of recurring bills')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='one pass over all recurring series')
+    run_parser.add_argument('--today', type=date.fromisoformat, help='pretend it is this date (YYYY-MM-DD)')
+    run_parser.add_argument('--lead-days', type=int, help='default RECURRING_LEAD_DAYS')
+    run_parser.add_argument('--batch-size', type=int, help='default RECURRING_BATCH_SIZE')
+    args = parser.parse_args()
+
+    from app import db_pool
+
+    with db_pool.connection() as conn:
+        stats = run(conn, today=args.today, lead_days=args.lead_days, batch_size=args.batch_size)
+    if stats is None:
+        print("Another recurring bills pass is running; nothing done")
+    else:
+        print(f"Generated {describe(stats)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Bill Scanner App - Bill Reminders
+Writes a 'bill_reminder' notification for each unpaid bill whose due_date
+is within REMINDER_DAYS, for users with user_settings.bill_reminders_enabled
+(users without a settings row get the column default: enabled).
+
+A pass walks users in user_id order, a batch per transaction. One
+INSERT ... SELECT per batch finds the due bills through idx_bills_unpaid
+(user_id, is_paid, due_date) and skips bills already reminded about; the
+unique index from database/17_notifications.sql allows one reminder per
+bill, so repeated or concurrent passes never notify twice.
+
+Runs in-process every REMINDER_INTERVAL seconds (see scheduler.py), or
+from cron:
+
+Usage:
+    python reminders.py run [--today YYYY-MM-DD] [--days <n>] [--batch-size <n>]
+"""
+
+import argparse
+import os
+import time
+from datetime import date, timedelta
+
+from scheduler import PeriodicJob, exclusive
+
+# Reminder configuration
+REMINDER_CONFIG = {
+    # Seconds between in-process passes; 0 leaves it to `python reminders.py run`
+    'interval': float(os.getenv('REMINDER_INTERVAL', 3600)),
+    # Remind about bills due within this many days (0 = due today)
+    'days': int(os.getenv('REMINDER_DAYS', 3)),
+    # Users per transaction
+    'batch_size': int(os.getenv('REMINDER_BATCH_SIZE', 1000)),
+}
+
+# pg_try_advisory_lock key held for the duration of a pass
+LOCK_KEY = 0x62696c6c72656d  # 'billrem'
+
+NIL_UUID = '00000000-0000-0000-0000-000000000000'
+MAX_UUID = 'ffffffff-ffff-ffff-ffff-ffffffffffff'
+
+BATCH_END_SQL = '''
+    SELECT user_id
+    FROM users
+    WHERE user_id > %s
+    ORDER BY user_id
+    OFFSET %s LIMIT 1
+'''
+
+GENERATE_SQL = '''
+    INSERT INTO notifications (user_id, title, message, type, related_bill_id)
+    SELECT b.user_id,
+           CASE b.due_date - %(today)s
+               WHEN 0 THEN 'Bill due today'
+               WHEN 1 THEN 'Bill due tomorrow'
+               ELSE 'Bill due in ' || (b.due_date - %(today)s) || ' days'
+           END,
+           format('%%s: %%s %%s due on %%s', b.vendor_name, b.amount, COALESCE(b.currency, 'USD'),
+                  to_char(b.due_date, 'YYYY-MM-DD')),
+           'bill_reminder', b.bill_id
+    FROM users u
+    LEFT JOIN user_settings s ON s.user_id = u.user_id
+    JOIN bills b ON b.user_id = u.user_id
+                AND b.is_paid = FALSE
+                AND b.due_date BETWEEN %(today)s AND %(horizon)s
+    WHERE u.user_id > %(after)s AND u.user_id <= %(until)s
+      AND u.is_active = TRUE
+      AND COALESCE(s.bill_reminders_enabled, TRUE)
+      AND NOT EXISTS (
+          SELECT 1 FROM notifications n
+          WHERE n.related_bill_id = b.bill_id AND n.type = 'bill_reminder'
+      )
+    ON CONFLICT (related_bill_id) WHERE type = 'bill_reminder' DO NOTHING
+'''
+
+
+def batch_end(cursor, after, batch_size):
+    """user_id closing the next batch of up to batch_size users after `after`"""
+    cursor.execute(BATCH_END_SQL, (after, batch_size - 1))
+    row = cursor.fetchone()
+    return str(row[0]) if row else MAX_UUID
+
+
+def generate(cursor, after, until, today, horizon):
+    """Remind the users in (after, until] of their due bills; returns rows inserted. Caller commits."""
+    cursor.execute(GENERATE_SQL, {
+        'after': after,
+        'until': until,
+        'today': today,
+        'horizon': horizon,
+    })
+    return cursor.rowcount
+
+
+def run(conn, today=None, days=None, batch_size=None):
+    """
+    One pass over all users, committing per batch. Returns a stats dict, or
+    None when another process is running a pass.
+    """
+    today = today or date.today()
+    days = REMINDER_CONFIG['days'] if days is None else days
+    batch_size = batch_size or REMINDER_CONFIG['batch_size']
+    horizon = today + timedelta(days=days)
+
+    with exclusive(conn, LOCK_KEY) as locked:
+        if not locked:
+            return None
+
+        stats = {'horizon': horizon.isoformat(), 'created': 0, 'batches': 0}
+        start = time.perf_counter()
+        after = NIL_UUID
+        while after != MAX_UUID:
+            with conn.cursor() as cursor:
+                until = batch_end(cursor, after, batch_size)
+                stats['created'] += generate(cursor, after, until, today, horizon)
+            conn.commit()
+            stats['batches'] += 1
+            after = until
+
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    stats['rows_per_second'] = round(stats['created'] / stats['seconds']) if stats['seconds'] else 0
+    return stats
+
+
+def describe(stats):
+    return (f"{stats['created']} reminders in {stats['batches']} batches, {stats['seconds']:.2f}s "
+            f"({stats['rows_per_second']} rows/s, due up to {stats['horizon']})")
+
+
+job = PeriodicJob('bill-reminders', run, REMINDER_CONFIG['interval'], describe)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write bill reminder notifications')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='one pass over all users')
+    run_parser.add_argument('--today', type=date.fromisoformat, help='pretend it is this date (YYYY-MM-DD)')
+    run_parser.add_argument('--days', type=int, help='default REMINDER_DAYS')
+    run_parser.add_argument('--batch-size', type=int, help='default REMINDER_BATCH_SIZE')
+    args = parser.parse_args()
+
+    from app import db_pool
+
+    with db_pool.connection() as conn:
+        stats = run(conn, today=args.today, days=args.days, batch_size=args.batch_size)
+    if stats is None:
+        print("Another reminders pass is running; nothing done")
+    else:
+        print(f"Wrote {describe(stats)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Bill Scanner App - Monthly Bill Rollups
+Reads and rebuilds bill_monthly_rollups (see database/10_bill_monthly_rollups.sql).
+
+The table is kept current by statement-level triggers on `bills`, so every
+insert, update and delete (including ON DELETE SET NULL from categories)
+adjusts the rollups inside the same transaction. `rebuild` is only needed
+to backfill or repair it.
+
+Usage:
+    python rollups.py rebuild [--user <user_id>]
+"""
+
+import argparse
+from datetime import date, timedelta
+
+REBUILD_SQL = '''
+    INSERT INTO bill_monthly_rollups (user_id, month, category_id, currency, total_amount, bill_count)
+    SELECT user_id, date_trunc('month', bill_date)::date, category_id, COALESCE(currency, 'USD'),
+           SUM(amount), COUNT(*)
+    FROM bills
+    {where}
+    GROUP BY 1, 2, 3, 4
+'''
+
+
+def rebuild(cursor, user_id=None):
+    """Recompute rollups from bills (all users, or one). Caller commits."""
+    # Wait for in-flight bill writes (whose triggers hold row locks on the
+    # rollups) so the snapshot below includes them, and block new ones
+    # until this transaction commits.
+    cursor.execute('LOCK TABLE bill_monthly_rollups IN EXCLUSIVE MODE')
+    if user_id:
+        cursor.execute('DELETE FROM bill_monthly_rollups WHERE user_id = %s', (user_id,))
+        cursor.execute(REBUILD_SQL.format(where='WHERE user_id = %s'), (user_id,))
+    else:
+        cursor.execute('DELETE FROM bill_monthly_rollups')
+        cursor.execute(REBUILD_SQL.format(where=''))
+    return cursor.rowcount
+
+
+def month_range(start_date, end_date):
+    """
+    Map an inclusive date range onto whole months.
+
+    Returns (first_month, last_month) as dates (either may be None for an
+    open end), or None when the range starts or ends mid-month and so
+    cannot be answered from monthly rollups.
+    """
+    start = date.fromisoformat(start_date) if start_date else None
+    end = date.fromisoformat(end_date) if end_date else None
+    if start and start.day != 1:
+        return None
+    if end and (end + timedelta(days=1)).day != 1:
+        return None
+    return start, (end.replace(day=1) if end else None)
+
+
+def fetch(cursor, user_id, first_month=None, last_month=None):
+    """Rollup rows for a user with category metadata, one per (month, category, currency)"""
+    query = '''
+        SELECT r.month, r.category_id, c.name AS category_name, c.color AS category_color,
+               r.currency, r.total_amount, r.bill_count
+        FROM bill_monthly_rollups r
+        LEFT JOIN categories c ON r.category_id = c.category_id
+        WHERE r.user_id = %s
+    '''
+    params = [user_id]
+    if first_month:
+        query += ' AND r.month >= %s'
+        params.append(first_month)
+    if last_month:
+        query += ' AND r.month <= %s'
+        params.append(last_month)
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain bill_monthly_rollups')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = subparsers.add_parser('rebuild', help='backfill rollups from bills')
+    rebuild_parser.add_argument('--user', help='only rebuild this user_id')
+    args = parser.parse_args()
+
+    from app import get_db_connection
+
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        rows = rebuild(cursor, args.user)
+        conn.commit()
+    print(f"Rebuilt {rows} rollup rows" + (f" for user {args.user}" if args.user else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Bill Scanner App - Background Jobs
+Periodic database jobs (recurring bills, bill reminders) run on a thread
+in each server process: started by gunicorn.conf.py in every worker and
+by `python app.py`. Each pass holds a PostgreSQL advisory lock, so with
+many workers only one of them runs a given job at a time; the others skip
+that turn.
+
+A job is a function job(conn) returning a stats dict, or None when
+another process holds its lock (see exclusive()).
+"""
+
+import random
+import threading
+from contextlib import contextmanager
+
+# Every PeriodicJob, by name
+JOBS = {}
+
+
+@contextmanager
+def exclusive(conn, key):
+    """
+    Session advisory lock `key` on conn; yields whether it was acquired.
+    The body may commit as often as it likes; the lock is released at the end.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', (key,))
+        locked = cursor.fetchone()[0]
+    conn.commit()
+    try:
+        yield locked
+    finally:
+        if locked:
+            conn.rollback()
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', (key,))
+            conn.commit()
+
+
+class PeriodicJob:
+    """Background thread calling job(conn) every `interval` seconds"""
+
+    def __init__(self, name, job, interval, describe=repr):
+        self.name = name
+        self.job = job
+        self.interval = interval
+        self.describe = describe
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._errors = 0
+        self._last = None
+        JOBS[name] = self
+
+    def start(self, pool):
+        """Start the thread (once per process) using connections from `pool`"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, args=(pool,), name=self.name, daemon=True)
+            self._thread.start()
+
+    def _loop(self, pool):
+        # Workers started together should not all try at once
+        delay = random.uniform(5, 30)
+        while not self._stop.wait(delay):
+            delay = self.interval
+            try:
+                with pool.connection() as conn:
+                    stats = self.job(conn)
+            except Exception as e:
+                print(f"{self.name} error: {e}")
+                with self._lock:
+                    self._errors += 1
+                continue
+            if stats is None:
+                continue  # another process's turn
+            with self._lock:
+                self._runs += 1
+                self._last = stats
+            if stats.get('created'):
+                print(f"{self.name}: {self.describe(stats)}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'interval': self.interval,
+                'running': self._thread is not None and self._thread.is_alive(),
+                'runs': self._runs,
+                'errors': self._errors,
+                'last_run': self._last,
+            }
+
+    def reset(self):
+        """Forget a thread inherited across fork()"""
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def shutdown(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5)
+
+
+def start_all(pool):
+    for job in JOBS.values():
+        job.start(pool)
+
+
+def reset_all():
+    for job in JOBS.values():
+        job.reset()
+
+
+def shutdown_all():
+    for job in JOBS.values():
+        job.shutdown()
+
+
+def stats():
+    return {name: job.stats() for name, job in JOBS.items()}
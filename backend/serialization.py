@@ -0,0 +1,112 @@
+"""
+Bill Scanner App - JSON encoding for API responses
+
+Database rows go straight to the encoder: UUIDs, dates, datetimes and
+Decimals are encoded natively, so endpoints return cursor rows (or a
+projection of them) instead of building a converted dict per row.
+
+Uses orjson when it is installed, else the standard library json module
+with the same output:
+    UUID            -> "8c1e...-..." (str)
+    date, datetime  -> ISO 8601, like .isoformat()
+    Decimal         -> number (float)
+
+Installed on a Flask app as its JSON provider, so jsonify() and
+request.get_json() use it:
+
+    app.json = serialization.JSONProvider(app)
+"""
+
+import json
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from flask.json.provider import JSONProvider as _FlaskJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Columns of a bill in API responses, in output order
+BILL_FIELDS = (
+    'bill_id', 'user_id', 'vendor_name', 'amount', 'bill_date', 'category_id',
+    'category_name', 'category_color', 'description', 'image_path', 'currency',
+    'is_paid', 'created_at', 'updated_at',
+)
+
+# Columns of a user in API responses (never password_hash)
+USER_FIELDS = (
+    'user_id', 'email', 'username', 'full_name', 'created_at', 'last_login',
+    'is_active', 'email_verified',
+)
+
+CATEGORY_FIELDS = ('category_id', 'name', 'color', 'icon', 'is_default', 'created_at')
+
+SETTINGS_FIELDS = (
+    'currency', 'appearance_mode', 'default_category',
+    'push_notifications_enabled', 'email_notifications_enabled', 'bill_reminders_enabled',
+)
+
+IMAGE_FIELDS = (
+    'image_id', 'bill_id', 'image_path', 'image_type', 'file_size', 'width', 'height', 'created_at',
+)
+
+OCR_JOB_FIELDS = (
+    'job_id', 'bill_id', 'image_id', 'status', 'attempts', 'max_attempts', 'run_after',
+    'last_error', 'queue_seconds', 'ocr_seconds', 'text_length', 'extracted',
+    'created_at', 'finished_at',
+)
+
+
+def _default(value):
+    """Types neither encoder handles natively"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if orjson is None:
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        if isinstance(value, (date, datetime, time)):
+            return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj, sort_keys=False):
+        """Encode to UTF-8 JSON bytes"""
+        option = _OPTIONS | orjson.OPT_SORT_KEYS if sort_keys else _OPTIONS
+        return orjson.dumps(obj, default=_default, option=option)
+
+    loads = orjson.loads
+else:
+    def dumps(obj, sort_keys=False):
+        """Encode to UTF-8 JSON bytes"""
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':'),
+                          sort_keys=sort_keys).encode('utf-8')
+
+    loads = json.loads
+
+
+def project(row, fields):
+    """Only `fields` of a row (drops extra columns); values are left as-is"""
+    return {field: row.get(field) for field in fields}
+
+
+class JSONProvider(_FlaskJSONProvider):
+    """Flask JSON provider backed by dumps()/loads() above"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        # Skip the bytes -> str -> bytes round trip of the base class
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype='application/json')
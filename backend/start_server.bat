@@ -41,11 +41,17 @@ if not exist ".env" (
     pause >nul
 )
 
-REM Start server
+REM Start server (pass --production to run under Waitress)
 echo.
-echo Starting Flask server...
-echo.
-python app.py
+if "%1"=="--production" (
+    echo Starting Waitress server...
+    echo.
+    waitress-serve --host 0.0.0.0 --port 5000 --threads 16 app:app
+) else (
+    echo Starting Flask development server...
+    echo.
+    python app.py
+)
 
 pause
 
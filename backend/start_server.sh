@@ -38,9 +38,14 @@ if [ ! -f ".env" ]; then
     read -p "Press Enter to continue..."
 fi
 
-# Start server
+# Start server (pass --production to run under Gunicorn, see gunicorn.conf.py)
 echo ""
-echo "Starting Flask server..."
+if [ "$1" = "--production" ]; then
+    echo "Starting Gunicorn server..."
+    echo ""
+    exec gunicorn app:app
+fi
+echo "Starting Flask development server..."
 echo ""
 python app.py
 
@@ -0,0 +1,214 @@
+"""
+Bill Scanner App - Delta Sync
+Watermarks and change queries for GET /api/sync (see database/13_sync_tombstones.sql).
+
+Rows are found through updated_at, which holds the start time of the
+transaction that last wrote them. A writer that started before our read but
+commits after it would be missed by a plain "updated_at > last sync time",
+so the watermark handed to the client is the older of the current time and
+the start of the transactions still open in the database that may write
+synced rows. The next sync then re-reads anything those transactions
+write. Clients may therefore see a row twice and must apply changes as
+upserts.
+
+Which open transactions count is a tradeoff. Counting all of them is
+exact, but one long-lived transaction (a streaming export, a session left
+idle in transaction) would pin every client's watermark for as long as it
+stays open, so every sync would re-send everything written since. So a
+transaction counts only while it is younger than SYNC_WATERMARK_CUTOFF
+seconds, or once it holds a write lock on bills, categories or
+user_settings (it has written rows stamped with its start time). A
+transaction that first writes those tables after running longer than the
+cutoff can be missed by clients that synced in between; the API's own
+writes are short transactions, so keep the cutoff above the longest of
+them (and above any batch job that writes bills).
+
+Usage:
+    python sync.py purge [--days <n>]
+"""
+
+import argparse
+import os
+from datetime import datetime
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+
+# Sync configuration
+SYNC_CONFIG = {
+    # Tombstones older than this are purged; clients that have not synced
+    # for longer get a full resync instead of a delta
+    'tombstone_days': int(os.getenv('SYNC_TOMBSTONE_DAYS', 90)),
+    # Seconds after which an open transaction that has not written synced
+    # tables stops holding the watermark back (see above)
+    'watermark_cutoff': float(os.getenv('SYNC_WATERMARK_CUTOFF', 60)),
+}
+
+# Requires the app's DB role to see other sessions' xact_start in
+# pg_stat_activity (true for sessions of the same role, or with
+# pg_read_all_stats). INSERT, UPDATE and DELETE hold RowExclusiveLock on
+# the table until the transaction ends.
+WATERMARK_SQL = '''
+    SELECT LEAST(
+        clock_timestamp(),
+        (SELECT MIN(a.xact_start) FROM pg_stat_activity a
+         WHERE a.datname = current_database()
+           AND a.backend_type = 'client backend'
+           AND a.pid <> pg_backend_pid()
+           AND (a.xact_start > clock_timestamp() - make_interval(secs => %s)
+                OR EXISTS (SELECT 1 FROM pg_locks l
+                           WHERE l.pid = a.pid
+                             AND l.locktype = 'relation'
+                             AND l.mode = 'RowExclusiveLock'
+                             AND l.relation IN ('bills'::regclass, 'categories'::regclass,
+                                                'user_settings'::regclass))))
+    ) AS watermark,
+    clock_timestamp() - make_interval(days => %s) AS horizon
+'''
+
+
+def watermark(cursor):
+    """
+    (watermark, horizon) for a sync starting now.
+
+    Must run before the change queries, in its own statement: every row those
+    queries cannot see yet will carry an updated_at >= watermark.
+    """
+    cursor.execute(WATERMARK_SQL, (SYNC_CONFIG['watermark_cutoff'], SYNC_CONFIG['tombstone_days']))
+    row = cursor.fetchone()
+    return row['watermark'], row['horizon']
+
+
+# ----------------------------------------
+# Tokens
+# ----------------------------------------
+
+def encode_token(since, resume=None):
+    """
+    Opaque sync token. When a delta does not fit in one response, `resume`
+    is (watermark, updated_at, bill_id): the watermark taken on the first
+    page, to become the next `since`, and the sort key of the last bill sent.
+    """
+    if resume is None:
+        return encode_cursor(since)
+    return encode_cursor(since.isoformat() if since else '', *resume)
+
+
+def decode_token(token):
+    """Inverse of encode_token: (since, resume or None); since is None for a full sync"""
+    if not token:
+        return None, None
+    try:
+        try:
+            return datetime.fromisoformat(decode_cursor(token, 1)[0]), None
+        except InvalidCursor:
+            since, mark, updated_at, bill_id = decode_cursor(token, 4)
+        since = datetime.fromisoformat(since) if since else None
+        return since, (datetime.fromisoformat(mark), datetime.fromisoformat(updated_at), bill_id)
+    except ValueError:
+        raise InvalidCursor('Malformed sync token')
+
+
+# ----------------------------------------
+# Change queries
+# ----------------------------------------
+
+def changed_bills(cursor, user_id, since, after, limit):
+    """Bills written at or after `since`, in (updated_at, bill_id) order"""
+    query = '''
+        SELECT b.bill_id, b.user_id, b.vendor_name, b.amount, b.currency, b.bill_date,
+               b.category_id, c.name AS category_name, c.color AS category_color,
+               b.description, b.image_path, b.is_paid, b.created_at, b.updated_at
+        FROM bills b
+        LEFT JOIN categories c ON b.category_id = c.category_id
+        WHERE b.user_id = %s
+    '''
+    params = [user_id]
+    if since:
+        query += ' AND b.updated_at >= %s'
+        params.append(since)
+    if after:
+        query += ' AND (b.updated_at, b.bill_id) > (%s, %s)'
+        params.extend(after)
+    query += ' ORDER BY b.updated_at, b.bill_id LIMIT %s'
+    params.append(limit + 1)
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
+def changed_categories(cursor, user_id, since):
+    """The user's own and the default categories written at or after `since`"""
+    query = '''
+        SELECT category_id, name, color, icon, is_default, created_at
+        FROM categories
+        WHERE (user_id = %s OR user_id IS NULL)
+    '''
+    params = [user_id]
+    if since:
+        query += ' AND updated_at >= %s'
+        params.append(since)
+    cursor.execute(query + ' ORDER BY name', params)
+    return cursor.fetchall()
+
+
+def changed_settings(cursor, user_id, since):
+    """The user's settings row if written at or after `since`, else None"""
+    query = '''
+        SELECT currency, appearance_mode, default_category,
+               push_notifications_enabled, email_notifications_enabled,
+               bill_reminders_enabled
+        FROM user_settings
+        WHERE user_id = %s
+    '''
+    params = [user_id]
+    if since:
+        query += ' AND updated_at >= %s'
+        params.append(since)
+    cursor.execute(query, params)
+    return cursor.fetchone()
+
+
+def tombstones(cursor, user_id, since):
+    """{'bills': [...], 'categories': [...]} ids deleted at or after `since`"""
+    cursor.execute(
+        '''
+        SELECT entity_type, entity_id
+        FROM sync_tombstones
+        WHERE (user_id = %s OR user_id IS NULL) AND deleted_at >= %s
+        ORDER BY deleted_at
+        ''',
+        (user_id, since)
+    )
+    deleted = {'bills': [], 'categories': []}
+    for row in cursor.fetchall():
+        key = 'bills' if row['entity_type'] == 'bill' else 'categories'
+        deleted[key].append(str(row['entity_id']))
+    return deleted
+
+
+def purge(cursor, days=None):
+    """Delete tombstones older than the retention period. Caller commits."""
+    days = SYNC_CONFIG['tombstone_days'] if days is None else days
+    cursor.execute(
+        'DELETE FROM sync_tombstones WHERE deleted_at < CURRENT_TIMESTAMP - make_interval(days => %s)',
+        (days,)
+    )
+    return cursor.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain delta sync tombstones')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    purge_parser = subparsers.add_parser('purge', help='delete expired tombstones')
+    purge_parser.add_argument('--days', type=int, help='retention (default SYNC_TOMBSTONE_DAYS)')
+    args = parser.parse_args()
+
+    from app import get_db_connection
+
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        rows = purge(cursor, args.days)
+        conn.commit()
+    print(f"Purged {rows} tombstones")
+
+
+if __name__ == '__main__':
+    main()
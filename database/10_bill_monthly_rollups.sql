@@ -0,0 +1,110 @@
+-- ============================================
+-- Materialized monthly bill rollups
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Serve spending analytics in O(months) instead of re-scanning bills
+-- Status: Initial implementation
+-- ============================================
+
+-- One row per (user, month, category, currency). Uncategorized bills use
+-- category_id NULL; the unique index maps NULL to the nil UUID so they
+-- still collapse into a single row.
+CREATE TABLE IF NOT EXISTS bill_monthly_rollups (
+    user_id UUID NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    month DATE NOT NULL, -- first day of the month
+    category_id UUID,
+    currency VARCHAR(10) NOT NULL,
+    total_amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    bill_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bill_monthly_rollups_key
+    ON bill_monthly_rollups (
+        user_id, month,
+        (COALESCE(category_id, '00000000-0000-0000-0000-000000000000'::uuid)),
+        currency
+    );
+
+COMMENT ON TABLE bill_monthly_rollups IS 'Per-user monthly totals by category and currency, maintained by triggers on bills';
+
+-- Apply the rows changed by one statement on bills as deltas.
+-- Statement-level with transition tables, so a multi-row insert costs one
+-- grouped upsert rather than one upsert per bill.
+CREATE OR REPLACE FUNCTION bill_rollups_apply()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        -- Removals only ever touch existing rows (a plain UPDATE, so rows
+        -- already removed by a cascading user delete are simply skipped)
+        UPDATE bill_monthly_rollups r
+        SET total_amount = r.total_amount - d.total_amount,
+            bill_count = r.bill_count - d.bill_count,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT user_id,
+                   date_trunc('month', bill_date)::date AS month,
+                   COALESCE(category_id, '00000000-0000-0000-0000-000000000000'::uuid) AS category_key,
+                   COALESCE(currency, 'USD') AS currency,
+                   SUM(amount) AS total_amount,
+                   COUNT(*) AS bill_count
+            FROM old_rows
+            GROUP BY 1, 2, 3, 4
+        ) d
+        WHERE r.user_id = d.user_id
+          AND r.month = d.month
+          AND COALESCE(r.category_id, '00000000-0000-0000-0000-000000000000'::uuid) = d.category_key
+          AND r.currency = d.currency;
+
+        DELETE FROM bill_monthly_rollups
+        WHERE bill_count <= 0
+          AND user_id IN (SELECT DISTINCT user_id FROM old_rows);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO bill_monthly_rollups (user_id, month, category_id, currency, total_amount, bill_count)
+        SELECT user_id,
+               date_trunc('month', bill_date)::date,
+               category_id,
+               COALESCE(currency, 'USD'),
+               SUM(amount),
+               COUNT(*)
+        FROM new_rows
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (user_id, month, (COALESCE(category_id, '00000000-0000-0000-0000-000000000000'::uuid)), currency)
+        DO UPDATE SET
+            total_amount = bill_monthly_rollups.total_amount + EXCLUDED.total_amount,
+            bill_count = bill_monthly_rollups.bill_count + EXCLUDED.bill_count,
+            updated_at = CURRENT_TIMESTAMP;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS bills_rollup_insert ON bills;
+CREATE TRIGGER bills_rollup_insert AFTER INSERT ON bills
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bill_rollups_apply();
+
+DROP TRIGGER IF EXISTS bills_rollup_update ON bills;
+CREATE TRIGGER bills_rollup_update AFTER UPDATE ON bills
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bill_rollups_apply();
+
+DROP TRIGGER IF EXISTS bills_rollup_delete ON bills;
+CREATE TRIGGER bills_rollup_delete AFTER DELETE ON bills
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bill_rollups_apply();
+
+-- Backfill from existing bills (same as `python rollups.py rebuild`)
+BEGIN;
+LOCK TABLE bill_monthly_rollups IN EXCLUSIVE MODE;
+DELETE FROM bill_monthly_rollups;
+INSERT INTO bill_monthly_rollups (user_id, month, category_id, currency, total_amount, bill_count)
+SELECT user_id, date_trunc('month', bill_date)::date, category_id, COALESCE(currency, 'USD'),
+       SUM(amount), COUNT(*)
+FROM bills
+GROUP BY 1, 2, 3, 4;
+COMMIT;
@@ -0,0 +1,18 @@
+-- ============================================
+-- Client-supplied bill ids for idempotent sync
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Offline clients retry batch uploads; a client id per bill lets
+--         POST /api/bills/batch skip bills that were already stored
+-- Status: Initial implementation
+-- ============================================
+
+ALTER TABLE bills
+ADD COLUMN IF NOT EXISTS client_bill_id VARCHAR(64);
+
+-- One client id per user; bills created without one are unaffected
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bills_user_client_id
+    ON bills(user_id, client_bill_id)
+    WHERE client_bill_id IS NOT NULL;
+
+COMMENT ON COLUMN bills.client_bill_id IS 'Id assigned by the client that created the bill (idempotency key for batch uploads)';
@@ -0,0 +1,17 @@
+-- ============================================
+-- Search indexes for bills
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Substring vendor filters (vendor_name ILIKE '%...%') cannot use a
+--         btree index; a trigram GIN index serves them without a scan.
+--         Full-text OCR search uses the existing idx_bills_ocr_text_search.
+-- Status: Initial implementation
+-- ============================================
+
+-- Trigram operators for indexed LIKE / ILIKE '%...%'
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_bills_vendor_name_trgm
+    ON bills USING gin (vendor_name gin_trgm_ops);
+
+COMMENT ON INDEX idx_bills_vendor_name_trgm IS 'Trigram index for substring (ILIKE) vendor search';
@@ -0,0 +1,68 @@
+-- ============================================
+-- Delta sync support
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Let clients ask "what changed since my last sync" (GET /api/sync)
+--         instead of re-downloading bills. Changes are found through
+--         updated_at; deletions are recorded as tombstones.
+-- Status: Initial implementation
+-- ============================================
+
+-- Changed bills for one user in updated_at order: a sync with nothing new
+-- is a single probe into this index
+CREATE INDEX IF NOT EXISTS idx_bills_user_updated
+    ON bills(user_id, updated_at);
+
+-- Categories had no change timestamp
+ALTER TABLE categories
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+
+DROP TRIGGER IF EXISTS update_categories_updated_at ON categories;
+CREATE TRIGGER update_categories_updated_at BEFORE UPDATE ON categories
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- One row per deleted bill or category. user_id is NULL for deleted
+-- default categories (they are visible to every user).
+CREATE TABLE IF NOT EXISTS sync_tombstones (
+    tombstone_id BIGSERIAL PRIMARY KEY,
+    user_id UUID REFERENCES users(user_id) ON DELETE CASCADE,
+    entity_type VARCHAR(20) NOT NULL, -- 'bill', 'category'
+    entity_id UUID NOT NULL,
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_user_deleted
+    ON sync_tombstones(user_id, deleted_at);
+
+COMMENT ON TABLE sync_tombstones IS 'Deleted bills and categories, kept for delta sync (purged by `python sync.py purge`)';
+
+-- Record the rows removed by one DELETE statement. Rows removed because
+-- their user was deleted are skipped: nobody is left to sync them.
+CREATE OR REPLACE FUNCTION sync_record_tombstones()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'bills' THEN
+        INSERT INTO sync_tombstones (user_id, entity_type, entity_id)
+        SELECT o.user_id, 'bill', o.bill_id
+        FROM old_rows o
+        WHERE EXISTS (SELECT 1 FROM users u WHERE u.user_id = o.user_id);
+    ELSE
+        INSERT INTO sync_tombstones (user_id, entity_type, entity_id)
+        SELECT o.user_id, 'category', o.category_id
+        FROM old_rows o
+        WHERE o.user_id IS NULL
+           OR EXISTS (SELECT 1 FROM users u WHERE u.user_id = o.user_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS bills_sync_tombstones ON bills;
+CREATE TRIGGER bills_sync_tombstones AFTER DELETE ON bills
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_record_tombstones();
+
+DROP TRIGGER IF EXISTS categories_sync_tombstones ON categories;
+CREATE TRIGGER categories_sync_tombstones AFTER DELETE ON categories
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_record_tombstones();
@@ -0,0 +1,43 @@
+-- ============================================
+-- OCR job queue
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Durable queue for server-side OCR of uploaded bill images,
+--         drained by `python ocr.py work` with FOR UPDATE SKIP LOCKED
+-- Status: Initial implementation
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS ocr_jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    bill_id UUID NOT NULL REFERENCES bills(bill_id) ON DELETE CASCADE,
+    image_id UUID REFERENCES bill_images(image_id) ON DELETE CASCADE,
+    image_path VARCHAR(500) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'done', 'failed'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_after TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP, -- backoff between retries
+    locked_by VARCHAR(100), -- worker that claimed the job
+    locked_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    queue_seconds DOUBLE PRECISION, -- created -> last claimed
+    ocr_seconds DOUBLE PRECISION,   -- time spent in the OCR engine (last attempt)
+    text_length INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Claim order for idle workers; only pending jobs are indexed, so the
+-- index stays small however many jobs have finished
+CREATE INDEX IF NOT EXISTS idx_ocr_jobs_pending
+    ON ocr_jobs(run_after, job_id)
+    WHERE status = 'queued';
+
+-- Lease expiry scan for jobs whose worker died
+CREATE INDEX IF NOT EXISTS idx_ocr_jobs_running
+    ON ocr_jobs(locked_at)
+    WHERE status = 'running';
+
+CREATE INDEX IF NOT EXISTS idx_ocr_jobs_bill_id ON ocr_jobs(bill_id);
+CREATE INDEX IF NOT EXISTS idx_ocr_jobs_finished_at ON ocr_jobs(finished_at);
+
+COMMENT ON TABLE ocr_jobs IS 'OCR work queue; one row per uploaded image, retried with exponential backoff';
@@ -0,0 +1,13 @@
+-- ============================================
+-- Extracted receipt fields on OCR jobs
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Keep the vendor/total/date/currency suggestions (with
+--         confidences) found in the OCR text, so clients can pre-fill bills
+-- Status: Initial implementation
+-- ============================================
+
+ALTER TABLE ocr_jobs
+    ADD COLUMN IF NOT EXISTS extracted JSONB;
+
+COMMENT ON COLUMN ocr_jobs.extracted IS 'Receipt fields found in the OCR text: {field: {value, confidence}}';
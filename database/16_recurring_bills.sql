@@ -0,0 +1,30 @@
+-- ============================================
+-- Recurring bill series
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Let `recurring.py` generate the next instances of recurring
+--         bills in bulk, idempotently
+-- Status: Initial implementation
+-- ============================================
+--
+-- A series is a chain of bills linked by recurring_parent_id. Only its
+-- latest instance (the head) keeps is_recurring = TRUE, so
+-- idx_bills_recurring holds one row per active series however long the
+-- series runs; turning is_recurring off on the head ends the series.
+-- Occurrence n falls on recurring_anchor + n * period, so monthly bills
+-- on the 31st stay on the last day of short months instead of drifting.
+
+ALTER TABLE bills
+    ADD COLUMN IF NOT EXISTS recurring_parent_id UUID REFERENCES bills(bill_id) ON DELETE SET NULL,
+    ADD COLUMN IF NOT EXISTS recurring_anchor DATE,
+    ADD COLUMN IF NOT EXISTS recurring_seq INTEGER NOT NULL DEFAULT 0;
+
+-- At most one successor per bill: generating an instance twice is an error
+-- rather than a duplicate bill
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bills_recurring_parent
+    ON bills(recurring_parent_id)
+    WHERE recurring_parent_id IS NOT NULL;
+
+COMMENT ON COLUMN bills.recurring_parent_id IS 'Previous instance of this recurring series (NULL for the first)';
+COMMENT ON COLUMN bills.recurring_anchor IS 'bill_date of the first instance of the series';
+COMMENT ON COLUMN bills.recurring_seq IS 'Position in the series: bill_date = recurring_anchor + recurring_seq periods';
@@ -0,0 +1,18 @@
+-- ============================================
+-- Bill reminders and notification paging
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: One reminder per bill for `reminders.py`, and keyset paging of
+--         GET /api/notifications/<user_id>
+-- Status: Initial implementation
+-- ============================================
+
+-- Dedupes reminders: a bill is reminded about once, however often (or
+-- from however many processes) the reminder job runs
+CREATE UNIQUE INDEX IF NOT EXISTS idx_notifications_bill_reminder
+    ON notifications(related_bill_id)
+    WHERE type = 'bill_reminder';
+
+-- Newest-first pages per user: ORDER BY created_at DESC, notification_id DESC
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created
+    ON notifications(user_id, created_at DESC, notification_id DESC);
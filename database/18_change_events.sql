@@ -0,0 +1,71 @@
+-- ============================================
+-- Change events (LISTEN/NOTIFY)
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Push bill, notification and settings changes to clients over
+--         GET /api/stream/<user_id> instead of having them poll
+-- Status: Initial implementation
+-- ============================================
+
+-- NOTIFY billscanner_changes once per user per statement, with
+--   {"table": ..., "op": "insert|update|delete", "user_id": ...,
+--    "count": <rows>, "ids": [<row ids>] (null above 20 rows)}
+-- Statement-level, so a bulk insert (batch upload, recurring bills)
+-- sends one notification per user rather than one per row; payloads
+-- stay far below the 8000-byte NOTIFY limit. Notifications are only
+-- delivered when the transaction commits. TG_ARGV[0] is the id column.
+CREATE OR REPLACE FUNCTION notify_user_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    EXECUTE format(
+        'SELECT pg_notify(''billscanner_changes'', json_build_object('
+        '    ''table'', %L, ''op'', %L, ''user_id'', user_id, ''count'', COUNT(*),'
+        '    ''ids'', CASE WHEN COUNT(*) <= 20 THEN json_agg(%I) END)::text)'
+        ' FROM %I WHERE user_id IS NOT NULL GROUP BY user_id',
+        TG_TABLE_NAME, lower(TG_OP), TG_ARGV[0],
+        CASE WHEN TG_OP = 'DELETE' THEN 'old_rows' ELSE 'new_rows' END
+    );
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS bills_notify_insert ON bills;
+CREATE TRIGGER bills_notify_insert AFTER INSERT ON bills
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('bill_id');
+
+DROP TRIGGER IF EXISTS bills_notify_update ON bills;
+CREATE TRIGGER bills_notify_update AFTER UPDATE ON bills
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('bill_id');
+
+DROP TRIGGER IF EXISTS bills_notify_delete ON bills;
+CREATE TRIGGER bills_notify_delete AFTER DELETE ON bills
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('bill_id');
+
+DROP TRIGGER IF EXISTS notifications_notify_insert ON notifications;
+CREATE TRIGGER notifications_notify_insert AFTER INSERT ON notifications
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('notification_id');
+
+DROP TRIGGER IF EXISTS notifications_notify_update ON notifications;
+CREATE TRIGGER notifications_notify_update AFTER UPDATE ON notifications
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('notification_id');
+
+DROP TRIGGER IF EXISTS notifications_notify_delete ON notifications;
+CREATE TRIGGER notifications_notify_delete AFTER DELETE ON notifications
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('notification_id');
+
+DROP TRIGGER IF EXISTS user_settings_notify_insert ON user_settings;
+CREATE TRIGGER user_settings_notify_insert AFTER INSERT ON user_settings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('setting_id');
+
+DROP TRIGGER IF EXISTS user_settings_notify_update ON user_settings;
+CREATE TRIGGER user_settings_notify_update AFTER UPDATE ON user_settings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('setting_id');
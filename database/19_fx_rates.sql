@@ -0,0 +1,25 @@
+-- ============================================
+-- Exchange rates
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Convert amounts in mixed currencies to the user's currency
+--         (user_settings.currency) for bill lists and analytics
+-- Status: Initial implementation
+-- ============================================
+--
+-- Loaded from a CSV file with `python fx.py load <file>`; the API servers
+-- keep the table in memory (see backend/fx.py). One row per currency pair
+-- per day that a rate was published: a rate applies from its rate_date
+-- until the next one, for up to FX_MAX_AGE_DAYS.
+-- rate = units of quote_currency per 1 base_currency.
+
+CREATE TABLE IF NOT EXISTS fx_rates (
+    base_currency VARCHAR(10) NOT NULL,
+    quote_currency VARCHAR(10) NOT NULL,
+    rate_date DATE NOT NULL,
+    rate NUMERIC(20, 10) NOT NULL CHECK (rate > 0),
+    loaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (base_currency, quote_currency, rate_date)
+);
+
+COMMENT ON TABLE fx_rates IS 'Daily exchange rates: rate = quote_currency per 1 base_currency';
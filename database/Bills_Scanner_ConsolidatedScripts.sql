@@ -7,8 +7,8 @@
 -- Usage:
 --   psql -U postgres -d bill_scanner_db -f Bills_Scanner_ConsolidatedScripts.sql
 --
--- Last Updated: 2025-11-20
--- Version: 1.1
+-- Last Updated: 2026-10-18
+-- Version: 1.2
 -- ============================================
 
 -- ============================================
@@ -177,7 +177,7 @@ COMMENT ON TABLE bill_images IS 'Bill image files (original, processed, thumbnai
 CREATE TABLE IF NOT EXISTS export_history (
     export_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     user_id UUID NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-    export_type VARCHAR(20) NOT NULL, -- 'pdf', 'csv', 'excel'
+    export_type VARCHAR(20) NOT NULL, -- 'pdf', 'csv', 'excel', 'ndjson'
     file_path VARCHAR(500),
     date_range_start DATE,
     date_range_end DATE,
@@ -335,6 +335,428 @@ FROM (VALUES
 ) AS sample(vendor_name, amount, bill_date, category_name, description)
 ON CONFLICT DO NOTHING;
 
+-- ============================================
+-- SECTION 5: MONTHLY BILL ROLLUPS
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Serve spending analytics in O(months) instead of re-scanning bills
+-- Status: Enhancement
+-- Note: Standalone version in 10_bill_monthly_rollups.sql for existing databases
+-- ============================================
+
+-- One row per (user, month, category, currency). Uncategorized bills use
+-- category_id NULL; the unique index maps NULL to the nil UUID so they
+-- still collapse into a single row.
+CREATE TABLE IF NOT EXISTS bill_monthly_rollups (
+    user_id UUID NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    month DATE NOT NULL, -- first day of the month
+    category_id UUID,
+    currency VARCHAR(10) NOT NULL,
+    total_amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    bill_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bill_monthly_rollups_key
+    ON bill_monthly_rollups (
+        user_id, month,
+        (COALESCE(category_id, '00000000-0000-0000-0000-000000000000'::uuid)),
+        currency
+    );
+
+COMMENT ON TABLE bill_monthly_rollups IS 'Per-user monthly totals by category and currency, maintained by triggers on bills';
+
+-- Apply the rows changed by one statement on bills as deltas.
+-- Statement-level with transition tables, so a multi-row insert costs one
+-- grouped upsert rather than one upsert per bill.
+CREATE OR REPLACE FUNCTION bill_rollups_apply()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        -- Removals only ever touch existing rows (a plain UPDATE, so rows
+        -- already removed by a cascading user delete are simply skipped)
+        UPDATE bill_monthly_rollups r
+        SET total_amount = r.total_amount - d.total_amount,
+            bill_count = r.bill_count - d.bill_count,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT user_id,
+                   date_trunc('month', bill_date)::date AS month,
+                   COALESCE(category_id, '00000000-0000-0000-0000-000000000000'::uuid) AS category_key,
+                   COALESCE(currency, 'USD') AS currency,
+                   SUM(amount) AS total_amount,
+                   COUNT(*) AS bill_count
+            FROM old_rows
+            GROUP BY 1, 2, 3, 4
+        ) d
+        WHERE r.user_id = d.user_id
+          AND r.month = d.month
+          AND COALESCE(r.category_id, '00000000-0000-0000-0000-000000000000'::uuid) = d.category_key
+          AND r.currency = d.currency;
+
+        DELETE FROM bill_monthly_rollups
+        WHERE bill_count <= 0
+          AND user_id IN (SELECT DISTINCT user_id FROM old_rows);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO bill_monthly_rollups (user_id, month, category_id, currency, total_amount, bill_count)
+        SELECT user_id,
+               date_trunc('month', bill_date)::date,
+               category_id,
+               COALESCE(currency, 'USD'),
+               SUM(amount),
+               COUNT(*)
+        FROM new_rows
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (user_id, month, (COALESCE(category_id, '00000000-0000-0000-0000-000000000000'::uuid)), currency)
+        DO UPDATE SET
+            total_amount = bill_monthly_rollups.total_amount + EXCLUDED.total_amount,
+            bill_count = bill_monthly_rollups.bill_count + EXCLUDED.bill_count,
+            updated_at = CURRENT_TIMESTAMP;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS bills_rollup_insert ON bills;
+CREATE TRIGGER bills_rollup_insert AFTER INSERT ON bills
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bill_rollups_apply();
+
+DROP TRIGGER IF EXISTS bills_rollup_update ON bills;
+CREATE TRIGGER bills_rollup_update AFTER UPDATE ON bills
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bill_rollups_apply();
+
+DROP TRIGGER IF EXISTS bills_rollup_delete ON bills;
+CREATE TRIGGER bills_rollup_delete AFTER DELETE ON bills
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bill_rollups_apply();
+
+-- Backfill from existing bills (same as `python rollups.py rebuild`)
+BEGIN;
+LOCK TABLE bill_monthly_rollups IN EXCLUSIVE MODE;
+DELETE FROM bill_monthly_rollups;
+INSERT INTO bill_monthly_rollups (user_id, month, category_id, currency, total_amount, bill_count)
+SELECT user_id, date_trunc('month', bill_date)::date, category_id, COALESCE(currency, 'USD'),
+       SUM(amount), COUNT(*)
+FROM bills
+GROUP BY 1, 2, 3, 4;
+COMMIT;
+
+-- ============================================
+-- SECTION 6: CLIENT BILL IDS
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Idempotency key for batch bill uploads from offline clients
+-- Status: Enhancement
+-- Note: Standalone version in 11_bill_client_ids.sql for existing databases
+-- ============================================
+
+ALTER TABLE bills
+ADD COLUMN IF NOT EXISTS client_bill_id VARCHAR(64);
+
+-- One client id per user; bills created without one are unaffected
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bills_user_client_id
+    ON bills(user_id, client_bill_id)
+    WHERE client_bill_id IS NOT NULL;
+
+COMMENT ON COLUMN bills.client_bill_id IS 'Id assigned by the client that created the bill (idempotency key for batch uploads)';
+
+-- ============================================
+-- SECTION 7: SEARCH INDEXES
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Indexed substring vendor search (pg_trgm)
+-- Status: Enhancement
+-- Note: Standalone version in 12_search_indexes.sql for existing databases
+-- ============================================
+
+-- Trigram operators for indexed LIKE / ILIKE '%...%'
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_bills_vendor_name_trgm
+    ON bills USING gin (vendor_name gin_trgm_ops);
+
+COMMENT ON INDEX idx_bills_vendor_name_trgm IS 'Trigram index for substring (ILIKE) vendor search';
+
+-- ============================================
+-- SECTION 8: DELTA SYNC
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Change tracking (categories.updated_at, bill index) and deletion tombstones for GET /api/sync
+-- Status: Enhancement
+-- Note: Standalone version in 13_sync_tombstones.sql for existing databases
+-- ============================================
+
+-- Changed bills for one user in updated_at order: a sync with nothing new
+-- is a single probe into this index
+CREATE INDEX IF NOT EXISTS idx_bills_user_updated
+    ON bills(user_id, updated_at);
+
+-- Categories had no change timestamp
+ALTER TABLE categories
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+
+DROP TRIGGER IF EXISTS update_categories_updated_at ON categories;
+CREATE TRIGGER update_categories_updated_at BEFORE UPDATE ON categories
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- One row per deleted bill or category. user_id is NULL for deleted
+-- default categories (they are visible to every user).
+CREATE TABLE IF NOT EXISTS sync_tombstones (
+    tombstone_id BIGSERIAL PRIMARY KEY,
+    user_id UUID REFERENCES users(user_id) ON DELETE CASCADE,
+    entity_type VARCHAR(20) NOT NULL, -- 'bill', 'category'
+    entity_id UUID NOT NULL,
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_user_deleted
+    ON sync_tombstones(user_id, deleted_at);
+
+COMMENT ON TABLE sync_tombstones IS 'Deleted bills and categories, kept for delta sync (purged by `python sync.py purge`)';
+
+-- Record the rows removed by one DELETE statement. Rows removed because
+-- their user was deleted are skipped: nobody is left to sync them.
+CREATE OR REPLACE FUNCTION sync_record_tombstones()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'bills' THEN
+        INSERT INTO sync_tombstones (user_id, entity_type, entity_id)
+        SELECT o.user_id, 'bill', o.bill_id
+        FROM old_rows o
+        WHERE EXISTS (SELECT 1 FROM users u WHERE u.user_id = o.user_id);
+    ELSE
+        INSERT INTO sync_tombstones (user_id, entity_type, entity_id)
+        SELECT o.user_id, 'category', o.category_id
+        FROM old_rows o
+        WHERE o.user_id IS NULL
+           OR EXISTS (SELECT 1 FROM users u WHERE u.user_id = o.user_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS bills_sync_tombstones ON bills;
+CREATE TRIGGER bills_sync_tombstones AFTER DELETE ON bills
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_record_tombstones();
+
+DROP TRIGGER IF EXISTS categories_sync_tombstones ON categories;
+CREATE TRIGGER categories_sync_tombstones AFTER DELETE ON categories
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_record_tombstones();
+
+-- ============================================
+-- SECTION 9: OCR JOB QUEUE
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Durable queue for server-side OCR of uploaded bill images
+-- Status: Enhancement
+-- Note: Standalone version in 14_ocr_jobs.sql for existing databases
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS ocr_jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    bill_id UUID NOT NULL REFERENCES bills(bill_id) ON DELETE CASCADE,
+    image_id UUID REFERENCES bill_images(image_id) ON DELETE CASCADE,
+    image_path VARCHAR(500) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'done', 'failed'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_after TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP, -- backoff between retries
+    locked_by VARCHAR(100), -- worker that claimed the job
+    locked_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    queue_seconds DOUBLE PRECISION, -- created -> last claimed
+    ocr_seconds DOUBLE PRECISION,   -- time spent in the OCR engine (last attempt)
+    text_length INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Claim order for idle workers; only pending jobs are indexed, so the
+-- index stays small however many jobs have finished
+CREATE INDEX IF NOT EXISTS idx_ocr_jobs_pending
+    ON ocr_jobs(run_after, job_id)
+    WHERE status = 'queued';
+
+-- Lease expiry scan for jobs whose worker died
+CREATE INDEX IF NOT EXISTS idx_ocr_jobs_running
+    ON ocr_jobs(locked_at)
+    WHERE status = 'running';
+
+CREATE INDEX IF NOT EXISTS idx_ocr_jobs_bill_id ON ocr_jobs(bill_id);
+CREATE INDEX IF NOT EXISTS idx_ocr_jobs_finished_at ON ocr_jobs(finished_at);
+
+COMMENT ON TABLE ocr_jobs IS 'OCR work queue; one row per uploaded image, retried with exponential backoff';
+
+-- ============================================
+-- SECTION 10: OCR EXTRACTED FIELDS
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Store receipt field suggestions found in OCR text
+-- Status: Enhancement
+-- Note: Standalone version in 15_ocr_extracted_fields.sql for existing databases
+-- ============================================
+
+ALTER TABLE ocr_jobs
+    ADD COLUMN IF NOT EXISTS extracted JSONB;
+
+COMMENT ON COLUMN ocr_jobs.extracted IS 'Receipt fields found in the OCR text: {field: {value, confidence}}';
+
+-- ============================================
+-- SECTION 11: RECURRING BILL SERIES
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Generate the next instances of recurring bills in bulk, idempotently
+-- Status: Enhancement
+-- Note: Standalone version in 16_recurring_bills.sql for existing databases
+-- ============================================
+
+-- A series is a chain of bills linked by recurring_parent_id. Only its
+-- latest instance (the head) keeps is_recurring = TRUE, so
+-- idx_bills_recurring holds one row per active series however long the
+-- series runs; turning is_recurring off on the head ends the series.
+-- Occurrence n falls on recurring_anchor + n * period, so monthly bills
+-- on the 31st stay on the last day of short months instead of drifting.
+
+ALTER TABLE bills
+    ADD COLUMN IF NOT EXISTS recurring_parent_id UUID REFERENCES bills(bill_id) ON DELETE SET NULL,
+    ADD COLUMN IF NOT EXISTS recurring_anchor DATE,
+    ADD COLUMN IF NOT EXISTS recurring_seq INTEGER NOT NULL DEFAULT 0;
+
+-- At most one successor per bill: generating an instance twice is an error
+-- rather than a duplicate bill
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bills_recurring_parent
+    ON bills(recurring_parent_id)
+    WHERE recurring_parent_id IS NOT NULL;
+
+COMMENT ON COLUMN bills.recurring_parent_id IS 'Previous instance of this recurring series (NULL for the first)';
+COMMENT ON COLUMN bills.recurring_anchor IS 'bill_date of the first instance of the series';
+COMMENT ON COLUMN bills.recurring_seq IS 'Position in the series: bill_date = recurring_anchor + recurring_seq periods';
+
+-- ============================================
+-- SECTION 12: BILL REMINDERS
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Deduplicated bill reminders and keyset paging of notifications
+-- Status: Enhancement
+-- Note: Standalone version in 17_notifications.sql for existing databases
+-- ============================================
+
+-- Dedupes reminders: a bill is reminded about once, however often (or
+-- from however many processes) the reminder job runs
+CREATE UNIQUE INDEX IF NOT EXISTS idx_notifications_bill_reminder
+    ON notifications(related_bill_id)
+    WHERE type = 'bill_reminder';
+
+-- Newest-first pages per user: ORDER BY created_at DESC, notification_id DESC
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created
+    ON notifications(user_id, created_at DESC, notification_id DESC);
+
+-- ============================================
+-- SECTION 13: CHANGE EVENTS
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: LISTEN/NOTIFY triggers feeding the Server-Sent Events stream
+-- Status: Enhancement
+-- Note: Standalone version in 18_change_events.sql for existing databases
+-- ============================================
+
+-- NOTIFY billscanner_changes once per user per statement, with
+--   {"table": ..., "op": "insert|update|delete", "user_id": ...,
+--    "count": <rows>, "ids": [<row ids>] (null above 20 rows)}
+-- Statement-level, so a bulk insert (batch upload, recurring bills)
+-- sends one notification per user rather than one per row; payloads
+-- stay far below the 8000-byte NOTIFY limit. Notifications are only
+-- delivered when the transaction commits. TG_ARGV[0] is the id column.
+CREATE OR REPLACE FUNCTION notify_user_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    EXECUTE format(
+        'SELECT pg_notify(''billscanner_changes'', json_build_object('
+        '    ''table'', %L, ''op'', %L, ''user_id'', user_id, ''count'', COUNT(*),'
+        '    ''ids'', CASE WHEN COUNT(*) <= 20 THEN json_agg(%I) END)::text)'
+        ' FROM %I WHERE user_id IS NOT NULL GROUP BY user_id',
+        TG_TABLE_NAME, lower(TG_OP), TG_ARGV[0],
+        CASE WHEN TG_OP = 'DELETE' THEN 'old_rows' ELSE 'new_rows' END
+    );
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS bills_notify_insert ON bills;
+CREATE TRIGGER bills_notify_insert AFTER INSERT ON bills
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('bill_id');
+
+DROP TRIGGER IF EXISTS bills_notify_update ON bills;
+CREATE TRIGGER bills_notify_update AFTER UPDATE ON bills
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('bill_id');
+
+DROP TRIGGER IF EXISTS bills_notify_delete ON bills;
+CREATE TRIGGER bills_notify_delete AFTER DELETE ON bills
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('bill_id');
+
+DROP TRIGGER IF EXISTS notifications_notify_insert ON notifications;
+CREATE TRIGGER notifications_notify_insert AFTER INSERT ON notifications
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('notification_id');
+
+DROP TRIGGER IF EXISTS notifications_notify_update ON notifications;
+CREATE TRIGGER notifications_notify_update AFTER UPDATE ON notifications
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('notification_id');
+
+DROP TRIGGER IF EXISTS notifications_notify_delete ON notifications;
+CREATE TRIGGER notifications_notify_delete AFTER DELETE ON notifications
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('notification_id');
+
+DROP TRIGGER IF EXISTS user_settings_notify_insert ON user_settings;
+CREATE TRIGGER user_settings_notify_insert AFTER INSERT ON user_settings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('setting_id');
+
+DROP TRIGGER IF EXISTS user_settings_notify_update ON user_settings;
+CREATE TRIGGER user_settings_notify_update AFTER UPDATE ON user_settings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_changes('setting_id');
+
+-- ============================================
+-- SECTION 14: EXCHANGE RATES
+-- ============================================
+-- Date: 2026-10-18
+-- Reason: Daily exchange rates for converting bills to the user's currency
+-- Status: Enhancement
+-- Note: Standalone version in 19_fx_rates.sql for existing databases
+-- ============================================
+
+-- Loaded from a CSV file with `python fx.py load <file>`; the API servers
+-- keep the table in memory (see backend/fx.py). One row per currency pair
+-- per day that a rate was published: a rate applies from its rate_date
+-- until the next one, for up to FX_MAX_AGE_DAYS.
+-- rate = units of quote_currency per 1 base_currency.
+
+CREATE TABLE IF NOT EXISTS fx_rates (
+    base_currency VARCHAR(10) NOT NULL,
+    quote_currency VARCHAR(10) NOT NULL,
+    rate_date DATE NOT NULL,
+    rate NUMERIC(20, 10) NOT NULL CHECK (rate > 0),
+    loaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (base_currency, quote_currency, rate_date)
+);
+
+COMMENT ON TABLE fx_rates IS 'Daily exchange rates: rate = quote_currency per 1 base_currency';
+
 -- ============================================
 -- TEMPLATE FOR FUTURE ADDITIONS
 -- ============================================